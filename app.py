@@ -1,17 +1,129 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+# Las variables del .env se cargan antes de importar los módulos que leen su configuración del entorno
+load_dotenv()
+
 from fastapi import FastAPI
 
+from config.db import cerrar_cliente
 from routes.resumen import resumen
 from routes.cobros import cobros
 from routes.graficos import graficos
+from routes.tendencias import tendencias
+from routes.cadena import cadena
+from routes.exportar import exportar
+from routes.estado import estado
+from services.metricas import METRICAS, MiddlewareMetricas
+from services.perfilado import DEPURACION_TOKEN, MiddlewarePerfil
+from services.precalentamiento import precalentamiento
+from services.repositorio import MOTOR_DATOS, activar, crear_repositorio
+from services.rollups import ROLLUPS_AL_INICIAR, construir_rollups
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tarea_indices = None
+    tarea_rollups = None
+
+    if MOTOR_DATOS != "mongo":
+        # Sin cluster: las rutas responden desde un snapshot, un fixture en memoria o mongomock
+        activar(await crear_repositorio(MOTOR_DATOS))
+    else:
+        # El cliente de MongoDB (y su pool) lo abre el precalentamiento, sin bloquear el inicio
+        # del worker; services.indices importa pymongo, por eso se importa recién acá
+        from services.indices import INDICES_AL_INICIAR, asegurar_indices
+
+        # Opcionalmente creamos en segundo plano los índices y los rollups mensuales que falten
+        if INDICES_AL_INICIAR:
+            tarea_indices = asyncio.create_task(asegurar_indices())
+
+        if ROLLUPS_AL_INICIAR:
+            tarea_rollups = asyncio.create_task(construir_rollups(solo_faltantes=True))
+
+    # Precalentamiento en segundo plano: el worker atiende desde ya, pero /estado/listo responde 503 hasta que termina
+    tarea_precalentamiento = asyncio.create_task(precalentamiento.ejecutar())
+
+    yield
+
+    for tarea in (tarea_indices, tarea_rollups, tarea_precalentamiento):
+        if tarea is not None:
+            tarea.cancel()
+    cerrar_cliente()
 
 
 app = FastAPI(
         title="API Rest con Python y MongoDB",
         description="El objetivo es construir una API que sirva de backend de una plataforma web de gestión de una cadena de negocios.",
         version="0.0.1",
+        lifespan=lifespan,
 )
 
     
+# Perfiles de depuración (/depuracion/*): solo con DEPURACION_TOKEN definido
+if DEPURACION_TOKEN:
+    app.add_middleware(MiddlewarePerfil)
+
+# Server-Timing, log por petición e histogramas de /metrics
+if METRICAS:
+    app.add_middleware(MiddlewareMetricas)
+
 app.include_router(resumen)
 app.include_router(cobros)
-app.include_router(graficos)
\ No newline at end of file
+app.include_router(graficos)
+app.include_router(tendencias)
+app.include_router(cadena)
+app.include_router(exportar)
+app.include_router(estado)
+
+if DEPURACION_TOKEN:
+    from routes.depuracion import depuracion
+    app.include_router(depuracion)
+
+# Presupuesto del tiempo de importación de este módulo (lo que tarda un worker nuevo antes del lifespan)
+PRESUPUESTO_IMPORTACION_MS = float(os.getenv('PRESUPUESTO_IMPORTACION_MS', 600))
+
+def medir_importacion(repeticiones=3):
+    # Milisegundos que tarda `import app` en un intérprete nuevo (el mejor de varios intentos)
+    codigo = "import time; inicio = time.perf_counter(); import app; print((time.perf_counter() - inicio) * 1000)"
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    return min(
+        float(subprocess.run([sys.executable, "-c", codigo], cwd=directorio, capture_output=True, text=True, check=True).stdout)
+        for _ in range(repeticiones)
+    )
+
+async def verificar():
+    # Arranque sin cluster: arma el esquema OpenAPI y corre el lifespan con el repositorio configurado.
+    # Con MOTOR_DATOS=mongo no se conecta: el cliente lo crearía el precalentamiento, que no llega a correr.
+    errores = []
+    importacion_ms = medir_importacion()
+    if importacion_ms > PRESUPUESTO_IMPORTACION_MS:
+        errores.append(f"importar app tarda {importacion_ms:.0f} ms (presupuesto {PRESUPUESTO_IMPORTACION_MS:.0f} ms)")
+
+    rutas = len(app.openapi()["paths"])
+    async with app.router.lifespan_context(app):
+        pass
+
+    print(json.dumps({
+        "motor_datos": MOTOR_DATOS,
+        "rutas": rutas,
+        "importacion_ms": round(importacion_ms, 1),
+        "presupuesto_importacion_ms": PRESUPUESTO_IMPORTACION_MS,
+        "errores": errores,
+    }, ensure_ascii=False, indent=2))
+    return 1 if errores else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API de la cadena de negocios (se sirve con uvicorn app:app)")
+    parser.add_argument("--check", action="store_true", help="Verifica que la app inicie sin un cluster y que su importación entre en el presupuesto")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(asyncio.run(verificar()))
+    parser.print_help()
\ No newline at end of file
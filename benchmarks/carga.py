@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import psutil
+from bson import ObjectId
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config.db
+from app import app
+from services import repositorio
+from services.cache_respuestas import cache_respuestas
+from services.indices import asegurar_indices
+from services.metricas import logger as logger_peticiones
+from services.memoria import RepositorioMemoria
+from services.meses import FECHA_CORTE_DATOS, meses_entre
+
+# Prueba de carga de todas las rutas de app.py sobre datos sintéticos. Siembra negocios, planes,
+# clientes con historial y boletas en memoria, en mongomock o en un mongod local, y pide cada
+# ruta con varias peticiones concurrentes dentro del mismo proceso (como un worker de uvicorn).
+# Informa latencias p50/p95/p99, peticiones por segundo, comandos enviados a MongoDB por
+# petición y la memoria residente, y puede fallar si empeora respecto de una base guardada.
+# Los comandos se cuentan con un listener del driver, así que solo se miden con --destino mongo:
+# la memoria no los envía y mongomock no pasa por pymongo.
+
+PLANES = [("Mensual", "Local"), ("Anual", "Plus"), ("Mensual", "Total"), ("Anual", "Local")]
+FUENTES = ["checkout", "checkout3", "checkout_miclub", "recurring_charges", "recurring_miclub"]
+PRIMERA_FECHA = datetime(2022, 7, 1)
+MESES = meses_entre("07-2022", "05-2023")
+LOTE_SIEMBRA = 10000
+
+class ContadorComandos(monitoring.CommandListener):
+    # Comandos enviados al servidor (find, aggregate, getMore...): cada uno es una ida y vuelta
+
+    def __init__(self):
+        self.comandos = 0
+
+    def started(self, event):
+        self.comandos += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def fecha_al_azar(azar, desde=PRIMERA_FECHA, hasta=FECHA_CORTE_DATOS):
+    return desde + timedelta(seconds=azar.randint(0, int((hasta - desde).total_seconds()) - 1))
+
+def generar_negocios(cantidad):
+    merchants = []
+    planes = []
+    for numero in range(cantidad):
+        merchant_id = ObjectId()
+        merchants.append({"_id": merchant_id, "name": f"Negocio {numero:04d}"})
+        for indice, (cobro, nivel) in enumerate(PLANES):
+            planes.append({
+                "_id": ObjectId(),
+                "merchant_id": merchant_id,
+                "cobro": cobro,
+                "nivel_de_acceso": nivel,
+                "sede_local": f"sede_{numero}_{indice}" if indice % 2 else "",  # Alias que usan algunas boletas
+            })
+    return merchants, planes
+
+def generar_clientes(cantidad, planes, azar):
+    for _ in range(cantidad):
+        plan = azar.choice(planes)["_id"]
+        alta = fecha_al_azar(azar, desde=datetime(2022, 1, 1))
+        historial = [{"event": "alta", "date_created": alta, "plan": plan}]
+
+        sorteo = azar.random()
+        if sorteo < 0.3:
+            historial.append({"event": "baja", "date_created": fecha_al_azar(azar, desde=alta), "plan": plan})
+        elif sorteo < 0.55:
+            historial.append({"event": "inactivacion", "date_created": fecha_al_azar(azar, desde=alta), "plan": plan})
+
+        yield {"_id": ObjectId(), "history": historial}
+
+def generar_boletas(cantidad, planes, azar):
+    for _ in range(cantidad):
+        plan = azar.choice(planes)
+        fecha = fecha_al_azar(azar)
+        yield {
+            "_id": ObjectId(),
+            "merchant_id": plan["merchant_id"],
+            "plan_id": (plan["sede_local"] or plan["_id"]) if azar.random() < 0.2 else plan["_id"],
+            "status": "approved" if azar.random() < 0.85 else "rejected",
+            "source": azar.choice(FUENTES),
+            "date_created": fecha,
+            "original_payment_date": fecha + timedelta(days=azar.randint(-3, 3)),
+            "charges_detail": {"final_price": azar.randint(1000, 30000)},
+        }
+
+def en_lotes(documentos):
+    lote = []
+    for documento in documentos:
+        lote.append(documento)
+        if len(lote) == LOTE_SIEMBRA:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+async def sembrar(db, merchants, planes, clientes, boletas):
+    # Reemplaza las colecciones por los datos sintéticos, de a lotes
+    for coleccion, documentos in (("merchants", merchants), ("planes", planes), ("clientes", clientes), ("boletas", boletas)):
+        await db[coleccion].drop()
+        for lote in en_lotes(documentos):
+            await db[coleccion].insert_many(lote)
+
+async def preparar_destino(args, contador):
+    azar = random.Random(args.semilla)
+    merchants, planes = generar_negocios(args.negocios)
+    clientes = generar_clientes(args.clientes or args.boletas // 5, planes, azar)
+    boletas = generar_boletas(args.boletas, planes, azar)
+
+    if args.destino == "memoria":
+        repositorio.activar(RepositorioMemoria(merchants, planes, clientes, boletas))
+
+    elif args.destino == "mongomock":
+        from mongomock_motor import AsyncMongoMockClient
+
+        db = AsyncMongoMockClient().challenge_set
+        await sembrar(db, merchants, planes, clientes, boletas)
+        repositorio.activar(repositorio.RepositorioMongo(db=db, cobros_por_dia="cursor"))  # mongomock no tiene $dateTrunc
+
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        # Cliente propio hacia el mongod local, con el contador de comandos además del monitor del pool
+        oyente_pool = config.db.como_oyente(config.db.monitor_pool, monitoring.ConnectionPoolListener)
+        config.db.client = AsyncIOMotorClient(args.mongo_uri, event_listeners=[oyente_pool, contador])
+        if args.sembrar:
+            await sembrar(config.db.obtener_db(), merchants, planes, clientes, boletas)
+            await asegurar_indices()
+        repositorio.activar(repositorio.RepositorioMongo())
+
+    return [merchant["name"] for merchant in merchants]
+
+def plantillas(negocios, usa_mongo):
+    # Ruta de app.py -> función que arma una URL al azar para esa ruta
+    def negocio(azar):
+        return azar.choice(negocios)
+
+    def mes(azar):
+        return azar.choice(MESES)
+
+    def rango(azar, largo):
+        indice = azar.randrange(len(MESES) - largo + 1)
+        return MESES[indice], MESES[indice + largo - 1]
+
+    def varios(azar):
+        return "&".join(f"negocios={nombre}" for nombre in azar.sample(negocios, min(5, len(negocios))))
+
+    rutas = {
+        "/resumen_mes/{negocio}/{mes_anio}": lambda azar: f"/resumen_mes/{negocio(azar)}/{mes(azar)}",
+        "/cobros/{negocio}/{mes_anio}": lambda azar: f"/cobros/{negocio(azar)}/{mes(azar)}",
+        "/cobros_resumen/{negocio}/{mes_anio}": lambda azar: f"/cobros_resumen/{negocio(azar)}/{mes(azar)}",
+        "/porcentaje_cobro/{negocio}/{mes_anio}": lambda azar: f"/porcentaje_cobro/{negocio(azar)}/{mes(azar)}",
+        "/resumen_rango/{negocio}": lambda azar: "/resumen_rango/{}?desde={}&hasta={}".format(negocio(azar), *rango(azar, 6)),
+        "/estado/pool": lambda azar: "/estado/pool",
+        "/estado/cache": lambda azar: "/estado/cache",
+    }
+    if usa_mongo:
+        # /cadena y /exportar consultan MongoDB directamente: con el destino en memoria responden 503
+        rutas.update({
+            "/cadena/resumen_mes/{mes_anio}": lambda azar: f"/cadena/resumen_mes/{mes(azar)}?{varios(azar)}",
+            "/cadena/cobros_resumen/{mes_anio}": lambda azar: f"/cadena/cobros_resumen/{mes(azar)}?{varios(azar)}",
+            "/cadena/porcentaje_cobro/{mes_anio}": lambda azar: f"/cadena/porcentaje_cobro/{mes(azar)}?{varios(azar)}",
+            "/exportar/boletas/{negocio}": lambda azar: "/exportar/boletas/{}?desde={}&hasta={}".format(negocio(azar), *rango(azar, 1)),
+            "/exportar/cobros_por_dia/{negocio}": lambda azar: "/exportar/cobros_por_dia/{}?desde={}&hasta={}".format(negocio(azar), *rango(azar, 3)),
+        })
+    return rutas
+
+def percentil(ordenadas, p):
+    # Percentil por rango más cercano
+    return ordenadas[max(0, math.ceil(p / 100 * len(ordenadas)) - 1)]
+
+def rss_mib():
+    return psutil.Process().memory_info().rss / 2**20
+
+async def medir_ruta(cliente, armar_url, peticiones, concurrencia, contador, azar):
+    urls = [armar_url(azar) for _ in range(peticiones)]
+    latencias = []
+    errores = 0
+
+    async def trabajador():
+        nonlocal errores
+        while urls:
+            url = urls.pop()
+            inicio = time.perf_counter()
+            respuesta = await cliente.get(url)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            if respuesta.status_code >= 500:
+                errores += 1
+
+    comandos = contador.comandos if contador is not None else 0
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "p50_ms": round(percentil(latencias, 50), 3),
+        "p95_ms": round(percentil(latencias, 95), 3),
+        "p99_ms": round(percentil(latencias, 99), 3),
+        "peticiones_por_segundo": round(peticiones / duracion, 1),
+        "comandos_por_peticion": round((contador.comandos - comandos) / peticiones, 2) if contador is not None else None,
+        "errores": errores,
+        "rss_mib": round(rss_mib(), 1),
+    }
+
+def formatear_comandos(comandos_por_peticion):
+    return "-" if comandos_por_peticion is None else f"{comandos_por_peticion:.2f}"
+
+def comparar(resultado, base, tolerancia):
+    # Regresiones respecto de la base: latencia p95, throughput, comandos por petición y memoria
+    problemas = []
+    for ruta, medido in resultado["rutas"].items():
+        anterior = base["rutas"].get(ruta)
+        if anterior is None:
+            continue
+        if medido["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia):
+            problemas.append(f"{ruta}: p95 {medido['p95_ms']} ms (base {anterior['p95_ms']} ms)")
+        if medido["peticiones_por_segundo"] < anterior["peticiones_por_segundo"] * (1 - tolerancia):
+            problemas.append(f"{ruta}: {medido['peticiones_por_segundo']} pet/s (base {anterior['peticiones_por_segundo']} pet/s)")
+        # Sin medición de comandos (destino memoria o mongomock) no hay contra qué comparar
+        if None not in (medido["comandos_por_peticion"], anterior["comandos_por_peticion"]) and \
+                medido["comandos_por_peticion"] > anterior["comandos_por_peticion"] + 0.01:
+            problemas.append(f"{ruta}: {medido['comandos_por_peticion']} comandos/petición (base {anterior['comandos_por_peticion']})")
+        if medido["errores"] > anterior["errores"]:
+            problemas.append(f"{ruta}: {medido['errores']} errores (base {anterior['errores']})")
+
+    if resultado["rss_max_mib"] > base["rss_max_mib"] * (1 + tolerancia):
+        problemas.append(f"RSS máximo {resultado['rss_max_mib']} MiB (base {base['rss_max_mib']} MiB)")
+
+    return problemas
+
+async def ejecutar(args):
+    contador = ContadorComandos() if args.destino == "mongo" else None
+
+    inicio = time.perf_counter()
+    negocios = await preparar_destino(args, contador)
+    print(f"destino {args.destino}: {args.boletas} boletas sembradas en {time.perf_counter() - inicio:.1f} s, RSS {rss_mib():.0f} MiB")
+    if contador is None:
+        print(f"destino {args.destino}: no se cuentan comandos por petición (solo con --destino mongo) ni se comparan con la base")
+
+    logger_peticiones.disabled = True  # Sin una línea de log por petición durante la carga
+
+    if not args.con_cache:
+        cache_respuestas.backend = None  # Se mide el cálculo de cada respuesta, no el caché
+
+    rutas = plantillas(negocios, args.destino != "memoria")
+    sin_medir = sorted({ruta.path for ruta in app.routes if isinstance(ruta, APIRoute)} - set(rutas))
+    if sin_medir:
+        print("rutas sin medir:", ", ".join(sin_medir))
+
+    azar = random.Random(args.semilla)
+    resultado = {
+        "configuracion": {
+            "destino": args.destino, "boletas": args.boletas, "negocios": args.negocios,
+            "peticiones": args.peticiones, "concurrencia": args.concurrencia,
+        },
+        "rutas": {},
+    }
+
+    print(f"{'ruta':<40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'pet/s':>8} {'cmd/pet':>8} {'err':>4} {'RSS MiB':>8}")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://carga", timeout=None) as cliente:
+        for ruta, armar_url in rutas.items():
+            # Calentamiento: carga el catálogo y las conexiones sin contar en las latencias
+            await medir_ruta(cliente, armar_url, args.concurrencia, args.concurrencia, contador, azar)
+
+            medido = await medir_ruta(cliente, armar_url, args.peticiones, args.concurrencia, contador, azar)
+            resultado["rutas"][ruta] = medido
+            print(
+                f"{ruta:<40} {medido['p50_ms']:>9.2f} {medido['p95_ms']:>9.2f} {medido['p99_ms']:>9.2f} "
+                f"{medido['peticiones_por_segundo']:>8.1f} {formatear_comandos(medido['comandos_por_peticion']):>8} "
+                f"{medido['errores']:>4} {medido['rss_mib']:>8.1f}"
+            )
+
+    resultado["rss_max_mib"] = max(medido["rss_mib"] for medido in resultado["rutas"].values())
+    config.db.cerrar_cliente()
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de las rutas de la API sobre datos sintéticos")
+    parser.add_argument("--destino", choices=["memoria", "mongomock", "mongo"], default="memoria")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017", help="mongod local (destino mongo)")
+    parser.add_argument("--sembrar", action="store_true", help="Reemplaza las colecciones del mongod local por los datos sintéticos")
+    parser.add_argument("--boletas", type=int, default=10000, help="Cantidad de boletas (por ejemplo de 10000 a 10000000)")
+    parser.add_argument("--negocios", type=int, default=20)
+    parser.add_argument("--clientes", type=int, default=0, help="Cantidad de clientes (por defecto, boletas / 5)")
+    parser.add_argument("--peticiones", type=int, default=200, help="Peticiones medidas por ruta")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--con-cache", action="store_true", help="Deja activo el caché de respuestas")
+    parser.add_argument("--guardar-base", help="Guarda el resultado como base en este archivo JSON")
+    parser.add_argument("--comparar", help="Falla si hay regresiones respecto de esta base")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Empeoramiento admitido respecto de la base (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    if args.destino == "mongo" and not args.sembrar:
+        print("destino mongo sin --sembrar: se usan los datos que ya tenga el mongod (de una siembra anterior)")
+
+    resultado = asyncio.run(ejecutar(args))
+
+    if args.guardar_base:
+        with open(args.guardar_base, "w", encoding="utf-8") as archivo:
+            json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            base = json.load(archivo)
+        if base["configuracion"] != resultado["configuracion"]:
+            print("aviso: la base se midió con otra configuración:", base["configuracion"])
+
+        problemas = comparar(resultado, base, args.tolerancia)
+        for problema in problemas:
+            print("REGRESIÓN", problema)
+        if problemas:
+            sys.exit(1)
+        print("sin regresiones respecto de", args.comparar)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.db import cerrar_cliente
+from routes.cobros import obtener_datos_cobros_mes_negocio
+from routes.graficos import calcular_porcentaje_cobro
+from routes.resumen import calcular_resumen_mes
+from services import repositorio
+from services.columnar import MotorColumnar
+from services.memoria import RepositorioMemoria
+
+# Compara el tiempo de los cálculos de /resumen_mes, /cobros y /porcentaje_cobro contra MongoDB
+# y contra los repositorios que leen un snapshot (services/snapshot.py): columnar y en memoria
+
+MOTORES = {
+    "columnar": MotorColumnar,
+    "memoria": RepositorioMemoria.desde_snapshot,
+}
+
+def calculos(negocio, mes_anio):
+    return {
+        "resumen_mes": lambda: calcular_resumen_mes(negocio, mes_anio),
+        "cobros": lambda: obtener_datos_cobros_mes_negocio(mes_anio, negocio),
+        "porcentaje_cobro": lambda: calcular_porcentaje_cobro(negocio, mes_anio),
+    }
+
+async def medir(motor, negocio, mes_anio, repeticiones):
+    resultados = {}
+    for nombre, calcular in calculos(negocio, mes_anio).items():
+        resultado = await calcular()  # La primera vuelta carga el catálogo y no se mide
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            await calcular()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        tiempos.sort()
+        print(
+            f"{motor:<9} {nombre:<17} p50 {statistics.median(tiempos):>8.2f} ms  "
+            f"p95 {tiempos[int(len(tiempos) * 0.95) - 1]:>8.2f} ms"
+        )
+        resultados[nombre] = resultado
+    return resultados
+
+async def ejecutar(args):
+    mongo = None
+    if args.mongo:
+        try:
+            mongo = await medir("mongo", args.negocio, args.mes, args.repeticiones)
+        finally:
+            cerrar_cliente()
+
+    for motor in args.motores:
+        inicio = time.perf_counter()
+        repositorio.activar(MOTORES[motor](args.snapshot))
+        print(f"{motor}: snapshot cargado en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+        resultados = await medir(motor, args.negocio, args.mes, args.repeticiones)
+
+        if mongo is not None:
+            for nombre, resultado in resultados.items():
+                print(f"{nombre:<17} {'coincide' if resultado == mongo[nombre] else 'NO COINCIDE'} con MongoDB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los repositorios sobre un snapshot contra MongoDB")
+    parser.add_argument("--snapshot", default=repositorio.SNAPSHOT_RUTA)
+    parser.add_argument("--motores", nargs="+", choices=list(MOTORES), default=["columnar"])
+    parser.add_argument("--negocio", required=True)
+    parser.add_argument("--mes", required=True, help="Mes a calcular (MM-YYYY)")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--mongo", action="store_true", help="También mide (y compara) contra MongoDB")
+    args = parser.parse_args()
+
+    asyncio.run(ejecutar(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.lectura_boletas import LECTURA_BATCH_SIZE, AcumuladorPorIndice, leer_lotes, monto_de
+
+# Compara las formas de leer boletas desde un cursor para armar los cobros por día
+# (COBROS_POR_DIA=cursor). Las respuestas del servidor se simulan con lotes de BSON ya
+# codificados: se mide solo lo que hace la API (decodificar y acumular), no la red ni MongoDB.
+# La columna de MiB BSON estima lo que viaja por la red con y sin proyección.
+
+CAMPOS = ["source", "date_created", "original_payment_date", "charges_detail.final_price"]
+FUENTES = ["checkout", "checkout3", "checkout_miclub", "recurring_charges", "recurring_miclub"]
+
+def generar_boletas(cantidad):
+    random.seed(1)
+    inicio = datetime(2023, 5, 1)
+    for i in range(cantidad):
+        fecha = inicio + timedelta(seconds=random.randint(0, 30 * 86400))
+        yield {
+            "_id": bson.ObjectId(),
+            "merchant_id": bson.ObjectId(),
+            "plan_id": bson.ObjectId(),
+            "status": "approved",
+            "source": random.choice(FUENTES),
+            "date_created": fecha,
+            "original_payment_date": fecha,
+            "payment_method": "credit_card",
+            "payer": {"email": f"socio{i}@example.com", "document": str(30000000 + i)},
+            "charges_detail": {"final_price": random.randint(1000, 20000), "taxes": 0, "discounts": []},
+        }
+
+def proyectar(boleta):
+    return {
+        "source": boleta["source"],
+        "date_created": boleta["date_created"],
+        "original_payment_date": boleta["original_payment_date"],
+        "charges_detail": {"final_price": boleta["charges_detail"]["final_price"]},
+    }
+
+def codificar_lotes(boletas, batch_size):
+    # Un bloque de bytes por lote, como los devuelve el servidor en cada getMore
+    lotes = []
+    lote = []
+    for boleta in boletas:
+        lote.append(bson.encode(boleta))
+        if len(lote) == batch_size:
+            lotes.append(b"".join(lote))
+            lote = []
+    if lote:
+        lotes.append(b"".join(lote))
+    return lotes
+
+class CursorSimulado:
+    # Imita un cursor de Motor sobre lotes de BSON: to_list() decodifica un lote por llamada
+
+    def __init__(self, lotes, codec_options):
+        self.lotes = iter(lotes)
+        self.codec_options = codec_options
+
+    async def to_list(self, length):
+        lote = next(self.lotes, None)
+        return bson.decode_all(lote, self.codec_options) if lote is not None else []
+
+    async def __aiter__(self):
+        for lote in self.lotes:
+            for documento in bson.decode_all(lote, self.codec_options):
+                yield documento
+
+def indice_dia(boleta, fuentes_altas):
+    if boleta["source"] in fuentes_altas:
+        return boleta["date_created"].day - 1
+    return 31 + boleta["original_payment_date"].day - 1
+
+async def por_documento(lotes):
+    # Como se hacía antes con find(): un documento por iteración y sumas en un dict por día
+    fuentes_altas = set(FUENTES[:3])
+    dias = {}
+    async for boleta in CursorSimulado(lotes, CodecOptions()):
+        indice = indice_dia(boleta, fuentes_altas)
+        dias[indice] = dias.get(indice, 0) + boleta["charges_detail"]["final_price"]
+    return dias
+
+async def por_lotes(lotes, codec_options):
+    # Como cobros_por_dia_con_cursor: lotes con to_list() y un bucle que suma en cada índice
+    fuentes_altas = set(FUENTES[:3])
+
+    def indice_de(boleta):
+        if boleta.get("source") in fuentes_altas:
+            return boleta["date_created"].day - 1
+        return 31 + boleta["original_payment_date"].day - 1
+
+    acumulador = AcumuladorPorIndice(62)
+    async for lote in leer_lotes(CursorSimulado(lotes, codec_options)):
+        acumulador.sumar(lote, indice_de)
+    return acumulador.totales
+
+async def por_lotes_numpy(lotes, np):
+    # Alternativa descartada: listas de índices y montos por lote, sumadas con np.bincount en
+    # acumuladores de numpy. Los documentos ya llegan como dict, así que armar las listas cuesta
+    # lo mismo que sumar en el bucle.
+    fuentes_altas = set(FUENTES[:3])
+    totales = np.zeros(62, dtype=np.int64)
+    async for lote in leer_lotes(CursorSimulado(lotes, CodecOptions())):
+        indices = np.fromiter((indice_dia(boleta, fuentes_altas) for boleta in lote), dtype=np.intp, count=len(lote))
+        montos = np.fromiter((monto_de(boleta) for boleta in lote), dtype=np.int64, count=len(lote))
+        totales += np.bincount(indices, weights=montos, minlength=62).astype(np.int64)
+    return totales.tolist()
+
+def medir(nombre, crear_corutina, cantidad, bytes_leidos):
+    # Tiempo y memoria se miden en pasadas separadas: tracemalloc hace más lento todo lo que mide
+    inicio = time.perf_counter()
+    asyncio.run(crear_corutina())
+    segundos = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    asyncio.run(crear_corutina())
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    por_millon = 1_000_000 / cantidad
+    print(
+        f"{nombre:<40} {segundos * por_millon:>7.2f} s/millón  "
+        f"{pico / 2**20:>7.1f} MiB pico  "
+        f"{bytes_leidos * por_millon / 2**20:>7.1f} MiB BSON/millón"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de lectura de boletas para los cobros por día")
+    parser.add_argument("--boletas", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=LECTURA_BATCH_SIZE)
+    args = parser.parse_args()
+
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    print(f"Generando {args.boletas} boletas (numpy: {'sí' if numpy is not None else 'no'})...")
+    completas = list(generar_boletas(args.boletas))
+    lotes_completos = codificar_lotes(completas, args.batch_size)
+    lotes_proyectados = codificar_lotes((proyectar(boleta) for boleta in completas), args.batch_size)
+    del completas
+
+    bytes_completos = sum(len(lote) for lote in lotes_completos)
+    bytes_proyectados = sum(len(lote) for lote in lotes_proyectados)
+
+    medir("documento completo, de a uno", lambda: por_documento(lotes_completos), args.boletas, bytes_completos)
+    medir("proyección, de a uno", lambda: por_documento(lotes_proyectados), args.boletas, bytes_proyectados)
+    medir("proyección, por lotes", lambda: por_lotes(lotes_proyectados, CodecOptions()), args.boletas, bytes_proyectados)
+    medir(
+        "proyección, por lotes, RawBSONDocument",
+        lambda: por_lotes(lotes_proyectados, CodecOptions(document_class=RawBSONDocument)),
+        args.boletas, bytes_proyectados
+    )
+    if numpy is not None:
+        medir("proyección, por lotes, numpy", lambda: por_lotes_numpy(lotes_proyectados, numpy), args.boletas, bytes_proyectados)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,162 @@
-from pymongo import MongoClient
-
-from dotenv import load_dotenv
 import os
+import threading
+
+# Importar este módulo no importa pymongo ni Motor ni lee el .env: todo eso ocurre al crear el
+# cliente, así la app puede iniciar (o verificarse con python app.py --check) sin un cluster
+
+def cadena_conexion():
+    # Configuramos la cadena de conexión con las credenciales reales:
+    from dotenv import load_dotenv
+    load_dotenv()  # No pisa las variables que ya están en el entorno
+
+    user_name = os.getenv('USER')
+    password = os.getenv('PASSWORD')
+    cluster_url = os.getenv('CLUSTER_URL')
+
+    return f"mongodb+srv://{user_name}:{password}@{cluster_url}"
+
+# Configuración del pool de conexiones (por worker de uvicorn)
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 0)) or None  # 0: sin límite
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000))
+MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', 'primary')
+MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS', '')  # por ejemplo: "zstd,snappy,zlib"
+
+# Registra el uso del pool de conexiones a partir de los eventos de pymongo.
+# Los eventos llegan desde los hilos del driver, por eso los contadores usan un lock.
+class MonitorPool:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conexiones_abiertas = 0
+        self.conexiones_en_uso = 0
+        self.max_conexiones_en_uso = 0
+        self.conexiones_creadas = 0
+        self.checkouts = 0
+        self.checkouts_fallidos = 0
+        self.checkouts_timeout = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self.lock:
+            self.conexiones_abiertas += 1
+            self.conexiones_creadas += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.conexiones_abiertas -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        from pymongo import monitoring
+        with self.lock:
+            self.checkouts_fallidos += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkouts_timeout += 1
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            self.checkouts += 1
+            self.conexiones_en_uso += 1
+            self.max_conexiones_en_uso = max(self.max_conexiones_en_uso, self.conexiones_en_uso)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.conexiones_en_uso -= 1
+
+    def estadisticas(self):
+        with self.lock:
+            return {
+                "conexiones_abiertas": self.conexiones_abiertas,
+                "conexiones_en_uso": self.conexiones_en_uso,
+                "max_conexiones_en_uso": self.max_conexiones_en_uso,
+                "conexiones_creadas": self.conexiones_creadas,
+                "checkouts": self.checkouts,
+                "checkouts_fallidos": self.checkouts_fallidos,
+                "checkouts_timeout": self.checkouts_timeout,
+            }
+
+monitor_pool = MonitorPool()
+
+def como_oyente(monitor, clase):
+    # Listener de pymongo (subclase de `clase`, por ejemplo monitoring.CommandListener) que le pasa
+    # cada evento al método del mismo nombre de `monitor`. Los monitores no heredan de las clases
+    # de pymongo.monitoring para que importarlos no importe pymongo.
+    def reenviar(metodo):
+        return lambda self, event: metodo(event)
+
+    metodos = {nombre: reenviar(getattr(monitor, nombre)) for nombre in vars(clase) if not nombre.startswith("_")}
+    return type(clase.__name__, (clase,), metodos)()
+
+client = None
+lock_cliente = threading.Lock()
+
+def crear_cliente():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import monitoring
+
+    opciones = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+        "event_listeners": [como_oyente(monitor_pool, monitoring.ConnectionPoolListener)],
+    }
+
+    from services.metricas import METRICAS, monitor_comandos
+    if METRICAS:
+        # Comandos por petición (services/metricas.py)
+        opciones["event_listeners"].append(como_oyente(monitor_comandos, monitoring.CommandListener))
+    if MONGO_COMPRESSORS:
+        opciones["compressors"] = MONGO_COMPRESSORS
+
+    # Cliente asíncrono (Motor): las rutas hacen await de sus consultas. Con mongodb+srv la
+    # resolución SRV ocurre acá, por eso el precalentamiento crea el cliente en un hilo.
+    return AsyncIOMotorClient(cadena_conexion(), **opciones)
 
-load_dotenv()
+def obtener_cliente():
+    # El cliente se crea al primer uso: en la API, el precalentamiento del lifespan (services/precalentamiento.py)
+    global client
+    if client is None:
+        with lock_cliente:
+            if client is None:
+                client = crear_cliente()
+    return client
 
-# Configuramos la cadena de conexión con las credenciales reales:
-user_name = os.getenv('USER')
-password = os.getenv('PASSWORD')
-cluster_url = os.getenv('CLUSTER_URL')
+def obtener_db():
+    # Seleccionamos la base de datos:
+    return obtener_cliente().challenge_set
 
-connection_string = f"mongodb+srv://{user_name}:{password}@{cluster_url}"
-client = MongoClient(connection_string)
+def cerrar_cliente():
+    global client
+    if client is not None:
+        client.close()
+        client = None
 
-print(user_name)
\ No newline at end of file
+def configuracion_pool():
+    return {
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "min_pool_size": MONGO_MIN_POOL_SIZE,
+        "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "server_selection_timeout_ms": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "read_preference": MONGO_READ_PREFERENCE,
+        "compressors": MONGO_COMPRESSORS.split(",") if MONGO_COMPRESSORS else [],
+    }
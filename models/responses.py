@@ -38,4 +38,12 @@ class NivelAcceso(BaseModel):
     
 class GraficosResponse(BaseModel):
     porcentaje_cobrado_tipo_cobro: TipoCobro
-    porcentaje_cobrado_niveles_acceso: NivelAcceso
\ No newline at end of file
+    porcentaje_cobrado_niveles_acceso: NivelAcceso
+class ResumenRangoMes(BaseModel):
+    mes: str
+    resumen: ResumenMesResponse
+    cobros_resumen: CobrosResumenMesResponse
+
+class ResumenRangoResponse(BaseModel):
+    negocio: str
+    meses: List[ResumenRangoMes]
@@ -0,0 +1,191 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+import json
+from typing import Dict, List, Optional
+
+from models.responses import CobrosResumenMesResponse, GraficosResponse, ResumenMesResponse
+from routes.cobros import etapas_cobros_aprobados, formatear_cobros_resumen, resumir_cobros
+from routes.graficos import porcentajes_niveles_acceso, porcentajes_tipos_cobro
+from routes.resumen import acumuladores_movimientos, armar_resumen_mes, leer_movimientos
+from services.catalogo import catalogo, listar_nombres_negocios
+from services.meses import MesAnio, limites_meses
+from services.repositorio import db_mongo
+
+cadena = APIRouter()
+
+async def obtener_negocios(negocios):
+    # Metadatos de los negocios pedidos (por defecto, todos); los nombres inexistentes se ignoran.
+    # Estas rutas agregan directamente en MongoDB: sin él se responde 503 antes de empezar a transmitir
+    db = db_mongo()
+    nombres = negocios or await listar_nombres_negocios(db)
+    if len(nombres) <= catalogo.max_negocios:
+        metadatos = await catalogo.obtener_varios(nombres)  # Los que no están en caché se cargan juntos
+    else:
+        # Más negocios de los que entran en el catálogo: pasar por él desalojaría a todos los demás
+        # sin que ninguno quede, así que se cargan con una sola consulta sin guardarlos
+        metadatos = await catalogo.consultar(nombres)
+
+    encontrados = {negocio: datos for negocio, datos in metadatos.items() if datos}
+    if not encontrados:
+        raise HTTPException(status_code=404, detail="No se encontraron datos para los negocios especificados")
+
+    return encontrados
+
+async def transmitir_mapa(filas):
+    # Escribe un objeto JSON {negocio: datos} a medida que llegan las filas, sin armarlo entero en memoria
+    yield "{"
+    separador = ""
+    async for negocio, datos in filas:
+        yield f"{separador}{json.dumps(negocio, ensure_ascii=False)}:{json.dumps(datos, ensure_ascii=False)}"
+        separador = ","
+    yield "}"
+
+def respuesta_mapa(filas):
+    return StreamingResponse(transmitir_mapa(filas), media_type="application/json")
+
+async def filas_resumen_mes(metadatos_por_negocio, mes_anio):
+    db = db_mongo()
+
+    meses = [MesAnio.de(mes_anio).anterior, mes_anio]
+    nombres = {datos.merchant_id: negocio for negocio, datos in metadatos_por_negocio.items()}
+    planes_ids = [plan_id for datos in metadatos_por_negocio.values() for plan_id in datos.planes_ids]
+
+    # Cada cliente se cuenta una vez por cada negocio que tenga algún plan en su historial. Sus
+    # métricas (0 o 1 por mes) se evalúan una sola vez sobre el historial; después cada plan
+    # distinto del cliente se resuelve a su negocio con un $lookup por _id.
+    indicadores = {
+        campo: acumulador["$sum"]
+        for campo, acumulador in acumuladores_movimientos(meses).items()
+        if campo != "_id"
+    }
+    pipeline = [
+        {"$match": {"history.plan": {"$in": planes_ids}}},
+        {"$project": {**indicadores, "plan": {"$setUnion": ["$history.plan", []]}}},
+        {"$unwind": "$plan"},
+        {"$match": {"plan": {"$in": planes_ids}}},  # Sus planes pueden ser también de otros negocios
+        {"$lookup": {"from": "planes", "localField": "plan", "foreignField": "_id", "as": "plan"}},
+        {"$unwind": "$plan"},
+        # Un cliente con varios planes del mismo negocio cuenta una vez
+        {
+            "$group": {
+                "_id": {"cliente": "$_id", "merchant_id": "$plan.merchant_id"},
+                **{campo: {"$first": f"${campo}"} for campo in indicadores}
+            }
+        },
+        {"$group": {"_id": "$_id.merchant_id", **{campo: {"$sum": f"${campo}"} for campo in indicadores}}}
+    ]
+
+    async for fila in db.clientes.aggregate(pipeline):
+        movimientos = leer_movimientos(fila, meses)
+        yield nombres.pop(fila["_id"]), armar_resumen_mes(movimientos[meses[1]], movimientos[meses[0]])
+
+    # Negocios sin clientes en el período
+    for negocio in nombres.values():
+        movimientos = leer_movimientos({}, meses)
+        yield negocio, armar_resumen_mes(movimientos[meses[1]], movimientos[meses[0]])
+
+async def filas_cobros_resumen(metadatos_por_negocio, mes_anio):
+    db = db_mongo()
+
+    meses = [MesAnio.de(mes_anio).anterior, mes_anio]
+    fecha_inicio, fecha_fin = limites_meses(meses)
+    nombres = {datos.merchant_id: negocio for negocio, datos in metadatos_por_negocio.items()}
+
+    # Una sola agregación sobre las boletas de todos los negocios, con una fila por negocio
+    pipeline = etapas_cobros_aprobados({"$in": list(nombres)}, fecha_inicio, fecha_fin) + [
+        {
+            "$group": {
+                "_id": {
+                    "merchant_id": "$merchant_id",
+                    "tipo": "$tipo",
+                    "mes": {"$dateToString": {"format": "%m-%Y", "date": "$fecha"}}
+                },
+                "total": {"$sum": "$monto"}
+            }
+        },
+        {
+            "$group": {
+                "_id": "$_id.merchant_id",
+                "totales": {"$push": {"tipo": "$_id.tipo", "mes": "$_id.mes", "total": "$total"}}
+            }
+        }
+    ]
+
+    def resumen_negocio(totales):
+        por_mes = {mes: {"altas": 0, "recurrencias": 0} for mes in meses}
+        for total in totales:
+            por_mes[total["mes"]][total["tipo"]] = total["total"]
+        return formatear_cobros_resumen(resumir_cobros(por_mes[meses[1]], por_mes[meses[0]]))
+
+    async for fila in db.boletas.aggregate(pipeline):
+        yield nombres.pop(fila["_id"]), resumen_negocio(fila["totales"])
+
+    # Negocios sin cobros en el período
+    for negocio in nombres.values():
+        yield negocio, resumen_negocio([])
+
+async def filas_porcentaje_cobro(metadatos_por_negocio, mes_anio):
+    db = db_mongo()
+
+    fecha_inicio_mes, fecha_fin_mes = limites_meses([mes_anio])
+    metadatos_por_id = {datos.merchant_id: datos for datos in metadatos_por_negocio.values()}
+
+    # Una sola agregación suma lo cobrado por (negocio, plan); la clasificación por tipo de
+    # cobro y nivel de acceso se hace sobre esas pocas filas
+    pipeline = [
+        {
+            "$match": {
+                "merchant_id": {"$in": list(metadatos_por_id)},
+                "status": "approved",
+                "$or": [
+                    {"date_created": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes}},
+                    {"original_payment_date": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes}},
+                ],
+            }
+        },
+        {
+            "$group": {
+                "_id": {"merchant_id": "$merchant_id", "plan_id": "$plan_id"},
+                "total": {"$sum": "$charges_detail.final_price"}
+            }
+        },
+        {
+            "$group": {
+                "_id": "$_id.merchant_id",
+                "planes": {"$push": {"plan_id": "$_id.plan_id", "total": "$total"}}
+            }
+        }
+    ]
+
+    def porcentajes_negocio(datos, planes):
+        totales_por_plan = {plan["plan_id"]: plan["total"] for plan in planes}
+        return {
+            "Porcentaje de dinero cobrado por tipo de cobro": porcentajes_tipos_cobro(totales_por_plan, datos.clasificacion_planes),
+            "Porcentaje de dinero cobrado por niveles de acceso": porcentajes_niveles_acceso(totales_por_plan, datos.clasificacion_planes),
+        }
+
+    async for fila in db.boletas.aggregate(pipeline):
+        datos = metadatos_por_id.pop(fila["_id"])
+        yield datos.nombre, porcentajes_negocio(datos, fila["planes"])
+
+    # Negocios sin cobros en el período
+    for datos in metadatos_por_id.values():
+        yield datos.nombre, porcentajes_negocio(datos, [])
+
+# Rutas para la vista de toda la cadena: devuelven un objeto {negocio: datos} con los mismos
+# datos de la ruta de un negocio, para los negocios indicados en ?negocios= o para todos
+@cadena.get("/cadena/resumen_mes/{mes_anio}", response_model=Dict[str, ResumenMesResponse], tags=["Cadena de negocios"])
+async def cadena_resumen_mes(mes_anio: MesAnio, negocios: Optional[List[str]] = Query(None)):
+    metadatos_por_negocio = await obtener_negocios(negocios)
+    return respuesta_mapa(filas_resumen_mes(metadatos_por_negocio, mes_anio))
+
+@cadena.get("/cadena/cobros_resumen/{mes_anio}", response_model=Dict[str, CobrosResumenMesResponse], tags=["Cadena de negocios"])
+async def cadena_cobros_resumen(mes_anio: MesAnio, negocios: Optional[List[str]] = Query(None)):
+    metadatos_por_negocio = await obtener_negocios(negocios)
+    return respuesta_mapa(filas_cobros_resumen(metadatos_por_negocio, mes_anio))
+
+@cadena.get("/cadena/porcentaje_cobro/{mes_anio}", response_model=Dict[str, GraficosResponse], tags=["Cadena de negocios"])
+async def cadena_porcentaje_cobro(mes_anio: MesAnio, negocios: Optional[List[str]] = Query(None)):
+    metadatos_por_negocio = await obtener_negocios(negocios)
+    return respuesta_mapa(filas_porcentaje_cobro(metadatos_por_negocio, mes_anio))
@@ -1,274 +1,132 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import JSONResponse
 
-from config.db import client
-
-from datetime import datetime, timedelta
-from dateutil import relativedelta
-
 from models.responses import CobrosDiaResponse, CobrosResumenMesResponse
+from services import repositorio
+from services.cache_respuestas import cache_respuestas
+from services.catalogo import catalogo
+from services.meses import MesAnio
+from services.rollups import leer_rollup
 
 cobros = APIRouter()
 
-# Seleccionamos la base de datos:
-db = client.challenge_set
-
-def obtener_datos_cobros_mes_negocio(mes_anio, negocio):
-    month, year = map(int, mes_anio.split('-'))
-    
-    # Obtener el _id del negocio desde la colección "merchants"
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return None  # El negocio no fue encontrado
-    
-    merchant_id = merchant["_id"]
-    
-    # Construir fechas de inicio y fin del mes
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_fin_mes = fecha_inicio_mes + relativedelta.relativedelta(months=1)
-    
-    # Consulta para cobros de Altas
-    query_altas = {
-        "merchant_id": merchant_id,
-        "source": {"$in": ["checkout", "checkout3", "checkout_miclub"]},
-        "date_created": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes},
-        "status": "approved"
-    }
-    
-    # Consulta para cobros de Recurrencia
-    query_recurrencia = {
-        "merchant_id": merchant_id,
-        "source": {"$in": ["recurring_charges", "recurring_miclub"]},
-        "original_payment_date": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes},
-        "status": "approved"
-    }
-    
-    # Realizar las consultas y procesar los resultados
-    cobros_altas = db.boletas.find(query_altas)
-    cobros_recurrencia = db.boletas.find(query_recurrencia)
-    
-    # Agrupar los cobros por día y sumarlos
-    cobros_por_dia = {}
-    
-    for c in cobros_altas:
-        fecha = c["date_created"].date()
-        cobros_por_dia.setdefault(fecha, {"altas": 0, "recurrencias": 0})
-        cobros_por_dia[fecha]["altas"] += c["charges_detail"]["final_price"]
-    
-    for c in cobros_recurrencia:
-        fecha = c["original_payment_date"].date()
-        cobros_por_dia.setdefault(fecha, {"altas": 0, "recurrencias": 0})
-        cobros_por_dia[fecha]["recurrencias"] += c["charges_detail"]["final_price"]
-    
-    # Estructurar los datos en una lista de diccionarios
-    datos_cobros = [
-        {
-            "fecha": fecha.strftime("%Y-%m-%d"),
-            "altas": cobros["altas"],
-            "recurrencias": cobros["recurrencias"]
-        }
-        for fecha, cobros in sorted(cobros_por_dia.items())
-    ]
-    
-    return datos_cobros
+# Valores del atributo "source" que identifican cada tipo de cobro
+FUENTES_ALTAS = ["checkout", "checkout3", "checkout_miclub"]
+FUENTES_RECURRENCIAS = ["recurring_charges", "recurring_miclub"]
 
-def obtener_total_cobrado_mes_negocio(mes_anio, negocio):
-    month, year = map(int, mes_anio.split('-'))
-    
-    # Obtener el _id del negocio desde la colección "merchants"
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return None  # El negocio no fue encontrado
-    
-    merchant_id = merchant["_id"]
-    
-    # Construir fechas de inicio y fin del mes
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_fin_mes = fecha_inicio_mes + relativedelta.relativedelta(months=1)
-    
-    # Consulta para cobros de Altas y Recurrencia
-    query = {
+def query_cobros_aprobados(merchant_id, fecha_desde, fecha_hasta):
+    # Boletas aprobadas del negocio cuya fecha de cobro cae en [fecha_desde, fecha_hasta):
+    # date_created para las altas y original_payment_date para las recurrencias.
+    # merchant_id también puede ser una condición, por ejemplo {"$in": [...]} para varios negocios.
+    return {
         "merchant_id": merchant_id,
+        "status": "approved",
         "$or": [
             {
-                "source": {"$in": ["checkout", "checkout3", "checkout_miclub"]},
-                "date_created": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes},
-                "status": "approved"
+                "source": {"$in": FUENTES_ALTAS},
+                "date_created": {"$gte": fecha_desde, "$lt": fecha_hasta}
             },
             {
-                "source": {"$in": ["recurring_charges", "recurring_miclub"]},
-                "original_payment_date": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes},
-                "status": "approved"
+                "source": {"$in": FUENTES_RECURRENCIAS},
+                "original_payment_date": {"$gte": fecha_desde, "$lt": fecha_hasta}
             }
         ]
     }
-    
-    # Realizar la consulta y calcular el valor total cobrado
-    cobros = db.boletas.find(query)
-    total_cobrado = sum(c["charges_detail"]["final_price"] for c in cobros)
-    
-    return total_cobrado
 
-def calcular_variacion_total_cobrado(mes_anio, negocio):
-    month, year = map(int, mes_anio.split('-'))
-    
-    # Obtener el _id del negocio desde la colección "merchants"
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return None  # El negocio no fue encontrado
-    
-    merchant_id = merchant["_id"]
-    
-    # Construir fechas de inicio y fin del mes actual
-    fecha_inicio_mes_actual = datetime(year, month, 1)
-    fecha_fin_mes_actual = fecha_inicio_mes_actual + relativedelta.relativedelta(months=1)
-    
-    # Construir fechas de inicio y fin del mes anterior
-    fecha_inicio_mes_anterior = fecha_inicio_mes_actual - relativedelta.relativedelta(months=1)
-    fecha_fin_mes_anterior = fecha_inicio_mes_actual
-    
-    # Calcular la cantidad de días equivalentes al mes anterior
-    dias_mes_anterior = fecha_inicio_mes_actual.day
-    
-    # Consultar el monto total de altas para el mes actual y el mes anterior
-    total_altas_mes_actual = obtener_total_cobrado_mes_negocio(mes_anio, negocio)
-    total_altas_mes_anterior = obtener_total_cobrado_mes_negocio(fecha_inicio_mes_anterior.strftime("%m-%Y"), negocio)
-    
-    # Calcular la variación del monto de altas
-    if total_altas_mes_anterior > 0:
-        variacion_porcentaje = ((total_altas_mes_actual - total_altas_mes_anterior) / total_altas_mes_anterior) * 100
-    else:
-        variacion_porcentaje = 0
-    
-    return variacion_porcentaje
+def etapas_cobros_aprobados(merchant_id, fecha_desde, fecha_hasta):
+    # Etapas comunes de las agregaciones de cobros: filtra las boletas de query_cobros_aprobados
+    # y las deja clasificadas como altas (fecha = date_created) o recurrencias (fecha = original_payment_date)
+    return [
+        {"$match": query_cobros_aprobados(merchant_id, fecha_desde, fecha_hasta)},
+        {
+            "$project": {
+                "merchant_id": 1,
+                "tipo": {"$cond": [{"$in": ["$source", FUENTES_ALTAS]}, "altas", "recurrencias"]},
+                "fecha": {
+                    "$cond": [{"$in": ["$source", FUENTES_ALTAS]}, "$date_created", "$original_payment_date"]
+                },
+                "monto": "$charges_detail.final_price"
+            }
+        }
+    ]
 
-def obtener_total_recurrencias_mes_negocio(mes_anio, negocio):
-    month, year = map(int, mes_anio.split('-'))
-    
-    # Obtener el _id del negocio desde la colección "merchants"
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
+async def obtener_datos_cobros_mes_negocio(mes_anio, negocio):
+    # Obtener el _id del negocio desde el catálogo compartido
+    metadatos = await catalogo.obtener(negocio)
+    if not metadatos:
         return None  # El negocio no fue encontrado
     
-    merchant_id = merchant["_id"]
+    merchant_id = metadatos.merchant_id
     
-    # Construir fechas de inicio y fin del mes
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_fin_mes = fecha_inicio_mes + relativedelta.relativedelta(months=1)
+    # Fechas de inicio y fin del mes
+    mes = MesAnio.de(mes_anio)
     
-    # Consulta para cobros de Recurrencia
-    query_recurrencia = {
-        "merchant_id": merchant_id,
-        "source": {"$in": ["recurring_charges", "recurring_miclub"]},
-        "original_payment_date": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes},
-        "status": "approved"
+    # El repositorio activo agrupa los cobros del mes por día
+    return await repositorio.actual.cobros_por_dia(merchant_id, mes.inicio, mes.fin)
+
+def calcular_variacion(actual, anterior):
+    # Variación porcentual respecto al mes anterior (0 si no hubo cobros el mes anterior)
+    if anterior > 0:
+        return ((actual - anterior) / anterior) * 100
+    return 0
+
+async def obtener_totales_cobros_meses(merchant_id, meses):
+    # Totales de altas y recurrencias de cada mes, en una sola pasada por las boletas
+    return await repositorio.actual.totales_cobros(merchant_id, meses)
+
+def resumir_cobros(mes_actual, mes_anterior):
+    # El total cobrado es la suma de altas y recurrencias (las fuentes no se superponen)
+    total_mes_actual = mes_actual["altas"] + mes_actual["recurrencias"]
+    total_mes_anterior = mes_anterior["altas"] + mes_anterior["recurrencias"]
+    
+    return {
+        "total_cobrado": total_mes_actual,
+        "variacion_total_cobrado": calcular_variacion(total_mes_actual, total_mes_anterior),
+        "total_cobrado_recurrencias": mes_actual["recurrencias"],
+        "variacion_total_cobrado_recurrencias": calcular_variacion(mes_actual["recurrencias"], mes_anterior["recurrencias"]),
+        "total_cobrado_altas": mes_actual["altas"],
+        "variacion_total_cobrado_altas": calcular_variacion(mes_actual["altas"], mes_anterior["altas"]),
     }
-    
-    # Realizar la consulta y calcular el valor total cobrado por recurrencias
-    cobros_recurrencia = db.boletas.find(query_recurrencia)
-    total_recurrencias = sum(c["charges_detail"]["final_price"] for c in cobros_recurrencia)
-    
-    return total_recurrencias
 
-def calcular_variacion_monto_recurrencias(mes_anio, negocio):
-    month, year = map(int, mes_anio.split('-'))
-    
-    # Obtener el _id del negocio desde la colección "merchants"
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
+async def obtener_resumen_cobros_mes(mes_anio, negocio):
+    # Obtener el _id del negocio desde el catálogo compartido
+    metadatos = await catalogo.obtener(negocio)
+    if not metadatos:
         return None  # El negocio no fue encontrado
     
-    merchant_id = merchant["_id"]
-    
-    # Construir fechas de inicio y fin del mes actual
-    fecha_inicio_mes_actual = datetime(year, month, 1)
-    fecha_fin_mes_actual = fecha_inicio_mes_actual + relativedelta.relativedelta(months=1)
-    
-    # Construir fechas de inicio y fin del mes anterior
-    fecha_inicio_mes_anterior = fecha_inicio_mes_actual - relativedelta.relativedelta(months=1)
-    fecha_fin_mes_anterior = fecha_inicio_mes_actual
-    
-    # Calcular la cantidad de días equivalentes al mes anterior
-    dias_mes_anterior = fecha_inicio_mes_actual.day
+    mes_anterior = MesAnio.de(mes_anio).anterior
     
-    # Consultar el monto total de altas para el mes actual y el mes anterior
-    total_altas_mes_actual = obtener_total_recurrencias_mes_negocio(mes_anio, negocio)
-    total_altas_mes_anterior = obtener_total_recurrencias_mes_negocio(fecha_inicio_mes_anterior.strftime("%m-%Y"), negocio)
+    # Los totales del mes y del mes anterior salen de una sola consulta
+    totales = await obtener_totales_cobros_meses(metadatos.merchant_id, [mes_anterior, mes_anio])
     
-    # Calcular la variación del monto de altas
-    if total_altas_mes_anterior > 0:
-        variacion_porcentaje = ((total_altas_mes_actual - total_altas_mes_anterior) / total_altas_mes_anterior) * 100
-    else:
-        variacion_porcentaje = 0
-    
-    return variacion_porcentaje
+    return resumir_cobros(totales[mes_anio], totales[mes_anterior])
 
-def obtener_total_altas_mes_negocio(mes_anio, negocio):
-    month, year = map(int, mes_anio.split('-'))
-    
-    # Obtener el _id del negocio desde la colección "merchants"
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return None  # El negocio no fue encontrado
-    
-    merchant_id = merchant["_id"]
-    
-    # Construir fechas de inicio y fin del mes
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_fin_mes = fecha_inicio_mes + relativedelta.relativedelta(months=1)
-    
-    # Consulta para cobros de Altas
-    query_altas = {
-        "merchant_id": merchant_id,
-        "source": {"$in": ["checkout", "checkout3", "checkout_miclub"]},
-        "date_created": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes},
-        "status": "approved"
+def formatear_cobros_resumen(resumen):
+    # Construir el objeto de respuesta
+    return {
+        "Total Cobrado": resumen["total_cobrado"],
+        "Variación Total Cobrado respecto al mes anterior (%)": resumen["variacion_total_cobrado"],
+        "Total Cobrado por Recurrencias": resumen["total_cobrado_recurrencias"],
+        "Variación Total Cobrado por Recurrencias respecto al mes anterior (%)": resumen["variacion_total_cobrado_recurrencias"],
+        "Total Cobrado por Altas": resumen["total_cobrado_altas"],
+        "Variación Total Cobrado por Altas respecto al mes anterior (%)": resumen["variacion_total_cobrado_altas"],
     }
-    
-    # Realizar la consulta y calcular el valor total cobrado por altas
-    cobros_altas = db.boletas.find(query_altas)
-    total_altas = sum(c["charges_detail"]["final_price"] for c in cobros_altas)
-    
-    return total_altas
 
-def calcular_variacion_monto_altas(mes_anio, negocio):
-    month, year = map(int, mes_anio.split('-'))
+async def calcular_cobros_resumen(negocio, mes_anio):
+    # Calculamos los seis valores del resumen con una sola consulta a la base
+    resumen = await obtener_resumen_cobros_mes(mes_anio, negocio)
     
-    # Obtener el _id del negocio desde la colección "merchants"
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
+    if resumen is None:
         return None  # El negocio no fue encontrado
     
-    merchant_id = merchant["_id"]
-    
-    # Construir fechas de inicio y fin del mes actual
-    fecha_inicio_mes_actual = datetime(year, month, 1)
-    fecha_fin_mes_actual = fecha_inicio_mes_actual + relativedelta.relativedelta(months=1)
-    
-    # Construir fechas de inicio y fin del mes anterior
-    fecha_inicio_mes_anterior = fecha_inicio_mes_actual - relativedelta.relativedelta(months=1)
-    fecha_fin_mes_anterior = fecha_inicio_mes_actual
-    
-    # Calcular la cantidad de días equivalentes al mes anterior
-    dias_mes_anterior = fecha_inicio_mes_actual.day
-    
-    # Consultar el monto total de altas para el mes actual y el mes anterior
-    total_altas_mes_actual = obtener_total_altas_mes_negocio(mes_anio, negocio)
-    total_altas_mes_anterior = obtener_total_altas_mes_negocio(fecha_inicio_mes_anterior.strftime("%m-%Y"), negocio)
-    
-    # Calcular la variación del monto de altas
-    if total_altas_mes_anterior > 0:
-        variacion_porcentaje = ((total_altas_mes_actual - total_altas_mes_anterior) / total_altas_mes_anterior) * 100
-    else:
-        variacion_porcentaje = 0
-    
-    return variacion_porcentaje
+    return formatear_cobros_resumen(resumen)
 
-# Ruta para el Objetivo 2
-@cobros.get("/cobros/{negocio}/{mes_anio}", response_model=CobrosDiaResponse, tags=["Cobros del mes"])
-def cobros_por_dia(negocio: str, mes_anio: str):
-    # Llamamos a la función para obtener los datos de cobros por día
-    datos_cobros = obtener_datos_cobros_mes_negocio(mes_anio, negocio)
+async def responder_cobros_por_dia(negocio, mes_anio):
+    # Si el mes ya está precalculado en la colección de rollups lo leemos de ahí
+    datos_cobros = await leer_rollup(negocio, mes_anio, "cobros")
+    if datos_cobros is None:
+        # Llamamos a la función para obtener los datos de cobros por día
+        datos_cobros = await obtener_datos_cobros_mes_negocio(mes_anio, negocio)
     
     if not datos_cobros:
         return JSONResponse(content={"message": "No se encontraron datos para el negocio y mes especificados"}, status_code=404)
@@ -276,23 +134,26 @@ def cobros_por_dia(negocio: str, mes_anio: str):
     # Devolver los datos como respuesta JSON
     return JSONResponse(content=datos_cobros)
 
-# Ruta para el Objetivo 3
-@cobros.get("/cobros_resumen/{negocio}/{mes_anio}", response_model=CobrosResumenMesResponse, tags=["Cobros del mes"])
-def resumen_cobros_mes(negocio: str, mes_anio: str):
-    
-    # Construir el objeto de respuesta
-    resumen_cobros = {
-        "Total Cobrado": obtener_total_cobrado_mes_negocio(mes_anio, negocio),
-        "Variación Total Cobrado respecto al mes anterior (%)": calcular_variacion_total_cobrado(mes_anio, negocio),
-        "Total Cobrado por Recurrencias": obtener_total_recurrencias_mes_negocio(mes_anio, negocio),
-        "Variación Total Cobrado por Recurrencias respecto al mes anterior (%)": calcular_variacion_monto_recurrencias(mes_anio, negocio),
-        "Total Cobrado por Altas": obtener_total_altas_mes_negocio(mes_anio, negocio),
-        "Variación Total Cobrado por Altas respecto al mes anterior (%)": calcular_variacion_monto_altas(mes_anio, negocio),
-    }
-    
-    if all(value == None for value in resumen_cobros.values()):
-            # Manejo de error si los datos no se encuentran
-            raise HTTPException(status_code=404, detail="No se encontraron datos para el negocio y mes especificados")
+async def responder_resumen_cobros_mes(negocio, mes_anio):
+    # Si el mes ya está precalculado en la colección de rollups lo leemos de ahí
+    resumen_cobros = await leer_rollup(negocio, mes_anio, "cobros_resumen")
+    if resumen_cobros is None:
+        resumen_cobros = await calcular_cobros_resumen(negocio, mes_anio)
+    
+    if resumen_cobros is None:
+        # Manejo de error si los datos no se encuentran
+        raise HTTPException(status_code=404, detail="No se encontraron datos para el negocio y mes especificados")
 
     # Devolvemos los datos como una respuesta JSON
-    return JSONResponse(content=resumen_cobros)
\ No newline at end of file
+    return JSONResponse(content=resumen_cobros)
+
+# Ruta para el Objetivo 2
+@cobros.get("/cobros/{negocio}/{mes_anio}", response_model=CobrosDiaResponse, tags=["Cobros del mes"])
+async def cobros_por_dia(request: Request, negocio: str, mes_anio: MesAnio):
+    # La respuesta se guarda en el caché con su ETag; los meses cerrados no cambian más
+    return await cache_respuestas.responder(request, "cobros", negocio, mes_anio, lambda: responder_cobros_por_dia(negocio, mes_anio))
+
+# Ruta para el Objetivo 3
+@cobros.get("/cobros_resumen/{negocio}/{mes_anio}", response_model=CobrosResumenMesResponse, tags=["Cobros del mes"])
+async def resumen_cobros_mes(request: Request, negocio: str, mes_anio: MesAnio):
+    return await cache_respuestas.responder(request, "cobros_resumen", negocio, mes_anio, lambda: responder_resumen_cobros_mes(negocio, mes_anio))
\ No newline at end of file
@@ -0,0 +1,94 @@
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+from services.perfilado import (
+    DEPURACION_TOKEN,
+    MUESTREO_MAX_SEGUNDOS,
+    PERFIL_MAX_PETICIONES,
+    agregar_por_funcion,
+    bloqueo_muestreo,
+    colapsar,
+    funciones_perfil,
+    muestrear,
+    perfil_ruta,
+)
+
+def verificar_token(x_depuracion_token: str = Header(default="")):
+    if not hmac.compare_digest(x_depuracion_token.encode(), DEPURACION_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Token de depuración inválido")
+
+# Solo se registra en app.py si DEPURACION_TOKEN está definido; todas las rutas piden el header X-Depuracion-Token
+depuracion = APIRouter(prefix="/depuracion", tags=["Depuración"], dependencies=[Depends(verificar_token)])
+
+# Perfil por muestreo de todos los hilos del worker durante unos segundos.
+# formato=colapsado devuelve las pilas para flamegraph.pl o speedscope; json, los agregados por función.
+@depuracion.get("/muestreo")
+async def perfil_muestreo(
+    segundos: float = Query(default=5, gt=0, le=MUESTREO_MAX_SEGUNDOS),
+    intervalo_ms: float = Query(default=5, ge=1, le=1000),
+    formato: str = Query(default="json", pattern="^(json|colapsado)$"),
+    solo_proyecto: bool = True,
+):
+    if bloqueo_muestreo.locked():
+        raise HTTPException(status_code=409, detail="Ya hay un muestreo en curso")
+
+    muestreador = await muestrear(segundos, intervalo_ms / 1000)
+
+    if formato == "colapsado":
+        return PlainTextResponse(colapsar(muestreador.pilas))
+
+    return JSONResponse(content={
+        "segundos": segundos,
+        "intervalo_ms": intervalo_ms,
+        "muestras": muestreador.muestras,
+        "funciones": agregar_por_funcion(muestreador.pilas, solo_proyecto),
+    })
+
+# Arma cProfile para las próximas N peticiones a una ruta (su plantilla, p. ej. /resumen_mes/{negocio}/{mes_anio})
+@depuracion.post("/cprofile")
+async def armar_cprofile(
+    request: Request,
+    ruta: str,
+    peticiones: int = Query(default=10, ge=1, le=PERFIL_MAX_PETICIONES),
+):
+    if perfil_ruta.ruta is not None:
+        raise HTTPException(status_code=409, detail=f"Ya hay un perfil armado para {perfil_ruta.ruta.path}")
+
+    rutas = [r for r in request.app.routes if getattr(r, "path", None) == ruta and not r.path.startswith("/depuracion")]
+    if not rutas:
+        raise HTTPException(status_code=404, detail=f"No existe la ruta {ruta}")
+
+    perfil_ruta.armar(rutas[0], peticiones)
+    return JSONResponse(content=perfil_ruta.estado())
+
+# Estado del perfil armado o, si ya terminó, sus agregados por función (formato=pstats: el archivo de Profile.dump_stats)
+@depuracion.get("/cprofile")
+async def resultado_cprofile(
+    formato: str = Query(default="json", pattern="^(json|pstats)$"),
+    solo_proyecto: bool = True,
+    limite: int = Query(default=100, ge=1),
+):
+    if perfil_ruta.resultado is None:
+        return JSONResponse(content=perfil_ruta.estado())
+
+    if formato == "pstats":
+        return Response(
+            content=perfil_ruta.pstats(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="perfil.pstats"'},
+        )
+
+    ruta, peticiones, perfil = perfil_ruta.resultado
+    return JSONResponse(content={
+        **perfil_ruta.estado(),
+        "ruta": ruta,
+        "peticiones": peticiones,
+        "funciones": funciones_perfil(perfil, solo_proyecto, limite),
+    })
+
+@depuracion.delete("/cprofile")
+async def cancelar_cprofile():
+    perfil_ruta.cancelar()
+    return JSONResponse(content=perfil_ruta.estado())
@@ -0,0 +1,39 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from config.db import configuracion_pool, monitor_pool
+from services.cache_respuestas import cache_respuestas
+from services.metricas import exposicion_prometheus
+from services.precalentamiento import precalentamiento
+
+estado = APIRouter()
+
+# Liveness: responde mientras el worker atiende, sin consultar MongoDB
+@estado.get("/estado/vivo", tags=["Estado"])
+async def estado_vivo():
+    return JSONResponse(content={"vivo": True})
+
+# Readiness: 503 hasta que termina el precalentamiento del worker, para que el balanceador no le envíe tráfico antes
+@estado.get("/estado/listo", tags=["Estado"])
+async def estado_listo():
+    return JSONResponse(content=precalentamiento.estado(), status_code=200 if precalentamiento.listo else 503)
+
+# Uso del pool de conexiones a MongoDB de este worker
+@estado.get("/estado/pool", tags=["Estado"])
+async def estado_pool():
+    datos = {
+        "configuracion": configuracion_pool(),
+        "uso": monitor_pool.estadisticas(),
+    }
+
+    return JSONResponse(content=datos)
+
+# Uso del caché de respuestas de las rutas del mes
+@estado.get("/estado/cache", tags=["Estado"])
+async def estado_cache():
+    return JSONResponse(content=await cache_respuestas.estadisticas())
+
+# Latencias por ruta, comandos a MongoDB por colección y función y uso del pool, en formato Prometheus
+@estado.get("/metrics", tags=["Estado"], response_class=PlainTextResponse)
+async def metricas():
+    return PlainTextResponse(exposicion_prometheus(monitor_pool.estadisticas()), media_type="text/plain; version=0.0.4")
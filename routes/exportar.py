@@ -0,0 +1,151 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Literal
+from urllib.parse import quote
+
+from routes.cobros import FUENTES_ALTAS, etapas_cobros_aprobados, query_cobros_aprobados
+from services.catalogo import catalogo
+from services.lectura_boletas import LECTURA_BATCH_SIZE, leer_lotes
+from services.meses import MesAnio, limites_meses
+from services.repositorio import db_mongo
+
+exportar = APIRouter()
+
+COLUMNAS_BOLETAS = ["id", "plan_id", "tipo", "source", "fecha", "date_created", "original_payment_date", "monto"]
+COLUMNAS_COBROS_POR_DIA = ["fecha", "altas", "recurrencias"]
+
+def texto_o_nulo(valor):
+    return str(valor) if valor is not None else None
+
+def iso_o_nulo(fecha):
+    return fecha.isoformat() if isinstance(fecha, datetime) else None
+
+def fila_boleta(boleta, fuentes_altas):
+    # Una boleta como fila plana; "fecha" es la fecha con la que cuenta en /cobros. Los campos que
+    # falten quedan en null (vacíos en CSV): una boleta mal formada no corta la exportación.
+    tipo = "altas" if boleta.get("source") in fuentes_altas else "recurrencias"
+    fecha = boleta.get("date_created") if tipo == "altas" else boleta.get("original_payment_date")
+    return {
+        "id": texto_o_nulo(boleta.get("_id")),
+        "plan_id": texto_o_nulo(boleta.get("plan_id")),
+        "tipo": tipo,
+        "source": boleta.get("source"),
+        "fecha": fecha.strftime("%Y-%m-%d") if isinstance(fecha, datetime) else None,
+        "date_created": iso_o_nulo(boleta.get("date_created")),
+        "original_payment_date": iso_o_nulo(boleta.get("original_payment_date")),
+        "monto": (boleta.get("charges_detail") or {}).get("final_price"),
+    }
+
+async def lotes_boletas(merchant_id, fecha_desde, fecha_hasta):
+    db = db_mongo()
+
+    # Las mismas boletas que suman en /cobros, solo con los campos que se exportan
+    proyeccion = {
+        "plan_id": 1,
+        "source": 1,
+        "date_created": 1,
+        "original_payment_date": 1,
+        "charges_detail.final_price": 1,
+    }
+    # Sin sort: ordenar obligaría al servidor a juntar todas las boletas antes de devolver la primera
+    cursor = db.boletas.find(
+        query_cobros_aprobados(merchant_id, fecha_desde, fecha_hasta), proyeccion, batch_size=LECTURA_BATCH_SIZE
+    )
+
+    fuentes_altas = set(FUENTES_ALTAS)
+    async for lote in leer_lotes(cursor):
+        yield [fila_boleta(boleta, fuentes_altas) for boleta in lote]
+
+async def lotes_cobros_por_dia(merchant_id, fecha_desde, fecha_hasta):
+    db = db_mongo()
+
+    # Los mismos totales por día que /cobros, para todo el rango
+    pipeline = etapas_cobros_aprobados(merchant_id, fecha_desde, fecha_hasta) + [
+        {
+            "$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$fecha"}},
+                "altas": {"$sum": {"$cond": [{"$eq": ["$tipo", "altas"]}, "$monto", 0]}},
+                "recurrencias": {"$sum": {"$cond": [{"$eq": ["$tipo", "recurrencias"]}, "$monto", 0]}}
+            }
+        },
+        {"$sort": {"_id": 1}}
+    ]
+
+    async for lote in leer_lotes(db.boletas.aggregate(pipeline)):
+        yield [{"fecha": dia["_id"], "altas": dia["altas"], "recurrencias": dia["recurrencias"]} for dia in lote]
+
+async def serializar(lotes, formato, columnas):
+    # Un bloque de texto por lote: NDJSON (un objeto por línea) o CSV con encabezado
+    if formato == "csv":
+        salida = io.StringIO()
+        escritor = csv.DictWriter(salida, fieldnames=columnas, lineterminator="\n")
+        escritor.writeheader()
+        yield salida.getvalue()
+
+        async for lote in lotes:
+            salida = io.StringIO()
+            escritor = csv.DictWriter(salida, fieldnames=columnas, lineterminator="\n")
+            escritor.writerows(lote)
+            yield salida.getvalue()
+    else:
+        async for lote in lotes:
+            yield "".join(json.dumps(fila, ensure_ascii=False) + "\n" for fila in lote)
+
+async def comprimir(bloques):
+    # gzip incremental: cada bloque se comprime y se envía sin esperar al resto
+    compresor = zlib.compressobj(wbits=31)
+    async for bloque in bloques:
+        comprimido = compresor.compress(bloque.encode("utf-8"))
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+async def validar_exportacion(negocio, desde, hasta):
+    db_mongo()  # La exportación lee directamente de MongoDB: sin él se responde 503 antes de transmitir
+
+    if desde.inicio > hasta.inicio:
+        raise HTTPException(status_code=422, detail="El mes 'desde' debe ser anterior o igual al mes 'hasta'")
+
+    metadatos = await catalogo.obtener(negocio)
+    if not metadatos:
+        raise HTTPException(status_code=404, detail="No se encontraron datos para el negocio especificado")
+
+    return metadatos
+
+def respuesta_exportacion(lotes, formato, columnas, gzip, nombre):
+    # StreamingResponse consume el generador a medida que el cliente lee: cada lote se pide
+    # al cursor recién cuando el anterior se envió, así que la memoria no depende del tamaño
+    bloques = serializar(lotes, formato, columnas)
+    media_type = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    nombre = f"{nombre}.{formato}"
+
+    if gzip:
+        bloques = comprimir(bloques)
+        media_type = "application/gzip"
+        nombre += ".gz"
+
+    headers = {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(nombre)}"}
+    return StreamingResponse(bloques, media_type=media_type, headers=headers)
+
+# Rutas de exportación: los datos detrás de /cobros para un rango de meses, sin armarlos en memoria
+@exportar.get("/exportar/boletas/{negocio}", tags=["Exportación"])
+async def exportar_boletas(negocio: str, desde: MesAnio, hasta: MesAnio, formato: Literal["ndjson", "csv"] = "ndjson", gzip: bool = False):
+    metadatos = await validar_exportacion(negocio, desde, hasta)
+    fecha_desde, fecha_hasta = limites_meses([desde, hasta])
+
+    lotes = lotes_boletas(metadatos.merchant_id, fecha_desde, fecha_hasta)
+    return respuesta_exportacion(lotes, formato, COLUMNAS_BOLETAS, gzip, f"boletas_{negocio}_{desde}_{hasta}")
+
+@exportar.get("/exportar/cobros_por_dia/{negocio}", tags=["Exportación"])
+async def exportar_cobros_por_dia(negocio: str, desde: MesAnio, hasta: MesAnio, formato: Literal["ndjson", "csv"] = "ndjson", gzip: bool = False):
+    metadatos = await validar_exportacion(negocio, desde, hasta)
+    fecha_desde, fecha_hasta = limites_meses([desde, hasta])
+
+    lotes = lotes_cobros_por_dia(metadatos.merchant_id, fecha_desde, fecha_hasta)
+    return respuesta_exportacion(lotes, formato, COLUMNAS_COBROS_POR_DIA, gzip, f"cobros_por_dia_{negocio}_{desde}_{hasta}")
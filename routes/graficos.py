@@ -1,218 +1,118 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import JSONResponse
 
-from config.db import client
-
-from datetime import datetime, timedelta
-from dateutil import relativedelta
-
 from models.responses import GraficosResponse
+from services import repositorio
+from services.cache_respuestas import cache_respuestas
+from services.catalogo import catalogo
+from services.meses import MesAnio
+from services.rollups import leer_rollup
 
 graficos = APIRouter()
 
-# Seleccionamos la base de datos:
-db = client.challenge_set
-
-def obtener_tipos_cobro_y_plan_ids(negocio):
-    # Obtener el _id del negocio desde la colección "merchants"
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return None  # El negocio no fue encontrado
-
-    merchant_id = merchant["_id"]
-
-    # Obtener los tipos de cobro (Mensual o Anual) y sus respectivos plan_ids
-    tipos_cobro = {}
-
-    # Obtener los planes asociados al negocio
-    planes = db.planes.find({"merchant_id": merchant_id})
-
-    for plan in planes:
-        plan_id = plan["_id"]
-        plan_sede_local = plan.get("sede_local", "")  # Si no existe, se guarda como cadena vacía
-        tipo_cobro = plan["cobro"]
-
-        if tipo_cobro not in tipos_cobro:
-            tipos_cobro[tipo_cobro] = []
-
-        if plan_id not in tipos_cobro[tipo_cobro]:
-            tipos_cobro[tipo_cobro].append(plan_id)
-
-        if plan_sede_local and plan_sede_local != plan_id and plan_sede_local not in tipos_cobro[tipo_cobro]:
-            tipos_cobro[tipo_cobro].append(plan_sede_local)
-
-    return tipos_cobro
-
-def calcular_porcentaje_cobro_tipos_cobro(mes_anio, negocio):
-    # Obtener el _id del negocio desde la colección "merchants"
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return None  # El negocio no fue encontrado
-
-    merchant_id = merchant["_id"]
-
-    # Obtener los tipos de cobro y plan_ids asociados al negocio
-    tipos_cobro_y_plan_ids = obtener_tipos_cobro_y_plan_ids(negocio)
-
-    if not tipos_cobro_y_plan_ids:
-        return None  # No se encontraron tipos de cobro
-
-    # Parsear el mes-año en una fecha
-    month, year = map(int, mes_anio.split('-'))
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_fin_mes = fecha_inicio_mes + relativedelta.relativedelta(months=1)
-
-    # Consultar las boletas cobradas para el mes-año y negocio especificados (Mensual)
-    query_mensual = {
+def query_boletas_planes(merchant_id, plan_ids, fecha_inicio_mes, fecha_fin_mes):
+    # Boletas cobradas del negocio en el mes (por date_created u original_payment_date) de los planes indicados
+    return {
         "merchant_id": merchant_id,
         "status": "approved",
-        "plan_id": {"$in": tipos_cobro_y_plan_ids["Mensual"]},
+        "plan_id": {"$in": plan_ids},
         "$or": [
             {"date_created": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes}},
             {"original_payment_date": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes}},
         ],
     }
 
-    # Consultar las boletas cobradas para el mes-año y negocio especificados (Anual)
-    query_anual = {
-        "merchant_id": merchant_id,
-        "status": "approved",
-        "plan_id": {"$in": tipos_cobro_y_plan_ids["Anual"]},
-        "$or": [
-            {"date_created": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes}},
-            {"original_payment_date": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes}},
-        ],
-    }
+def pipeline_totales_por_plan(merchant_id, plan_ids, fecha_inicio_mes, fecha_fin_mes):
+    # Una sola pasada por las boletas cobradas del mes: lo cobrado por cada plan.
+    # El tipo de cobro y el nivel de acceso de cada plan se resuelven después con el catálogo.
+    return [
+        {"$match": query_boletas_planes(merchant_id, plan_ids, fecha_inicio_mes, fecha_fin_mes)},
+        {"$group": {"_id": "$plan_id", "total": {"$sum": "$charges_detail.final_price"}}}
+    ]
 
-    # Obtener las boletas que coinciden con la consulta (Mensual)
-    boletas_mensual = db.boletas.find(query_mensual)
-
-    # Obtener las boletas que coinciden con la consulta (Anual)
-    boletas_anual = db.boletas.find(query_anual)
+def porcentajes_tipos_cobro(totales_por_plan, clasificacion_planes):
+    # Porcentaje cobrado por tipo de cobro a partir de lo cobrado por cada plan
+    resultados = {
+        "Mensual": 0,
+        "Anual": 0
+    }
 
-    # Calcular el monto total cobrado por cada tipo de cobro (Mensual)
-    total_cobrado_mensual = sum(boleta["charges_detail"]["final_price"] for boleta in boletas_mensual)
+    for plan_id, total in totales_por_plan.items():
+        clasificacion = clasificacion_planes.get(plan_id)
+        if clasificacion is None:
+            continue
+        for cobro in resultados:
+            if cobro in clasificacion.cobros:
+                resultados[cobro] += total
 
-    # Calcular el monto total cobrado por cada tipo de cobro (Anual)
-    total_cobrado_anual = sum(boleta["charges_detail"]["final_price"] for boleta in boletas_anual)
+    total_cobrado_mes_actual = sum(resultados.values())
 
-    # Calcular el porcentaje de dinero cobrado por cada tipo de cobro
-    total_cobrado_mes_actual = total_cobrado_mensual + total_cobrado_anual
-    
     if total_cobrado_mes_actual > 0:
-        porcentajes = {
-            "Mensual": (total_cobrado_mensual / total_cobrado_mes_actual) * 100,
-            "Anual": (total_cobrado_anual / total_cobrado_mes_actual) * 100,
-        }
-    else:
-        porcentajes = None
-
-    return porcentajes
-
-def obtener_niveles_acceso_y_plan_ids(negocio):
-    # Obtener el _id del negocio desde la colección "merchants"
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return None  # El negocio no fue encontrado
-
-    merchant_id = merchant["_id"]
-
-    # Obtener los niveles de acceso (Local, Plus, Total) y sus respectivos plan_ids
-    niveles_acceso = {}
-
-    # Obtener los planes asociados al negocio
-    planes = db.planes.find({"merchant_id": merchant_id})
-
-    for plan in planes:
-        plan_id = plan["_id"]
-        plan_sede_local = plan.get("sede_local", "")  # Si no existe, se guarda como cadena vacía
-        nivel_acceso = plan.get("nivel_de_acceso", "")  # Obtener el nivel de acceso del plan
+        return {cobro: (total_cobrado / total_cobrado_mes_actual) * 100 for cobro, total_cobrado in resultados.items()}
+    return None
 
-        if nivel_acceso not in niveles_acceso:
-            niveles_acceso[nivel_acceso] = []
-
-        if plan_id not in niveles_acceso[nivel_acceso]:
-            niveles_acceso[nivel_acceso].append(plan_id)
-
-        if plan_sede_local and plan_sede_local != plan_id and plan_sede_local not in niveles_acceso[nivel_acceso]:
-            niveles_acceso[nivel_acceso].append(plan_sede_local)
-
-    return niveles_acceso
-
-def calcular_porcentaje_cobro_niveles_acceso(mes_anio, negocio):
-    # Obtener el _id del negocio desde la colección "merchants"
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return None  # El negocio no fue encontrado
-
-    merchant_id = merchant["_id"]
-
-    # Obtener los niveles de acceso y plan_ids asociados al negocio
-    niveles_acceso_y_plan_ids = obtener_niveles_acceso_y_plan_ids(negocio)
-
-    if not niveles_acceso_y_plan_ids:
-        return None  # No se encontraron niveles de acceso
-
-    # Parsear el mes-año en una fecha
-    month, year = map(int, mes_anio.split('-'))
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_fin_mes = fecha_inicio_mes + relativedelta.relativedelta(months=1)
-
-    # Consultar las boletas cobradas para el mes-año y negocio especificados
-    query = {
-        "merchant_id": merchant_id,
-        "status": "approved",
-        "$or": [
-            {"plan_id": {"$in": niveles_acceso_y_plan_ids["Local"]}},
-            {"plan_id": {"$in": niveles_acceso_y_plan_ids["Plus"]}},
-            {"plan_id": {"$in": niveles_acceso_y_plan_ids["Total"]}},
-        ],
-        "$or": [
-            {"date_created": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes}},
-            {"original_payment_date": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes}},
-        ],
-    }
-
-    # Obtener las boletas que coinciden con la consulta
-    boletas = db.boletas.find(query)
-
-    # Calcular el monto total cobrado por cada nivel de acceso
+def porcentajes_niveles_acceso(totales_por_plan, clasificacion_planes):
+    # Porcentaje cobrado por nivel de acceso a partir de lo cobrado por cada plan
     resultados = {
         "Local": 0,
         "Plus": 0,
         "Total": 0
     }
 
-    for boleta in boletas:
-        plan_id = boleta["plan_id"]
-        
-        if plan_id in niveles_acceso_y_plan_ids["Local"]:
-            resultados["Local"] += boleta["charges_detail"]["final_price"]
-        elif plan_id in niveles_acceso_y_plan_ids["Plus"]:
-            resultados["Plus"] += boleta["charges_detail"]["final_price"]
-        elif plan_id in niveles_acceso_y_plan_ids["Total"]:
-            resultados["Total"] += boleta["charges_detail"]["final_price"]
-
-    # Calcular el porcentaje de dinero cobrado por cada nivel de acceso
+    for plan_id, total in totales_por_plan.items():
+        clasificacion = clasificacion_planes.get(plan_id)
+        if clasificacion is None:
+            continue
+        for nivel in resultados:
+            if nivel in clasificacion.niveles:
+                resultados[nivel] += total
+                break  # Si un alias tiene varios niveles, cuenta en el primero
+
     total_cobrado_mes_actual = sum(resultados.values())
-    
-    if total_cobrado_mes_actual > 0:
-        porcentajes = {nivel: (total_cobrado / total_cobrado_mes_actual) * 100 for nivel, total_cobrado in resultados.items()}
-    else:
-        porcentajes = None
 
-    return porcentajes
+    if total_cobrado_mes_actual > 0:
+        return {nivel: (total_cobrado / total_cobrado_mes_actual) * 100 for nivel, total_cobrado in resultados.items()}
+    return None
 
-@graficos.get("/porcentaje_cobro/{negocio}/{mes_anio}", response_model=GraficosResponse, tags=["Gráficos de torta"])
-def porcentaje_cobro(negocio: str, mes_anio: str):
+async def calcular_porcentaje_cobro(negocio, mes_anio):
     datos = {
-        "Porcentaje de dinero cobrado por tipo de cobro": calcular_porcentaje_cobro_tipos_cobro(mes_anio, negocio),
-        "Porcentaje de dinero cobrado por niveles de acceso": calcular_porcentaje_cobro_niveles_acceso(mes_anio, negocio)
+        "Porcentaje de dinero cobrado por tipo de cobro": None,
+        "Porcentaje de dinero cobrado por niveles de acceso": None
     }
 
+    # Obtener el negocio, sus tipos de cobro y niveles de acceso desde el catálogo compartido
+    metadatos = await catalogo.obtener(negocio)
+    if not metadatos:
+        return datos  # El negocio no fue encontrado
+
+    # Límites del mes
+    mes = MesAnio.de(mes_anio)
+
+    # Solo interesan las boletas de los planes del negocio (por _id o por sede_local)
+    plan_ids = list(metadatos.clasificacion_planes)
+
+    totales_por_plan = await repositorio.actual.totales_por_plan(metadatos.merchant_id, plan_ids, mes.inicio, mes.fin)
+
+    # Ambos gráficos salen de los mismos totales por plan
+    datos["Porcentaje de dinero cobrado por tipo de cobro"] = porcentajes_tipos_cobro(totales_por_plan, metadatos.clasificacion_planes)
+    datos["Porcentaje de dinero cobrado por niveles de acceso"] = porcentajes_niveles_acceso(totales_por_plan, metadatos.clasificacion_planes)
+
+    return datos
+
+async def responder_porcentaje_cobro(negocio, mes_anio):
+    # Si el mes ya está precalculado en la colección de rollups lo leemos de ahí
+    datos = await leer_rollup(negocio, mes_anio, "graficos")
+    if datos is None:
+        datos = await calcular_porcentaje_cobro(negocio, mes_anio)
+
     if all(value == 0 for value in datos.values()):
         # Manejo de error si los datos no se encuentran
         raise HTTPException(status_code=404, detail="No se encontraron datos para el negocio y mes especificados")
 
     # Devolvemos los datos como una respuesta JSON
-    return JSONResponse(content=datos)
\ No newline at end of file
+    return JSONResponse(content=datos)
+
+@graficos.get("/porcentaje_cobro/{negocio}/{mes_anio}", response_model=GraficosResponse, tags=["Gráficos de torta"])
+async def porcentaje_cobro(request: Request, negocio: str, mes_anio: MesAnio):
+    # La respuesta se guarda en el caché con su ETag; los meses cerrados no cambian más
+    return await cache_respuestas.responder(request, "porcentaje_cobro", negocio, mes_anio, lambda: responder_porcentaje_cobro(negocio, mes_anio))
\ No newline at end of file
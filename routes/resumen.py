@@ -1,292 +1,163 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import JSONResponse
 
-from config.db import client
-
-from datetime import datetime, timedelta
-from dateutil import relativedelta
+from datetime import datetime
 
 from models.responses import ResumenMesResponse
+from services import repositorio
+from services.cache_respuestas import cache_respuestas
+from services.catalogo import catalogo
+from services.meses import MesAnio
+from services.rollups import leer_rollup
 
 resumen = APIRouter()
 
-# Seleccionamos la base de datos:
-db = client.challenge_set
-
-def clientes_activos(mes, negocio):
-    
-    month, year = map(int, mes.split('-'))
-
-    # Obtenemos el _id del negocio desde la colección merchants
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return 0  # El negocio no fue encontrado
-
-    merchant_id = merchant["_id"]
-
-    # Obtenemos los _id de planes asociados a ese negocio desde la colección planes
-    planes_ids = [plan["_id"] for plan in db.planes.find({"merchant_id": merchant_id}, {"_id": 1})]
-
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_fin_mes = min(fecha_inicio_mes + relativedelta.relativedelta(months=1), datetime(2023, 6, 11))
-
-    query = {
-        "$and": [
-            {
-                "$or": [
-                    {
-                        "history": {
-                            "$elemMatch": {
-                                "event": "alta",
-                                "date_created": {"$lt": fecha_fin_mes}
-                            }
-                        }
-                    },
-                    {
-                        "history": {
-                            "$elemMatch": {
-                                "event": "inactivacion",
-                                "date_created": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes}
-                            }
-                        }
-                    }
-                ]
-            },
-            {
-                "history": {
-                    "$not": {
-                        "$elemMatch": {
-                            "event": {"$in": ["baja", "inactivacion"]},
-                            "date_created": {"$lt": fecha_inicio_mes}
-                        }
-                    }
-                }
-            },
-            {
-                "history.plan": {"$in": planes_ids}  # Filtramos por los planes del negocio
-            }
-        ]
+def eventos_del_historial(eventos, desde=None, hasta=None):
+    # Expresión de agregación con los eventos del historial que cumplen lo mismo que
+    # {"$elemMatch": {"event": {"$in": eventos}, "date_created": {"$gte": desde, "$lt": hasta}}}
+    condiciones = [{"$in": ["$$evento.event", eventos]}]
+    if desde is None and hasta is not None:
+        # En una expresión null o un campo faltante son "menores" que cualquier fecha; como en
+        # $elemMatch, solo cuentan los eventos cuya fecha es efectivamente una fecha
+        desde = datetime.min
+    if desde is not None:
+        condiciones.append({"$gte": ["$$evento.date_created", desde]})
+    if hasta is not None:
+        condiciones.append({"$lt": ["$$evento.date_created", hasta]})
+
+    return {
+        "$filter": {
+            "input": {"$ifNull": ["$history", []]},
+            "as": "evento",
+            "cond": {"$and": condiciones}
+        }
     }
 
-    clientes_count = db.clientes.count_documents(query)  # Obtenemos la cantidad de clientes activos
-    return clientes_count
-
-def porcentaje_variacion_socios_activos_mes_negocio(mes, negocio):
-    month, year = map(int, mes.split('-'))
-    
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_inicio_mes_anterior = fecha_inicio_mes - relativedelta.relativedelta(months=1)
-    
-    clientes_activos_mes_actual = clientes_activos(mes, negocio)
-    clientes_activos_mes_anterior = clientes_activos(fecha_inicio_mes_anterior.strftime("%m-%Y"), negocio)
-    
-    if clientes_activos_mes_anterior > 0:
-        variacion_porcentaje = ((clientes_activos_mes_actual - clientes_activos_mes_anterior) / clientes_activos_mes_anterior) * 100
-    else:
-        variacion_porcentaje = 0
-    
-    return variacion_porcentaje
-
-def cantidad_altas_mes(mes, negocio):
-    month, year = map(int, mes.split('-'))
-
-    # Obtenemos el _id del negocio desde la colección merchants
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return 0  # El negocio no fue encontrado
-
-    merchant_id = merchant["_id"]
-
-    # Obtenemos los _id de planes asociados a ese negocio desde la colección planes
-    planes_ids = [plan["_id"] for plan in db.planes.find({"merchant_id": merchant_id}, {"_id": 1})]
-
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_fin_mes = min(fecha_inicio_mes + relativedelta.relativedelta(months=1), datetime(2023, 6, 11))
-
-    query = {
-        "$and": [
-            {
-                "history": {
-                    "$elemMatch": {
-                        "event": "alta",
-                        "date_created": {"$gte": fecha_inicio_mes, "$lt": fecha_fin_mes}
-                    }
-                }
-            },
-            {
-                "history": {
-                    "$not": {
-                        "$elemMatch": {
-                            "event": {"$in": ["baja", "inactivacion"]},
-                            "date_created": {"$lt": fecha_inicio_mes}
-                        }
-                    }
-                }
-            },
-            {
-                "history.plan": {"$in": planes_ids}  # Filtramos por los planes del negocio
-            }
-        ]
+def existe_evento(eventos, desde=None, hasta=None):
+    return {"$gt": [{"$size": eventos_del_historial(eventos, desde, hasta)}, 0]}
+
+def no_existe_evento(eventos, desde=None, hasta=None):
+    return {"$eq": [{"$size": eventos_del_historial(eventos, desde, hasta)}, 0]}
+
+def condiciones_movimientos_mes(mes):
+    # Condiciones de cada métrica sobre el historial de un cliente, para evaluarse dentro de una agregación:
+    #   activos: alguna alta antes del fin del mes o una inactivación en el mes, y ninguna baja ni inactivación anterior al mes
+    #   altas: alguna alta en el mes, y ninguna baja ni inactivación anterior al mes
+    #   bajas: alguna baja antes del fin del mes, y ninguna inactivación anterior al mes
+    #   inactivaciones: alguna inactivación antes del fin del mes, y ninguna baja anterior al mes
+    # Los datos llegan hasta FECHA_CORTE_DATOS: el fin del mes se recorta a esa fecha
+    mes = MesAnio.de(mes)
+    fecha_inicio_mes, fecha_fin_mes = mes.inicio, mes.fin_datos
+
+    return {
+        "activos": {
+            "$and": [
+                {
+                    "$or": [
+                        existe_evento(["alta"], hasta=fecha_fin_mes),
+                        existe_evento(["inactivacion"], desde=fecha_inicio_mes, hasta=fecha_fin_mes),
+                    ]
+                },
+                no_existe_evento(["baja", "inactivacion"], hasta=fecha_inicio_mes),
+            ]
+        },
+        "altas": {
+            "$and": [
+                existe_evento(["alta"], desde=fecha_inicio_mes, hasta=fecha_fin_mes),
+                no_existe_evento(["baja", "inactivacion"], hasta=fecha_inicio_mes),
+            ]
+        },
+        "bajas": {
+            "$and": [
+                existe_evento(["baja"], hasta=fecha_fin_mes),
+                no_existe_evento(["inactivacion"], hasta=fecha_inicio_mes),
+            ]
+        },
+        "inactivaciones": {
+            "$and": [
+                existe_evento(["inactivacion"], hasta=fecha_fin_mes),
+                no_existe_evento(["baja"], hasta=fecha_inicio_mes),
+            ]
+        },
     }
 
-    altas_count = db.clientes.count_documents(query)  # Obtenemos la cantidad de altas de clientes activos
-    return altas_count
-
-def porcentaje_variacion_altas(mes, negocio):
-    month, year = map(int, mes.split('-'))
-    
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_inicio_mes_anterior = fecha_inicio_mes - relativedelta.relativedelta(months=1)
-    
-    altas_mes_actual = cantidad_altas_mes(mes, negocio)  # Cambio de nombre de la variable
-    altas_mes_anterior = cantidad_altas_mes(fecha_inicio_mes_anterior.strftime("%m-%Y"), negocio)  # Cambio de nombre de la variable
-    
-    if altas_mes_anterior > 0:
-        variacion_porcentaje = ((altas_mes_actual - altas_mes_anterior) / altas_mes_anterior) * 100
-    else:
-        variacion_porcentaje = 0
-    
-    return variacion_porcentaje
-
-def cantidad_bajas_mes(mes, negocio):
-    month, year = map(int, mes.split('-'))
-
-    # Obtenemos el _id del negocio desde la colección merchants
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return 0  # El negocio no fue encontrado
-
-    merchant_id = merchant["_id"]
-
-    # Obtenemos los _id de planes asociados a ese negocio desde la colección planes
-    planes_ids = [plan["_id"] for plan in db.planes.find({"merchant_id": merchant_id}, {"_id": 1})]
-
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_fin_mes = min(fecha_inicio_mes + relativedelta.relativedelta(months=1), datetime(2023, 6, 11))
-
-    query = {
-        "$and": [
-            {
-                "history": {
-                    "$elemMatch": {
-                        "event": "baja",
-                        "date_created": {"$lt": fecha_fin_mes}
-                    }
-                }
-            },
-            {
-                "history": {
-                    "$not": {
-                        "$elemMatch": {
-                            "event": {"$in": ["inactivacion"]},
-                            "date_created": {"$lt": fecha_inicio_mes}
-                        }
-                    }
-                }
-            },
-            {
-                "history.plan": {"$in": planes_ids}  # Filtramos por los planes del negocio
-            }
-        ]
+def acumuladores_movimientos(meses, agrupar_por=None):
+    # Acumuladores de $group: cada cliente suma 1 en cada métrica y mes cuya condición cumple
+    acumuladores = {"_id": agrupar_por}
+    for indice, mes in enumerate(meses):
+        for metrica, condicion in condiciones_movimientos_mes(mes).items():
+            acumuladores[f"{metrica}_{indice}"] = {"$sum": {"$cond": [condicion, 1, 0]}}
+    return acumuladores
+
+def leer_movimientos(fila, meses):
+    # Convierte una fila agrupada con acumuladores_movimientos en {mes: {métrica: cantidad}}
+    return {
+        mes: {
+            metrica: fila.get(f"{metrica}_{indice}", 0)
+            for metrica in ("activos", "altas", "bajas", "inactivaciones")
+        }
+        for indice, mes in enumerate(meses)
     }
 
-    bajas_count = db.clientes.count_documents(query)  # Obtenemos la cantidad de bajas de clientes activos
-    return bajas_count
-
-def porcentaje_variacion_bajas(mes, negocio):
-    month, year = map(int, mes.split('-'))
-    
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_inicio_mes_anterior = fecha_inicio_mes - relativedelta.relativedelta(months=1)
-    
-    bajas_mes_actual = cantidad_bajas_mes(mes, negocio)  # Cambio de nombre de la variable
-    bajas_mes_anterior = cantidad_bajas_mes(fecha_inicio_mes_anterior.strftime("%m-%Y"), negocio)  # Cambio de nombre de la variable
-    
-    if bajas_mes_anterior > 0:
-        variacion_porcentaje = ((bajas_mes_actual - bajas_mes_anterior) / bajas_mes_anterior) * 100
-    else:
-        variacion_porcentaje = 0
-    
-    return variacion_porcentaje
-
-def cantidad_inactivaciones_sin_baja_mes(mes, negocio):
-    month, year = map(int, mes.split('-'))
-
-    # Obtenemos el _id del negocio desde la colección merchants
-    merchant = db.merchants.find_one({"name": negocio})
-    if not merchant:
-        return 0  # El negocio no fue encontrado
-
-    merchant_id = merchant["_id"]
+def pipeline_movimientos_meses(planes_ids, meses):
+    # Una sola pasada por los clientes del negocio: cada cliente se clasifica como activo, alta,
+    # baja o inactivación sin baja en todos los meses a la vez
+    return [
+        {"$match": {"history.plan": {"$in": planes_ids}}},  # Filtramos por los planes del negocio
+        {"$group": acumuladores_movimientos(meses)}
+    ]
+
+async def contar_movimientos_meses(planes_ids, meses):
+    # El repositorio activo (MongoDB, snapshot columnar o memoria) cuenta todos los meses de una vez
+    return await repositorio.actual.contar_movimientos(planes_ids, meses)
+
+def calcular_variacion(actual, anterior):
+    # Variación porcentual respecto al mes anterior (0 si el mes anterior no tuvo movimientos)
+    if anterior > 0:
+        return ((actual - anterior) / anterior) * 100
+    return 0
+
+def armar_resumen_mes(mes_actual, mes_anterior):
+    return {
+        "Cantidad de socios activos del mes": mes_actual["activos"],
+        "% variación de socios activos respecto al mes anterior": calcular_variacion(mes_actual["activos"], mes_anterior["activos"]),
+        "Cantidad de altas del mes": mes_actual["altas"],
+        "% variación de altas respecto al mes anterior": calcular_variacion(mes_actual["altas"], mes_anterior["altas"]),
+        "Cantidad de bajas del mes": mes_actual["bajas"],
+        "% variación de bajas respecto al mes anterior": calcular_variacion(mes_actual["bajas"], mes_anterior["bajas"]),
+        "Cantidad de inactivaciones sin baja del mes": mes_actual["inactivaciones"],
+        "% variación de inactivaciones sin baja respecto al mes anterior": calcular_variacion(mes_actual["inactivaciones"], mes_anterior["inactivaciones"]),
+    }
 
-    # Obtenemos los _id de planes asociados a ese negocio desde la colección planes
-    planes_ids = [plan["_id"] for plan in db.planes.find({"merchant_id": merchant_id}, {"_id": 1})]
+async def calcular_resumen_mes(negocio, mes_anio):
+    mes_anterior = MesAnio.de(mes_anio).anterior
 
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_fin_mes = min(fecha_inicio_mes + relativedelta.relativedelta(months=1), datetime(2023, 6, 11))
+    # Obtenemos el negocio y los _id de sus planes desde el catálogo compartido
+    metadatos = await catalogo.obtener(negocio)
+    planes_ids = list(metadatos.planes_ids) if metadatos else []  # Sin negocio, todo queda en 0
 
-    query = {
-        "$and": [
-            {
-                "history": {
-                    "$elemMatch": {
-                        "event": "inactivacion",
-                        "date_created": {"$lt": fecha_fin_mes}
-                    }
-                }
-            },
-            {
-                "history": {
-                    "$not": {
-                        "$elemMatch": {
-                            "event": {"$in": ["baja"]},
-                            "date_created": {"$lt": fecha_inicio_mes}
-                        }
-                    }
-                }
-            },
-            {
-                "history.plan": {"$in": planes_ids}  # Filtramos por los planes del negocio
-            }
-        ]
-    }
+    # Las ocho métricas (mes actual y anterior) salen de una sola agregación
+    movimientos = await contar_movimientos_meses(planes_ids, [mes_anterior, mes_anio])
 
-    inactivaciones_sin_baja_count = db.clientes.count_documents(query)  # Obtenemos la cantidad de inactivaciones sin baja
-    return inactivaciones_sin_baja_count
+    datos = armar_resumen_mes(movimientos[mes_anio], movimientos[mes_anterior])
 
-def porcentaje_variacion_inactivaciones_sin_bajas(mes, negocio):
-    month, year = map(int, mes.split('-'))
-    
-    fecha_inicio_mes = datetime(year, month, 1)
-    fecha_inicio_mes_anterior = fecha_inicio_mes - relativedelta.relativedelta(months=1)
-    
-    inactivaciones_sin_bajas_mes_actual = cantidad_inactivaciones_sin_baja_mes(mes, negocio)  # Cambio de nombre de la variable
-    inactivaciones_sin_bajas_mes_anterior = cantidad_inactivaciones_sin_baja_mes(fecha_inicio_mes_anterior.strftime("%m-%Y"), negocio)  # Cambio de nombre de la variable
-    
-    if inactivaciones_sin_bajas_mes_anterior > 0:
-        variacion_porcentaje = ((inactivaciones_sin_bajas_mes_actual - inactivaciones_sin_bajas_mes_anterior) / inactivaciones_sin_bajas_mes_anterior) * 100
-    else:
-        variacion_porcentaje = 0
-    
-    return variacion_porcentaje
+    return datos
 
-# Ruta para el objetivo 1 Resumen del mes
-@resumen.get("/resumen_mes/{negocio}/{mes_anio}", response_model=ResumenMesResponse, tags=["Resumen del mes"])
-def movimiento_socios(negocio: str, mes_anio: str):
-    datos = {
-        "Cantidad de socios activos del mes": clientes_activos(mes_anio, negocio),
-        "% variación de socios activos respecto al mes anterior": porcentaje_variacion_socios_activos_mes_negocio(mes_anio, negocio),
-        "Cantidad de altas del mes": cantidad_altas_mes(mes_anio, negocio),
-        "% variación de altas respecto al mes anterior": porcentaje_variacion_altas(mes_anio, negocio),
-        "Cantidad de bajas del mes": cantidad_bajas_mes(mes_anio, negocio),
-        "% variación de bajas respecto al mes anterior": porcentaje_variacion_bajas(mes_anio, negocio),
-        "Cantidad de inactivaciones sin baja del mes": cantidad_inactivaciones_sin_baja_mes(mes_anio, negocio),
-        "% variación de inactivaciones sin baja respecto al mes anterior": porcentaje_variacion_inactivaciones_sin_bajas(mes_anio, negocio),
-    }
+async def responder_resumen_mes(negocio, mes_anio):
+    # Si el mes ya está precalculado en la colección de rollups lo leemos de ahí
+    datos = await leer_rollup(negocio, mes_anio, "resumen")
+    if datos is None:
+        datos = await calcular_resumen_mes(negocio, mes_anio)
 
     if all(value == 0 for value in datos.values()):
         # Manejo de error si los datos no se encuentran
         raise HTTPException(status_code=404, detail="No se encontraron datos para el negocio y mes especificados")
 
     # Devolvemos los datos como una respuesta JSON
-    return JSONResponse(content=datos)
\ No newline at end of file
+    return JSONResponse(content=datos)
+
+# Ruta para el objetivo 1 Resumen del mes
+@resumen.get("/resumen_mes/{negocio}/{mes_anio}", response_model=ResumenMesResponse, tags=["Resumen del mes"])
+async def movimiento_socios(request: Request, negocio: str, mes_anio: MesAnio):
+    # La respuesta se guarda en el caché con su ETag; los meses cerrados no cambian más
+    return await cache_respuestas.responder(request, "resumen_mes", negocio, mes_anio, lambda: responder_resumen_mes(negocio, mes_anio))
\ No newline at end of file
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+
+import asyncio
+import os
+
+from models.responses import ResumenRangoResponse
+from routes.cobros import formatear_cobros_resumen, obtener_totales_cobros_meses, resumir_cobros
+from routes.resumen import armar_resumen_mes, contar_movimientos_meses
+from services.catalogo import catalogo
+from services.meses import MesAnio, meses_entre
+
+tendencias = APIRouter()
+
+# Cantidad máxima de meses por consulta (cada mes agrega condiciones a la agregación de clientes)
+MAX_MESES_RANGO = int(os.getenv('MAX_MESES_RANGO', 36))
+
+# Ruta para los gráficos de tendencia: todos los meses del rango en una pasada por clientes y otra por boletas
+@tendencias.get("/resumen_rango/{negocio}", response_model=ResumenRangoResponse, tags=["Tendencias"])
+async def resumen_rango(negocio: str, desde: MesAnio, hasta: MesAnio):
+    if desde.inicio > hasta.inicio:
+        raise HTTPException(status_code=422, detail="El mes 'desde' debe ser anterior o igual al mes 'hasta'")
+
+    # Incluimos el mes previo a 'desde' para poder calcular la variación del primer mes
+    meses = meses_entre(desde.anterior, hasta)
+    if len(meses) - 1 > MAX_MESES_RANGO:
+        raise HTTPException(status_code=422, detail=f"El rango no puede superar los {MAX_MESES_RANGO} meses")
+
+    metadatos = await catalogo.obtener(negocio)
+    if not metadatos:
+        raise HTTPException(status_code=404, detail="No se encontraron datos para el negocio y mes especificados")
+
+    movimientos, cobros = await asyncio.gather(
+        contar_movimientos_meses(list(metadatos.planes_ids), meses),
+        obtener_totales_cobros_meses(metadatos.merchant_id, meses),
+    )
+
+    # Las variaciones salen de comparar cada mes con el bucket anterior, sin volver a consultar
+    datos = {
+        "negocio": negocio,
+        "meses": [
+            {
+                "mes": mes,
+                "resumen": armar_resumen_mes(movimientos[mes], movimientos[mes_anterior]),
+                "cobros_resumen": formatear_cobros_resumen(resumir_cobros(cobros[mes], cobros[mes_anterior])),
+            }
+            for mes_anterior, mes in zip(meses, meses[1:])
+        ],
+    }
+
+    # Devolvemos los datos como una respuesta JSON
+    return JSONResponse(content=datos)
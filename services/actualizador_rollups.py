@@ -0,0 +1,422 @@
+import argparse
+import asyncio
+import os
+from datetime import datetime
+
+from pymongo.errors import OperationFailure
+
+from config.db import cerrar_cliente, obtener_db
+from services.cache_respuestas import cache_respuestas
+from services.catalogo import catalogo
+from services.meses import FECHA_CORTE_DATOS, MesAnio, meses_entre, texto_por_indice
+from services.rollups import COLECCION_ROLLUPS, ROLLUPS_CONCURRENCIA, actualizar_rollup, clave_rollup, primer_mes_con_cobros
+
+# Colección donde se guardan las marcas de agua y el resume token del change stream
+COLECCION_MARCAS = "rollups_marcas"
+
+ACTUALIZADOR_INTERVALO_SEGUNDOS = float(os.getenv('ACTUALIZADOR_INTERVALO_SEGUNDOS', 60))
+
+# Campos que deciden a qué (negocio, mes) afecta un documento. Un update sin pre-imagen que los toca
+# no dice qué valores tenían antes, así que obliga a recalcular todo.
+CAMPOS_CON_BUCKETS = {
+    "boletas": {"merchant_id", "date_created", "original_payment_date"},
+    "clientes": {"history"},
+    "planes": {"merchant_id"},
+    "merchants": set(),
+}
+
+# Buckets especiales: (merchant_id, TODOS_LOS_MESES) recalcula todos los meses de un negocio y
+# RECONSTRUIR_TODO, todos los meses de todos los negocios
+TODOS_LOS_MESES = None
+RECONSTRUIR_TODO = (None, None)
+
+def mes_de(fecha):
+    return texto_por_indice(fecha.year * 12 + fecha.month - 1)
+
+def mes_siguiente(mes_anio):
+    return MesAnio.de(mes_anio).siguiente
+
+def es_fecha(valor):
+    return isinstance(valor, datetime)
+
+def meses_afectados_por_boleta(boleta):
+    # Una boleta cuenta en el mes de su fecha de cobro (date_created para altas,
+    # original_payment_date para recurrencias) y en los gráficos de cualquiera de
+    # las dos fechas. El mes siguiente también cambia porque su variación la usa.
+    meses = set()
+    for campo in ("date_created", "original_payment_date"):
+        fecha = boleta.get(campo)
+        if es_fecha(fecha):
+            meses.add(mes_de(fecha))
+    return meses | {mes_siguiente(mes) for mes in meses}
+
+def meses_afectados_por_eventos(fechas_eventos, ultimo_mes):
+    # Las cuentas de socios activos y bajas son acumulativas: un evento del mes M
+    # cambia las métricas de M y de todos los meses posteriores
+    if not fechas_eventos:
+        return set()
+    primer_mes = mes_de(min(fechas_eventos))
+    return set(meses_entre(primer_mes, mes_siguiente(ultimo_mes)))
+
+def eventos(cliente):
+    return [evento for evento in (cliente or {}).get("history", []) if isinstance(evento, dict)]
+
+def fechas_de_eventos(lista):
+    return [evento["date_created"] for evento in lista if es_fecha(evento.get("date_created"))]
+
+def planes_de_eventos(lista):
+    return {evento["plan"] for evento in lista if evento.get("plan") is not None}
+
+def clave_evento(evento):
+    return (evento.get("event"), evento.get("date_created"), evento.get("plan"))
+
+def buckets_de_boleta(antes, despues):
+    # Los meses de la boleta antes y después del cambio, cada uno en su negocio
+    return {
+        (boleta["merchant_id"], mes)
+        for boleta in (antes, despues)
+        if boleta is not None and boleta.get("merchant_id") is not None
+        for mes in meses_afectados_por_boleta(boleta)
+    }
+
+def buckets_de_cliente(antes, despues, merchants, ultimo_mes):
+    # Un cliente cuenta para todos los negocios de los planes de su historial, y en cada uno sus
+    # métricas dependen de todos sus eventos. En los negocios que tenía antes y después del cambio,
+    # los meses afectados empiezan en el primer evento que cambió; en los que gana o pierde,
+    # en su primer evento.
+    eventos_antes, eventos_despues = eventos(antes), eventos(despues)
+    claves_antes = {clave_evento(evento) for evento in eventos_antes}
+    claves_despues = {clave_evento(evento) for evento in eventos_despues}
+    cambiados = [evento for evento in eventos_antes + eventos_despues if clave_evento(evento) not in claves_antes & claves_despues]
+
+    negocios_antes = {merchants[plan] for plan in planes_de_eventos(eventos_antes) if plan in merchants}
+    negocios_despues = {merchants[plan] for plan in planes_de_eventos(eventos_despues) if plan in merchants}
+
+    buckets = set()
+    for merchant_id in negocios_antes | negocios_despues:
+        fechas = fechas_de_eventos(cambiados if merchant_id in negocios_antes & negocios_despues else eventos_antes + eventos_despues)
+        buckets |= {(merchant_id, mes) for mes in meses_afectados_por_eventos(fechas, ultimo_mes)}
+    return buckets
+
+async def buckets_de_clientes(cambios, ultimo_mes, db):
+    # cambios: pares (antes, despues) de documentos de clientes
+    planes = set()
+    for antes, despues in cambios:
+        planes |= planes_de_eventos(eventos(antes)) | planes_de_eventos(eventos(despues))
+    merchants = await merchants_de_planes(planes, db)
+
+    buckets = set()
+    for antes, despues in cambios:
+        buckets |= buckets_de_cliente(antes, despues, merchants, ultimo_mes)
+    return buckets
+
+async def leer_marca(nombre, db):
+    documento = await db[COLECCION_MARCAS].find_one({"_id": nombre})
+    return documento["valor"] if documento else None
+
+async def guardar_marca(nombre, valor, db):
+    await db[COLECCION_MARCAS].replace_one({"_id": nombre}, {"valor": valor}, upsert=True)
+
+async def fecha_maxima_boletas(db):
+    # Mayor fecha de cobro registrada en boletas (para inicializar la marca de agua)
+    maximos = []
+    for campo in ("date_created", "original_payment_date"):
+        documento = await db.boletas.find_one({campo: {"$type": "date"}}, {campo: 1}, sort=[(campo, -1)])
+        if documento:
+            maximos.append(documento[campo])
+    return max(maximos) if maximos else None
+
+async def fecha_maxima_eventos(db):
+    # Mayor fecha de evento en el historial de clientes (para inicializar la marca de agua)
+    resultado = await db.clientes.aggregate([
+        {"$unwind": "$history"},
+        {"$group": {"_id": None, "fecha": {"$max": "$history.date_created"}}}
+    ]).to_list(length=1)
+    return resultado[0]["fecha"] if resultado else None
+
+async def id_maximo(coleccion, db):
+    # Último _id insertado (los ObjectId crecen con el momento de inserción)
+    documento = await db[coleccion].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return documento["_id"] if documento else None
+
+async def merchants_de_planes(planes_ids, db):
+    return {
+        plan["_id"]: plan["merchant_id"]
+        async for plan in db.planes.find({"_id": {"$in": list(planes_ids)}}, {"merchant_id": 1})
+    }
+
+async def eliminar_rollups(filtro, db):
+    # Borra los rollups del filtro y devuelve sus (negocio, mes) para descartarlos del caché de respuestas
+    eliminados = {
+        (documento.get("negocio"), documento["_id"]["mes"])
+        async for documento in db[COLECCION_ROLLUPS].find(filtro, {"negocio": 1})
+    }
+    if eliminados:
+        await db[COLECCION_ROLLUPS].delete_many(filtro)
+    return eliminados
+
+async def aplicar_buckets(buckets, ultimo_mes, db=None):
+    # Recalcula desde cero los rollups de los buckets afectados, con el mismo cálculo que usa
+    # construir_rollups, y deja solo los meses que construiría una reconstrucción total: desde el
+    # primer mes con boletas del negocio. Los meses anteriores (o los de un negocio que ya no
+    # existe o no tiene boletas) se borran. Devuelve la cantidad de rollups recalculados.
+    if not buckets:
+        return 0
+
+    db = db if db is not None else obtener_db()
+    if RECONSTRUIR_TODO in buckets:
+        merchant_ids = set(await db.merchants.distinct("_id")) | set(await db[COLECCION_ROLLUPS].distinct("_id.merchant_id"))
+        buckets = {(merchant_id, TODOS_LOS_MESES) for merchant_id in merchant_ids}
+
+    meses_por_merchant = {}
+    for merchant_id, mes_anio in buckets:
+        meses_por_merchant.setdefault(merchant_id, set()).add(mes_anio)
+
+    nombres = {
+        merchant["_id"]: merchant["name"]
+        async for merchant in db.merchants.find({"_id": {"$in": list(meses_por_merchant)}}, {"name": 1})
+    }
+
+    recalcular = []
+    descartados = set()
+    for merchant_id, meses in meses_por_merchant.items():
+        primer_mes = await primer_mes_con_cobros(merchant_id, db) if merchant_id in nombres else None
+        if primer_mes is None:
+            descartados |= await eliminar_rollups({"_id.merchant_id": merchant_id}, db)
+            continue
+
+        if TODOS_LOS_MESES in meses:
+            # Hasta ultimo_mes y además los meses que ya tenían rollup, aunque sean posteriores
+            existentes = await db[COLECCION_ROLLUPS].distinct("_id.mes", {"_id.merchant_id": merchant_id})
+            meses = set(meses_entre(primer_mes, ultimo_mes)) | set(existentes)
+        else:
+            meses = {mes for mes in meses if MesAnio.de(mes).indice <= MesAnio.de(ultimo_mes).indice}
+
+        inicio = MesAnio.de(primer_mes).indice
+        anteriores = [mes for mes in meses if MesAnio.de(mes).indice < inicio]
+        if anteriores:
+            descartados |= await eliminar_rollups({"_id": {"$in": [clave_rollup(merchant_id, mes) for mes in anteriores]}}, db)
+        recalcular.extend((nombres[merchant_id], mes) for mes in meses if MesAnio.de(mes).indice >= inicio)
+
+    semaforo = asyncio.Semaphore(ROLLUPS_CONCURRENCIA)
+
+    async def aplicar(negocio, mes_anio):
+        async with semaforo:
+            return await actualizar_rollup(negocio, mes_anio, db)
+
+    resultados = await asyncio.gather(*[aplicar(negocio, mes_anio) for negocio, mes_anio in recalcular])
+
+    # Las respuestas guardadas de esos meses ya no valen. Solo alcanza a los workers de la API si
+    # comparten el caché con este proceso (CACHE_RESPUESTAS=sqlite con la misma ruta).
+    await cache_respuestas.invalidar_meses(set(recalcular) | {par for par in descartados if par[0] is not None})
+    return sum(resultados)
+
+async def actualizar_por_marcas(db=None):
+    # Una pasada de sondeo: busca documentos insertados después de la marca de _id y eventos o
+    # boletas con fechas posteriores a la marca de fecha, recalcula los buckets afectados y avanza
+    # las marcas. Solo ve altas: las modificaciones y los borrados de documentos existentes necesitan
+    # el change stream (o una reconstrucción con python -m services.rollups).
+    db = db if db is not None else obtener_db()
+    marcas = {}
+    iniciales = {
+        "boletas": fecha_maxima_boletas,
+        "boletas_id": lambda db: id_maximo("boletas", db),
+        "clientes": fecha_maxima_eventos,
+        "clientes_id": lambda db: id_maximo("clientes", db),
+    }
+    for nombre, inicial in iniciales.items():
+        marcas[nombre] = await leer_marca(nombre, db)
+        # La primera vez solo se fija la marca: se asume que los rollups se construyeron desde cero
+        if marcas[nombre] is None:
+            marcas[nombre] = await inicial(db)
+            if marcas[nombre] is not None:
+                await guardar_marca(nombre, marcas[nombre], db)
+    if any(marca is None for marca in marcas.values()):
+        return 0
+
+    nuevas = dict(marcas)
+
+    def avanzar(nombre, valor):
+        if valor is not None and valor > nuevas[nombre]:
+            nuevas[nombre] = valor
+
+    # Boletas nuevas (aunque sus fechas sean anteriores a la marca) o con fechas posteriores
+    buckets = set()
+    consulta_boletas = {"$or": [
+        {"_id": {"$gt": marcas["boletas_id"]}},
+        {"date_created": {"$gt": marcas["boletas"]}},
+        {"original_payment_date": {"$gt": marcas["boletas"]}},
+    ]}
+    proyeccion = {"merchant_id": 1, "date_created": 1, "original_payment_date": 1}
+    async for boleta in db.boletas.find(consulta_boletas, proyeccion):
+        buckets |= buckets_de_boleta(None, boleta)
+        avanzar("boletas_id", boleta["_id"])
+        for campo in ("date_created", "original_payment_date"):
+            if es_fecha(boleta.get(campo)):
+                avanzar("boletas", boleta[campo])
+
+    # Clientes nuevos (todo su historial es nuevo) o con eventos posteriores a la marca, que se
+    # toman como agregados al historial que ya tenían
+    cambios_clientes = []
+    consulta_clientes = {"$or": [
+        {"_id": {"$gt": marcas["clientes_id"]}},
+        {"history.date_created": {"$gt": marcas["clientes"]}},
+    ]}
+    async for cliente in db.clientes.find(consulta_clientes, {"history": 1}):
+        if cliente["_id"] > marcas["clientes_id"]:
+            antes = None
+            avanzar("clientes_id", cliente["_id"])
+        else:
+            antes = {"history": [
+                evento for evento in eventos(cliente)
+                if not (es_fecha(evento.get("date_created")) and evento["date_created"] > marcas["clientes"])
+            ]}
+        for fecha in fechas_de_eventos(eventos(cliente)):
+            avanzar("clientes", fecha)
+        cambios_clientes.append((antes, cliente))
+
+    ultimo_mes = mes_de(max(FECHA_CORTE_DATOS, nuevas["boletas"], nuevas["clientes"]))
+    buckets |= await buckets_de_clientes(cambios_clientes, ultimo_mes, db)
+
+    actualizados = await aplicar_buckets(buckets, ultimo_mes, db)
+
+    # Las marcas avanzan recién después de guardar los rollups: si algo falla, la próxima pasada reintenta
+    for nombre, valor in nuevas.items():
+        if valor != marcas[nombre]:
+            await guardar_marca(nombre, valor, db)
+
+    return actualizados
+
+def campos_modificados(cambio):
+    # Primer segmento de los campos que cambió un update ("history.3.event" -> "history")
+    descripcion = cambio.get("updateDescription") or {}
+    campos = list(descripcion.get("updatedFields", {})) + list(descripcion.get("removedFields", []))
+    campos += [truncado["field"] for truncado in descripcion.get("truncatedArrays", [])]
+    return {campo.split(".")[0] for campo in campos}
+
+def necesita_pre_imagen(cambio):
+    coleccion, operacion = cambio["ns"]["coll"], cambio["operationType"]
+    if operacion == "insert" or coleccion == "merchants":
+        return False  # Un merchant se identifica por su _id, que viene siempre en documentKey
+    if operacion == "update":
+        return bool(campos_modificados(cambio) & CAMPOS_CON_BUCKETS[coleccion])
+    return True  # replace o delete: no se sabe qué tenía el documento
+
+def fechas_de_cambio(cambio):
+    # Fechas de los documentos del cambio, para saber hasta qué mes hay datos
+    fechas = []
+    for documento in (cambio.get("fullDocumentBeforeChange"), cambio.get("fullDocument")):
+        if documento is None:
+            continue
+        fechas += [documento[campo] for campo in ("date_created", "original_payment_date") if es_fecha(documento.get(campo))]
+        fechas += fechas_de_eventos(eventos(documento))
+    return fechas
+
+async def buckets_por_cambio(cambio, ultimo_mes, db):
+    coleccion = cambio["ns"]["coll"]
+    antes = cambio.get("fullDocumentBeforeChange")
+    despues = cambio.get("fullDocument")
+
+    if coleccion in ("merchants", "planes"):
+        catalogo.invalidar()  # Cambiaron los metadatos: el catálogo se vuelve a cargar
+
+    if antes is None and necesita_pre_imagen(cambio):
+        return {RECONSTRUIR_TODO}
+
+    if coleccion == "merchants":
+        return {(cambio["documentKey"]["_id"], TODOS_LOS_MESES)}
+
+    if coleccion == "planes":
+        # Cambian la clasificación de las boletas y los planes del negocio: se recalcula el negocio entero
+        return {
+            (plan["merchant_id"], TODOS_LOS_MESES)
+            for plan in (antes, despues)
+            if plan is not None and plan.get("merchant_id") is not None
+        }
+
+    if coleccion == "boletas":
+        return buckets_de_boleta(antes, despues)
+
+    if antes is None and cambio["operationType"] == "update":
+        return set()  # No tocó el historial: no cambia ninguna métrica
+    return await buckets_de_clientes([(antes, despues)], ultimo_mes, db)
+
+async def procesar_cambios(cambios, db=None):
+    # Aplica un lote de eventos del change stream y devuelve la cantidad de rollups recalculados
+    db = db if db is not None else obtener_db()
+    fechas = [FECHA_CORTE_DATOS]
+    for cambio in cambios:
+        fechas += fechas_de_cambio(cambio)
+    ultimo_mes = mes_de(max(fechas))
+
+    buckets = set()
+    for cambio in cambios:
+        buckets |= await buckets_por_cambio(cambio, ultimo_mes, db)
+    return await aplicar_buckets(buckets, ultimo_mes, db)
+
+async def seguir_cambios(db=None, pre_imagenes=True):
+    # Sigue el change stream de la base (requiere replica set) y aplica los cambios por lotes.
+    # El resume token se guarda después de cada lote para retomar desde ahí al reiniciar.
+    # Con pre_imagenes (MongoDB 6.0+ y changeStreamPreAndPostImages habilitado en las colecciones)
+    # los updates y borrados recalculan solo los meses del documento anterior y del nuevo; sin
+    # pre-imagen, los que tocan fechas, negocios o historiales recalculan todos los rollups.
+    db = db if db is not None else obtener_db()
+
+    pipeline = [{
+        "$match": {
+            "ns.coll": {"$in": ["boletas", "clientes", "merchants", "planes"]},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }
+    }]
+    opciones = {"full_document": "updateLookup", "resume_after": await leer_marca("change_stream", db), "max_await_time_ms": 1000}
+    if pre_imagenes:
+        opciones["full_document_before_change"] = "whenAvailable"
+
+    async with db.watch(pipeline, **opciones) as stream:
+        pendientes = []
+        while stream.alive:
+            cambio = await stream.try_next()
+            if cambio is not None:
+                pendientes.append(cambio)
+                continue
+
+            # No hay más cambios por ahora: aplicamos el lote acumulado
+            if pendientes:
+                await procesar_cambios(pendientes, db)
+                pendientes = []
+            if stream.resume_token is not None:
+                await guardar_marca("change_stream", stream.resume_token, db)
+
+async def ejecutar_actualizador(intervalo=ACTUALIZADOR_INTERVALO_SEGUNDOS, db=None):
+    # Usa change streams si el servidor los soporta, con pre-imágenes si puede (MongoDB 6.0+);
+    # si no, sondea con marcas de agua
+    for pre_imagenes in (True, False):
+        try:
+            return await seguir_cambios(db, pre_imagenes)
+        except OperationFailure:
+            continue
+
+    while True:
+        await actualizar_por_marcas(db)
+        await asyncio.sleep(intervalo)
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantiene los rollups mensuales al día a medida que llegan boletas y eventos.")
+    parser.add_argument("--una-vez", action="store_true", help="Hace una sola pasada de sondeo por marcas de agua y termina.")
+    parser.add_argument("--intervalo", type=float, default=ACTUALIZADOR_INTERVALO_SEGUNDOS, help="Segundos entre pasadas de sondeo.")
+    args = parser.parse_args()
+
+    async def ejecutar():
+        try:
+            if args.una_vez:
+                cantidad = await actualizar_por_marcas()
+                print(f"Rollups actualizados: {cantidad}")
+            else:
+                await ejecutar_actualizador(args.intervalo)
+        finally:
+            cerrar_cliente()
+
+    asyncio.run(ejecutar())
+
+if __name__ == "__main__":
+    main()
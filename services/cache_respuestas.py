@@ -0,0 +1,266 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import os
+import sqlite3
+import time
+
+from fastapi.responses import Response
+
+from services.meses import mes_cerrado
+
+# Backend del caché de respuestas: "memoria" (por worker), "sqlite" (compartido entre workers) o "no"
+CACHE_RESPUESTAS = os.getenv('CACHE_RESPUESTAS', 'memoria')
+CACHE_RESPUESTAS_RUTA = os.getenv('CACHE_RESPUESTAS_RUTA', 'cache_respuestas.sqlite3')
+CACHE_RESPUESTAS_MAX_ENTRADAS = int(os.getenv('CACHE_RESPUESTAS_MAX_ENTRADAS', 1024))
+
+# Vigencia en segundos: los meses cerrados no cambian más, el mes abierto se recalcula seguido
+CACHE_MAX_AGE_CERRADO = int(os.getenv('CACHE_MAX_AGE_CERRADO', 86400))
+CACHE_MAX_AGE_ABIERTO = int(os.getenv('CACHE_MAX_AGE_ABIERTO', 60))
+# Con el actualizador incremental de rollups un mes cerrado todavía puede cambiar: con 0, los navegadores
+# lo revalidan con su ETag al vencer max-age en lugar de tratarlo como inmutable
+CACHE_CERRADO_INMUTABLE = os.getenv('CACHE_CERRADO_INMUTABLE', '1') == '1'
+
+# Rutas cuyas respuestas se guardan por (ruta, negocio, mes)
+RUTAS_MES = ("resumen_mes", "cobros", "cobros_resumen", "porcentaje_cobro")
+
+# Se incrementa cuando cambia el formato de alguna respuesta: las entradas viejas dejan de usarse
+VERSION_CACHE = 1
+
+@dataclass(frozen=True)
+class RespuestaCacheada:
+    contenido: bytes
+    etag: str
+
+class CacheMemoria:
+
+    def __init__(self, max_entradas=CACHE_RESPUESTAS_MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self.entradas = OrderedDict()  # clave -> (vence, respuesta)
+        self.desalojos = 0
+
+    async def obtener(self, clave):
+        entrada = self.entradas.get(clave)
+        if entrada is None:
+            return None
+        if entrada[0] <= time.monotonic():
+            del self.entradas[clave]
+            return None
+
+        self.entradas.move_to_end(clave)
+        return entrada[1]
+
+    async def guardar(self, clave, respuesta, ttl_segundos):
+        self.entradas[clave] = (time.monotonic() + ttl_segundos, respuesta)
+        self.entradas.move_to_end(clave)
+        while len(self.entradas) > self.max_entradas:
+            self.entradas.popitem(last=False)
+            self.desalojos += 1
+
+    async def eliminar(self, claves):
+        for clave in claves:
+            self.entradas.pop(clave, None)
+
+    async def invalidar(self):
+        self.entradas.clear()
+
+    async def tamanio(self):
+        return len(self.entradas)
+
+class CacheSQLite:
+
+    def __init__(self, ruta=CACHE_RESPUESTAS_RUTA, max_entradas=CACHE_RESPUESTAS_MAX_ENTRADAS):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.desalojos = 0
+        with self.conectar() as conexion:
+            # WAL permite que varios workers lean mientras otro escribe
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS respuestas ("
+                "clave TEXT PRIMARY KEY, contenido BLOB NOT NULL, etag TEXT NOT NULL, "
+                "vence REAL NOT NULL, usado REAL NOT NULL)"
+            )
+            conexion.execute("CREATE INDEX IF NOT EXISTS respuestas_por_usado ON respuestas (usado)")
+
+    def conectar(self):
+        # Una conexión por operación: sqlite3 no comparte conexiones entre los hilos de to_thread
+        return sqlite3.connect(self.ruta, timeout=5)
+
+    def _obtener(self, clave):
+        ahora = time.time()
+        with self.conectar() as conexion:
+            fila = conexion.execute(
+                "SELECT contenido, etag FROM respuestas WHERE clave = ? AND vence > ?", (clave, ahora)
+            ).fetchone()
+            if fila is not None:
+                conexion.execute("UPDATE respuestas SET usado = ? WHERE clave = ?", (ahora, clave))
+        return RespuestaCacheada(contenido=fila[0], etag=fila[1]) if fila else None
+
+    def _guardar(self, clave, respuesta, ttl_segundos):
+        ahora = time.time()
+        with self.conectar() as conexion:
+            conexion.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, contenido, etag, vence, usado) VALUES (?, ?, ?, ?, ?)",
+                (clave, respuesta.contenido, respuesta.etag, ahora + ttl_segundos, ahora)
+            )
+            # Primero se descartan las vencidas y después las menos usadas que excedan el máximo
+            conexion.execute("DELETE FROM respuestas WHERE vence <= ?", (ahora,))
+            desalojadas = conexion.execute(
+                "DELETE FROM respuestas WHERE clave IN ("
+                "SELECT clave FROM respuestas ORDER BY usado DESC LIMIT -1 OFFSET ?)",
+                (self.max_entradas,)
+            ).rowcount
+        self.desalojos += max(desalojadas, 0)
+
+    def _eliminar(self, claves):
+        with self.conectar() as conexion:
+            conexion.executemany("DELETE FROM respuestas WHERE clave = ?", [(clave,) for clave in claves])
+
+    def _invalidar(self):
+        with self.conectar() as conexion:
+            conexion.execute("DELETE FROM respuestas")
+
+    def _tamanio(self):
+        with self.conectar() as conexion:
+            return conexion.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+
+    async def obtener(self, clave):
+        return await asyncio.to_thread(self._obtener, clave)
+
+    async def guardar(self, clave, respuesta, ttl_segundos):
+        await asyncio.to_thread(self._guardar, clave, respuesta, ttl_segundos)
+
+    async def eliminar(self, claves):
+        await asyncio.to_thread(self._eliminar, claves)
+
+    async def invalidar(self):
+        await asyncio.to_thread(self._invalidar)
+
+    async def tamanio(self):
+        return await asyncio.to_thread(self._tamanio)
+
+def crear_cache(backend=CACHE_RESPUESTAS):
+    if backend == "memoria":
+        return CacheMemoria()
+    if backend == "sqlite":
+        return CacheSQLite()
+    return None  # Caché desactivado
+
+def clave_respuesta(ruta, negocio, mes_anio):
+    return f"{VERSION_CACHE}:{ruta}:{negocio}:{mes_anio}"
+
+def calcular_etag(contenido):
+    # ETag fuerte: depende solo de los bytes de la respuesta
+    return '"' + hashlib.sha256(contenido).hexdigest()[:32] + '"'
+
+def etag_coincide(if_none_match, etag):
+    # If-None-Match admite una lista de ETags o "*"; se comparan sin el prefijo W/ (comparación débil)
+    if not if_none_match:
+        return False
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato == "*" or candidato.removeprefix("W/") == etag:
+            return True
+    return False
+
+def cabeceras_cache(mes_anio, etag):
+    if mes_cerrado(mes_anio):
+        cache_control = f"public, max-age={CACHE_MAX_AGE_CERRADO}" + (", immutable" if CACHE_CERRADO_INMUTABLE else "")
+    else:
+        cache_control = f"public, max-age={CACHE_MAX_AGE_ABIERTO}"
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+class CacheRespuestas:
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.pendientes = {}  # clave -> cálculo en curso
+        self.aciertos = 0
+        self.fallos = 0
+        self.coalescidas = 0
+        self.no_modificadas = 0
+
+    async def responder(self, request, ruta, negocio, mes_anio, calcular):
+        # Devuelve la respuesta de (ruta, negocio, mes) desde el caché, o la calcula con calcular()
+        # y la guarda si fue exitosa. Si el cliente ya tiene esa versión responde 304 sin cuerpo.
+        clave = clave_respuesta(ruta, negocio, mes_anio)
+
+        respuesta = await self.backend.obtener(clave) if self.backend else None
+        if respuesta is not None:
+            self.aciertos += 1
+        else:
+            respuesta = await self.calcular_una_vez(clave, mes_anio, calcular)
+            if not isinstance(respuesta, RespuestaCacheada):
+                return respuesta  # Los errores no se guardan
+
+        cabeceras = cabeceras_cache(mes_anio, respuesta.etag)
+        if etag_coincide(request.headers.get("if-none-match"), respuesta.etag):
+            self.no_modificadas += 1
+            return Response(status_code=304, headers=cabeceras)
+
+        return Response(content=respuesta.contenido, media_type="application/json", headers=cabeceras)
+
+    async def precalcular(self, ruta, negocio, mes_anio, calcular):
+        # Deja la respuesta en el caché sin una petición (precalentamiento); True si quedó guardada
+        if not self.backend:
+            return False
+        clave = clave_respuesta(ruta, negocio, mes_anio)
+        if await self.backend.obtener(clave) is not None:
+            return True
+        return isinstance(await self.calcular_una_vez(clave, mes_anio, calcular), RespuestaCacheada)
+
+    async def calcular_una_vez(self, clave, mes_anio, calcular):
+        # Las consultas idénticas que llegan mientras otra se está calculando esperan ese mismo
+        # cálculo en lugar de repetir las consultas a MongoDB
+        pendiente = self.pendientes.get(clave)
+        if pendiente is None:
+            self.fallos += 1
+            pendiente = asyncio.ensure_future(self.calcular_y_guardar(clave, mes_anio, calcular))
+            self.pendientes[clave] = pendiente
+            pendiente.add_done_callback(lambda _: self.pendientes.pop(clave, None))
+        else:
+            self.coalescidas += 1
+
+        # shield: si se cancela quien espera, el cálculo compartido sigue para los demás
+        return await asyncio.shield(pendiente)
+
+    async def calcular_y_guardar(self, clave, mes_anio, calcular):
+        calculada = await calcular()
+        if calculada.status_code != 200:
+            return calculada
+
+        respuesta = RespuestaCacheada(contenido=calculada.body, etag=calcular_etag(calculada.body))
+        if self.backend:
+            ttl_segundos = CACHE_MAX_AGE_CERRADO if mes_cerrado(mes_anio) else CACHE_MAX_AGE_ABIERTO
+            await self.backend.guardar(clave, respuesta, ttl_segundos)
+        return respuesta
+
+    async def invalidar(self):
+        if self.backend:
+            await self.backend.invalidar()
+
+    async def invalidar_meses(self, negocios_meses):
+        # Descarta las respuestas de esos (negocio, mes), por ejemplo al recalcular sus rollups
+        if self.backend:
+            await self.backend.eliminar([
+                clave_respuesta(ruta, negocio, mes_anio)
+                for negocio, mes_anio in negocios_meses
+                for ruta in RUTAS_MES
+            ])
+
+    async def estadisticas(self):
+        return {
+            "backend": CACHE_RESPUESTAS if self.backend else "no",
+            "entradas": await self.backend.tamanio() if self.backend else 0,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "coalescidas": self.coalescidas,
+            "en_curso": len(self.pendientes),
+            "no_modificadas": self.no_modificadas,
+            "desalojos": self.backend.desalojos if self.backend else 0,
+        }
+
+# Caché compartido por las rutas del mes
+cache_respuestas = CacheRespuestas(crear_cache())
@@ -0,0 +1,196 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import asyncio
+import os
+import time
+from types import MappingProxyType
+
+from config.db import obtener_db
+from services.metricas import medir_funcion
+
+# Límites del catálogo configurables por entorno
+CATALOGO_MAX_NEGOCIOS = int(os.getenv('CATALOGO_MAX_NEGOCIOS', 256))
+CATALOGO_TTL_SEGUNDOS = float(os.getenv('CATALOGO_TTL_SEGUNDOS', 600))
+
+@dataclass(frozen=True)
+class ClasificacionPlan:
+    cobros: frozenset  # valores de "cobro" (Mensual, Anual) de los planes con ese _id o sede_local
+    niveles: frozenset  # valores de "nivel_de_acceso" (Local, Plus, Total)
+
+@dataclass(frozen=True)
+class MetadatosNegocio:
+    merchant_id: object
+    nombre: str
+    planes_ids: tuple  # _id de los planes del negocio
+    clasificacion_planes: MappingProxyType  # plan_id o sede_local -> ClasificacionPlan
+
+def indexar_planes(planes):
+    # Índice inmutable de cada plan_id (y de su sede_local, que las boletas también usan como plan_id)
+    # a su tipo de cobro y nivel de acceso. Se arma una vez al cargar el negocio en el catálogo.
+    cobros = {}
+    niveles = {}
+
+    for plan in planes:
+        claves = {plan["_id"]}
+        plan_sede_local = plan.get("sede_local", "")  # Si no existe, se toma como cadena vacía
+        if plan_sede_local:
+            claves.add(plan_sede_local)
+
+        for clave in claves:
+            cobros.setdefault(clave, set()).add(plan.get("cobro", ""))
+            niveles.setdefault(clave, set()).add(plan.get("nivel_de_acceso", ""))
+
+    return MappingProxyType({
+        clave: ClasificacionPlan(cobros=frozenset(cobros[clave]), niveles=frozenset(niveles[clave]))
+        for clave in cobros
+    })
+
+@medir_funcion
+async def consultar_metadatos_negocios(negocios, db=None):
+    db = db if db is not None else obtener_db()
+
+    # Una sola consulta trae los negocios junto con sus planes
+    pipeline = [
+        {"$match": {"name": {"$in": list(negocios)}}},
+        {
+            "$lookup": {
+                "from": "planes",
+                "localField": "_id",
+                "foreignField": "merchant_id",
+                "as": "planes"
+            }
+        },
+        {
+            "$project": {
+                "name": 1,
+                "planes._id": 1,
+                "planes.cobro": 1,
+                "planes.nivel_de_acceso": 1,
+                "planes.sede_local": 1
+            }
+        }
+    ]
+
+    metadatos = {}
+    async for merchant in db.merchants.aggregate(pipeline):
+        if merchant["name"] in metadatos:
+            continue  # Ante nombres repetidos se usa el primero, como find_one
+
+        planes = merchant.get("planes", [])
+        metadatos[merchant["name"]] = MetadatosNegocio(
+            merchant_id=merchant["_id"],
+            nombre=merchant["name"],
+            planes_ids=tuple(plan["_id"] for plan in planes),
+            clasificacion_planes=indexar_planes(planes),
+        )
+
+    return metadatos  # Los negocios no encontrados quedan afuera
+
+@medir_funcion
+async def listar_nombres_negocios(db=None):
+    db = db if db is not None else obtener_db()
+    return await db.merchants.distinct("name")
+
+# Caché en memoria de los metadatos de negocios y planes. Resuelve el nombre de un negocio
+# a su merchant_id y a sus planes con una sola consulta, y guarda el resultado con desalojo
+# LRU y vencimiento por TTL. Los negocios inexistentes también se guardan para no repetir
+# la búsqueda. Las consultas concurrentes de un mismo negocio esperan la misma carga.
+# Cada invalidación abre una generación nueva: lo que cargue una consulta empezada antes ya
+# puede estar desactualizado, así que se devuelve a quien la esperaba pero no se guarda.
+class CatalogoNegocios:
+
+    def __init__(self, consultar=consultar_metadatos_negocios, max_negocios=CATALOGO_MAX_NEGOCIOS, ttl_segundos=CATALOGO_TTL_SEGUNDOS):
+        self.consultar = consultar
+        self.max_negocios = max_negocios
+        self.ttl_segundos = ttl_segundos
+        self.entradas = OrderedDict()  # negocio -> (vence, metadatos)
+        self.pendientes = {}  # negocio -> carga en curso
+        self.generacion = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    async def obtener(self, negocio):
+        entrada = self.entradas.get(negocio)
+        if entrada is not None and entrada[0] > time.monotonic():
+            self.entradas.move_to_end(negocio)
+            self.aciertos += 1
+            return entrada[1]
+
+        pendiente = self.pendientes.get(negocio)
+        if pendiente is None:
+            self.fallos += 1
+            pendiente = asyncio.ensure_future(self.cargar(negocio, self.generacion))
+            self.pendientes[negocio] = pendiente
+            pendiente.add_done_callback(lambda tarea: self.quitar_pendiente(negocio, tarea))
+        else:
+            self.aciertos += 1  # Otra consulta ya está cargando este negocio
+
+        # shield: si se cancela quien espera, la carga compartida sigue para los demás
+        return await asyncio.shield(pendiente)
+
+    async def cargar(self, negocio, generacion):
+        metadatos = (await self.consultar([negocio])).get(negocio)
+        self.guardar(negocio, metadatos, generacion)
+        return metadatos
+
+    def quitar_pendiente(self, negocio, tarea):
+        # Solo si sigue siendo la carga registrada: una invalidación pudo reemplazarla por otra
+        if self.pendientes.get(negocio) is tarea:
+            del self.pendientes[negocio]
+
+    async def obtener_varios(self, negocios):
+        # Metadatos de varios negocios: los que no están en caché se cargan juntos en una sola consulta
+        ahora = time.monotonic()
+        metadatos = {}
+        faltantes = []
+
+        for negocio in negocios:
+            entrada = self.entradas.get(negocio)
+            if entrada is not None and entrada[0] > ahora:
+                self.entradas.move_to_end(negocio)
+                self.aciertos += 1
+                metadatos[negocio] = entrada[1]
+            else:
+                self.fallos += 1
+                faltantes.append(negocio)
+
+        if faltantes:
+            generacion = self.generacion
+            cargados = await self.consultar(faltantes)
+            for negocio in faltantes:
+                metadatos[negocio] = cargados.get(negocio)
+                self.guardar(negocio, metadatos[negocio], generacion)
+
+        return metadatos
+
+    def guardar(self, negocio, metadatos, generacion):
+        if generacion != self.generacion:
+            return  # Se cargó antes de una invalidación
+        self.entradas[negocio] = (time.monotonic() + self.ttl_segundos, metadatos)
+        self.entradas.move_to_end(negocio)
+        while len(self.entradas) > self.max_negocios:
+            self.entradas.popitem(last=False)
+            self.desalojos += 1
+
+    def invalidar(self, negocio=None):
+        # Sin argumentos se vacía todo el catálogo (por ejemplo, al modificar planes). Las cargas en
+        # curso se olvidan: las consultas siguientes empiezan una nueva en lugar de esperarlas.
+        self.generacion += 1
+        if negocio is None:
+            self.entradas.clear()
+            self.pendientes.clear()
+        else:
+            self.entradas.pop(negocio, None)
+            self.pendientes.pop(negocio, None)
+
+    def estadisticas(self):
+        return {
+            "negocios": len(self.entradas),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+        }
+
+# Catálogo compartido por todas las rutas
+catalogo = CatalogoNegocios()
@@ -0,0 +1,237 @@
+import os
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow y numpy son opcionales: solo los necesita el motor columnar
+    np = None
+    pa = None
+
+from services.catalogo import MetadatosNegocio, indexar_planes
+from services.metricas import medir_funcion
+from services.snapshot import ruta_tabla
+
+EPOCA = datetime(1970, 1, 1)
+MS_POR_DIA = 86_400_000
+
+def leer_tabla(directorio, tabla):
+    # Arrow IPC se abre con mmap (sin copiar el archivo a memoria); si no está, se lee el Parquet
+    ruta = ruta_tabla(directorio, tabla, "arrow")
+    if os.path.exists(ruta):
+        return pa.ipc.open_file(pa.memory_map(ruta)).read_all()
+    return pq.read_table(ruta_tabla(directorio, tabla, "parquet"), memory_map=True)
+
+def milisegundos(fecha):
+    return (fecha - EPOCA) // timedelta(milliseconds=1)
+
+def mascara(columna):
+    # Columna booleana de Arrow como arreglo de numpy (los nulos cuentan como False)
+    return pc.fill_null(columna, False).to_numpy(zero_copy_only=False)
+
+def fechas_ms(columna):
+    # Fechas como enteros en ms, junto con la máscara de las que existen
+    valores = pc.fill_null(columna.cast(pa.int64()), 0).to_numpy(zero_copy_only=False)
+    return valores, mascara(pc.is_valid(columna))
+
+def contiene(columna, valores):
+    return mascara(pc.is_in(columna, value_set=pa.array([str(valor) for valor in valores], pa.string())))
+
+# Repositorio sobre el snapshot de services/snapshot.py (MOTOR_DATOS=columnar). Responde lo mismo
+# que RepositorioMongo con operaciones vectorizadas sobre columnas (pyarrow + numpy).
+class MotorColumnar:
+
+    def __init__(self, directorio):
+        if pa is None:
+            raise RuntimeError("El motor columnar necesita pyarrow y numpy (pip install pyarrow numpy)")
+
+        from routes.cobros import FUENTES_ALTAS, FUENTES_RECURRENCIAS
+
+        merchants = leer_tabla(directorio, "merchants")
+        planes = leer_tabla(directorio, "planes")
+        historial = leer_tabla(directorio, "historial")
+        boletas = leer_tabla(directorio, "boletas")
+
+        # Negocios y planes son pocos: se guardan como diccionarios
+        self.negocios = {}
+        for merchant_id, nombre in zip(merchants["merchant_id"].to_pylist(), merchants["name"].to_pylist()):
+            self.negocios.setdefault(nombre, merchant_id)  # Ante nombres repetidos se usa el primero
+        self.planes_por_negocio = {}
+        for plan in planes.to_pylist():
+            self.planes_por_negocio.setdefault(plan["merchant_id"], []).append({
+                "_id": plan["plan_id"],
+                "cobro": plan["cobro"],
+                "nivel_de_acceso": plan["nivel_de_acceso"],
+                "sede_local": plan["sede_local"],
+            })
+
+        # Historial: una fila por evento
+        self.h_cliente = historial["cliente"].to_numpy()
+        self.h_plan = historial["plan"]
+        self.h_alta = mascara(pc.equal(historial["event"], "alta"))
+        self.h_baja = mascara(pc.equal(historial["event"], "baja"))
+        self.h_inactivacion = mascara(pc.equal(historial["event"], "inactivacion"))
+        self.h_fecha, self.h_fecha_valida = fechas_ms(historial["date_created"])
+        self.cantidad_clientes = int(self.h_cliente.max()) + 1 if len(self.h_cliente) else 0
+
+        # Boletas: una fila por boleta
+        self.b_merchant = boletas["merchant_id"]
+        self.b_plan = boletas["plan_id"]
+        self.b_aprobada = mascara(pc.equal(boletas["status"], "approved"))
+        self.b_alta = contiene(boletas["source"], FUENTES_ALTAS)
+        self.b_recurrencia = contiene(boletas["source"], FUENTES_RECURRENCIAS)
+        self.b_fecha_alta, self.b_fecha_alta_valida = fechas_ms(boletas["date_created"])
+        self.b_fecha_recurrencia, self.b_fecha_recurrencia_valida = fechas_ms(boletas["original_payment_date"])
+
+        # Los montos se guardan como float64; si todos son enteros, los totales también lo son (como en $sum)
+        self.b_monto = pc.fill_null(boletas["final_price"], 0).to_numpy(zero_copy_only=False)
+        self.montos_enteros = bool(np.all(self.b_monto == np.floor(self.b_monto)))
+
+    def como_montos(self, totales):
+        if self.montos_enteros:
+            return totales.round().astype(np.int64).tolist()
+        return totales.tolist()
+
+    def mongo(self):
+        return None
+
+    @medir_funcion
+    async def consultar_metadatos_negocios(self, negocios):
+        # Misma salida que services.catalogo.consultar_metadatos_negocios, leída del snapshot
+        metadatos = {}
+        for negocio in negocios:
+            merchant_id = self.negocios.get(negocio)
+            if merchant_id is None:
+                continue
+            planes = self.planes_por_negocio.get(merchant_id, [])
+            metadatos[negocio] = MetadatosNegocio(
+                merchant_id=merchant_id,
+                nombre=negocio,
+                planes_ids=tuple(plan["_id"] for plan in planes),
+                clasificacion_planes=indexar_planes(planes),
+            )
+        return metadatos
+
+    @medir_funcion
+    async def contar_movimientos(self, planes_ids, meses):
+        from services.meses import MesAnio
+
+        # Activos, altas, bajas e inactivaciones sin baja de cada mes, con las mismas
+        # condiciones que routes.resumen.condiciones_movimientos_mes
+        seleccionados = np.zeros(self.cantidad_clientes, dtype=bool)
+        seleccionados[self.h_cliente[contiene(self.h_plan, planes_ids)]] = True
+        filas = seleccionados[self.h_cliente]
+
+        clientes, posicion = np.unique(self.h_cliente[filas], return_inverse=True)
+        fecha = self.h_fecha[filas]
+        fecha_valida = self.h_fecha_valida[filas]
+        eventos = {
+            "alta": self.h_alta[filas],
+            "baja": self.h_baja[filas],
+            "inactivacion": self.h_inactivacion[filas],
+        }
+
+        def existe(nombres, desde=None, hasta=None):
+            # Por cliente: si tiene algún evento de esos tipos con fecha en [desde, hasta)
+            condicion = fecha_valida & np.logical_or.reduce([eventos[nombre] for nombre in nombres])
+            if desde is not None:
+                condicion &= fecha >= desde
+            if hasta is not None:
+                condicion &= fecha < hasta
+            return np.bincount(posicion, weights=condicion, minlength=len(clientes)) > 0
+
+        resultados = {}
+        for mes in meses:
+            inicio, fin = milisegundos(MesAnio.de(mes).inicio), milisegundos(MesAnio.de(mes).fin_datos)
+            resultados[mes] = {
+                "activos": int(np.sum(
+                    (existe(["alta"], hasta=fin) | existe(["inactivacion"], desde=inicio, hasta=fin))
+                    & ~existe(["baja", "inactivacion"], hasta=inicio)
+                )),
+                "altas": int(np.sum(existe(["alta"], desde=inicio, hasta=fin) & ~existe(["baja", "inactivacion"], hasta=inicio))),
+                "bajas": int(np.sum(existe(["baja"], hasta=fin) & ~existe(["inactivacion"], hasta=inicio))),
+                "inactivaciones": int(np.sum(existe(["inactivacion"], hasta=fin) & ~existe(["baja"], hasta=inicio))),
+            }
+        return resultados
+
+    def cobros_aprobados(self, merchant_id, fecha_desde, fecha_hasta):
+        # Máscaras de las boletas de routes.cobros.query_cobros_aprobados, separadas en altas y recurrencias
+        # (merchant_id None: las de todos los negocios)
+        desde, hasta = milisegundos(fecha_desde), milisegundos(fecha_hasta)
+        del_negocio = self.b_aprobada
+        if merchant_id is not None:
+            del_negocio = mascara(pc.equal(self.b_merchant, merchant_id)) & del_negocio
+
+        altas = (
+            del_negocio & self.b_alta & self.b_fecha_alta_valida
+            & (self.b_fecha_alta >= desde) & (self.b_fecha_alta < hasta)
+        )
+        recurrencias = (
+            del_negocio & self.b_recurrencia & self.b_fecha_recurrencia_valida
+            & (self.b_fecha_recurrencia >= desde) & (self.b_fecha_recurrencia < hasta)
+        )
+        return altas, recurrencias
+
+    @medir_funcion
+    async def cobros_por_dia(self, merchant_id, fecha_inicio_mes, fecha_fin_mes):
+        altas, recurrencias = self.cobros_aprobados(merchant_id, fecha_inicio_mes, fecha_fin_mes)
+        filas = altas | recurrencias
+
+        # Día de cada boleta según su fecha de cobro, como el $dateTrunc por día
+        dia = np.where(altas, self.b_fecha_alta, self.b_fecha_recurrencia)[filas] // MS_POR_DIA
+        dias, posicion = np.unique(dia, return_inverse=True)
+        monto = self.b_monto[filas]
+
+        totales_altas = self.como_montos(np.bincount(posicion, weights=monto * altas[filas], minlength=len(dias)))
+        totales_recurrencias = self.como_montos(np.bincount(posicion, weights=monto * recurrencias[filas], minlength=len(dias)))
+
+        return [
+            {
+                "fecha": (EPOCA + timedelta(days=int(dia))).strftime("%Y-%m-%d"),
+                "altas": total_altas,
+                "recurrencias": total_recurrencias
+            }
+            for dia, total_altas, total_recurrencias in zip(dias, totales_altas, totales_recurrencias)
+        ]
+
+    @medir_funcion
+    async def totales_cobros(self, merchant_id, meses):
+        from services.meses import limites_meses
+
+        # Total de altas y recurrencias de cada mes
+        resultados = {}
+        for mes in meses:
+            altas, recurrencias = self.cobros_aprobados(merchant_id, *limites_meses([mes]))
+            totales = self.como_montos(np.array([self.b_monto[altas].sum(), self.b_monto[recurrencias].sum()]))
+            resultados[mes] = {"altas": totales[0], "recurrencias": totales[1]}
+        return resultados
+
+    @medir_funcion
+    async def totales_por_plan(self, merchant_id, plan_ids, fecha_inicio_mes, fecha_fin_mes):
+        # Lo cobrado por cada plan, como routes.graficos.pipeline_totales_por_plan
+        inicio, fin = milisegundos(fecha_inicio_mes), milisegundos(fecha_fin_mes)
+        filas = (
+            mascara(pc.equal(self.b_merchant, merchant_id)) & self.b_aprobada & contiene(self.b_plan, plan_ids)
+            & (
+                (self.b_fecha_alta_valida & (self.b_fecha_alta >= inicio) & (self.b_fecha_alta < fin))
+                | (self.b_fecha_recurrencia_valida & (self.b_fecha_recurrencia >= inicio) & (self.b_fecha_recurrencia < fin))
+            )
+        )
+
+        planes = self.b_plan.filter(pa.array(filas)).combine_chunks().dictionary_encode()
+        totales = self.como_montos(np.bincount(
+            planes.indices.to_numpy(zero_copy_only=False), weights=self.b_monto[filas], minlength=len(planes.dictionary)
+        ))
+        return dict(zip(planes.dictionary.to_pylist(), totales))
+
+    @medir_funcion
+    async def negocios_mas_activos(self, limite, fecha_desde, fecha_hasta):
+        # Los negocios con más cobros aprobados en el período (a igual cantidad, por merchant_id)
+        altas, recurrencias = self.cobros_aprobados(None, fecha_desde, fecha_hasta)
+        conteos = pc.value_counts(self.b_merchant.filter(pa.array(altas | recurrencias))).to_pylist()
+        nombres = {merchant_id: negocio for negocio, merchant_id in self.negocios.items()}
+
+        ranking = sorted((-conteo["counts"], str(conteo["values"]), conteo["values"]) for conteo in conteos if conteo["values"] is not None)
+        return [nombres[merchant_id] for _, _, merchant_id in ranking[:limite] if merchant_id in nombres]
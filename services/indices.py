@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import os
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from config.db import cerrar_cliente, obtener_db
+from services.catalogo import catalogo
+from services.meses import MesAnio
+
+INDICES_AL_INICIAR = os.getenv('INDICES_AL_INICIAR', '0') == '1'
+
+# Índices que necesitan las consultas de las rutas, por colección. Los nombres son fijos
+# para que crearlos de nuevo no haga nada (create_indexes es idempotente con la misma definición).
+INDICES = {
+    "boletas": [
+        # routes/cobros.py: altas por date_created, recurrencias por original_payment_date
+        IndexModel(
+            [("merchant_id", ASCENDING), ("status", ASCENDING), ("source", ASCENDING), ("date_created", ASCENDING)],
+            name="cobros_por_date_created"
+        ),
+        IndexModel(
+            [("merchant_id", ASCENDING), ("status", ASCENDING), ("source", ASCENDING), ("original_payment_date", ASCENDING)],
+            name="cobros_por_original_payment_date"
+        ),
+        # routes/graficos.py: boletas de un conjunto de planes, por cualquiera de las dos fechas
+        IndexModel(
+            [("merchant_id", ASCENDING), ("status", ASCENDING), ("plan_id", ASCENDING), ("date_created", ASCENDING)],
+            name="graficos_por_date_created"
+        ),
+        IndexModel(
+            [("merchant_id", ASCENDING), ("status", ASCENDING), ("plan_id", ASCENDING), ("original_payment_date", ASCENDING)],
+            name="graficos_por_original_payment_date"
+        ),
+        # services/actualizador_rollups.py: marcas de agua por fecha (las de _id usan el índice por defecto)
+        IndexModel([("date_created", DESCENDING)], name="marca_date_created"),
+        IndexModel([("original_payment_date", DESCENDING)], name="marca_original_payment_date"),
+    ],
+    "clientes": [
+        # routes/resumen.py: el $match de pipeline_movimientos_meses filtra por history.plan $in (prefijo
+        # del índice); las condiciones sobre history.event / history.date_created se evalúan en el $group.
+        # Los tres campos recorren el mismo arreglo, así que el índice multikey compuesto es válido.
+        IndexModel(
+            [("history.plan", ASCENDING), ("history.event", ASCENDING), ("history.date_created", ASCENDING)],
+            name="historial_plan_evento_fecha"
+        ),
+        IndexModel([("history.date_created", DESCENDING)], name="marca_historial"),
+    ],
+    "planes": [
+        IndexModel([("merchant_id", ASCENDING)], name="planes_por_negocio"),
+    ],
+    "merchants": [
+        IndexModel([("name", ASCENDING)], name="negocio_por_nombre"),
+    ],
+}
+
+async def asegurar_indices():
+    # Crea los índices que falten; devuelve los nombres por colección
+    db = obtener_db()
+
+    creados = {}
+    for coleccion, modelos in INDICES.items():
+        creados[coleccion] = await db[coleccion].create_indexes(modelos)
+    return creados
+
+def consultas_endpoints(metadatos, mes_anio):
+    # Consultas representativas de cada endpoint para un negocio y mes: (nombre, colección, comando)
+    from routes.cobros import etapas_cobros_aprobados
+    from routes.graficos import pipeline_totales_por_plan
+    from routes.resumen import pipeline_movimientos_meses
+
+    mes = MesAnio.de(mes_anio)
+    fecha_inicio_mes, fecha_fin_mes = mes.inicio, mes.fin
+    fecha_inicio_mes_anterior = mes.inicio_anterior
+
+    planes_ids = list(metadatos.planes_ids)
+    meses_resumen = [mes.anterior, mes]
+
+    consultas = [
+        ("resumen_mes: movimientos de clientes", "clientes", pipeline_movimientos_meses(planes_ids, meses_resumen)),
+        ("cobros: cobros por día", "boletas", etapas_cobros_aprobados(metadatos.merchant_id, fecha_inicio_mes, fecha_fin_mes)),
+        ("cobros_resumen: totales", "boletas", etapas_cobros_aprobados(metadatos.merchant_id, fecha_inicio_mes_anterior, fecha_fin_mes)),
+    ]
+
+    consultas.append((
+        "porcentaje_cobro: totales por plan", "boletas",
+        pipeline_totales_por_plan(metadatos.merchant_id, list(metadatos.clasificacion_planes), fecha_inicio_mes, fecha_fin_mes)
+    ))
+
+    return consultas
+
+def etapas_plan(plan):
+    # Recorre el árbol del plan ganador y devuelve sus etapas (COLLSCAN, IXSCAN, FETCH, ...) y los índices usados
+    etapas, indices = [], []
+    pendientes = [plan]
+    while pendientes:
+        nodo = pendientes.pop()
+        if "stage" in nodo:
+            etapas.append(nodo["stage"])
+        if "indexName" in nodo:
+            indices.append(nodo["indexName"])
+        for clave in ("inputStage", "queryPlan"):
+            if clave in nodo:
+                pendientes.append(nodo[clave])
+        pendientes.extend(nodo.get("inputStages", []))
+    return etapas, indices
+
+def resumir_explain(explain):
+    # El explain de una agregación trae el plan arriba o dentro de la primera etapa ($cursor)
+    if "queryPlanner" not in explain and "stages" in explain:
+        explain = explain["stages"][0]["$cursor"]
+
+    etapas, indices = etapas_plan(explain["queryPlanner"]["winningPlan"])
+    estadisticas = explain.get("executionStats", {})
+
+    return {
+        "etapas": etapas,
+        "indices": indices,
+        "collscan": "COLLSCAN" in etapas,
+        "docs_examinados": estadisticas.get("totalDocsExamined"),
+        "claves_examinadas": estadisticas.get("totalKeysExamined"),
+        "docs_devueltos": estadisticas.get("nReturned"),
+        "tiempo_ms": estadisticas.get("executionTimeMillis"),
+    }
+
+async def explicar_endpoints(negocio, mes_anio):
+    # Ejecuta explain("executionStats") de cada consulta de los endpoints y resume su plan
+    db = obtener_db()
+
+    metadatos = await catalogo.obtener(negocio)
+    if not metadatos:
+        return None  # El negocio no fue encontrado
+
+    reporte = []
+    for nombre, coleccion, pipeline in consultas_endpoints(metadatos, mes_anio):
+        explain = await db.command(
+            "explain",
+            {"aggregate": coleccion, "pipeline": pipeline, "cursor": {}},
+            verbosity="executionStats"
+        )
+        reporte.append({"consulta": nombre, "coleccion": coleccion, **resumir_explain(explain)})
+    return reporte
+
+def imprimir_reporte(reporte):
+    for fila in reporte:
+        plan = "COLLSCAN" if fila["collscan"] else "IXSCAN"
+        indices = ", ".join(fila["indices"]) or "-"
+        print(
+            f'{plan:8} {fila["consulta"]:55} indices: {indices:40} '
+            f'examinados: {fila["docs_examinados"]} / devueltos: {fila["docs_devueltos"]} ({fila["tiempo_ms"]} ms)'
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Crea los índices de la API y muestra los planes de sus consultas.")
+    parser.add_argument("--crear", action="store_true", help="Crea los índices que falten.")
+    parser.add_argument("--explain", action="store_true", help="Muestra el plan de cada consulta de los endpoints.")
+    parser.add_argument("--negocio", default="Rokit Body", help="Negocio a usar en el explain.")
+    parser.add_argument("--mes", default="05-2023", help="Mes a usar en el explain (MM-YYYY).")
+    args = parser.parse_args()
+
+    async def ejecutar():
+        try:
+            if args.crear:
+                for coleccion, nombres in (await asegurar_indices()).items():
+                    print(f"{coleccion}: {', '.join(nombres)}")
+            if args.explain:
+                reporte = await explicar_endpoints(args.negocio, args.mes)
+                if reporte is None:
+                    print(f"No se encontró el negocio {args.negocio}")
+                else:
+                    imprimir_reporte(reporte)
+        finally:
+            cerrar_cliente()
+
+    asyncio.run(ejecutar())
+
+if __name__ == "__main__":
+    main()
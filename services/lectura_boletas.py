@@ -0,0 +1,39 @@
+import os
+
+# Documentos por lote al leer boletas con un cursor (menos idas y vueltas al servidor)
+LECTURA_BATCH_SIZE = int(os.getenv('LECTURA_BATCH_SIZE', 10000))
+
+def cursor_liviano(coleccion, query, campos):
+    # find que trae solo los campos indicados y en lotes grandes
+    proyeccion = {"_id": 0}
+    proyeccion.update({campo: 1 for campo in campos})
+    return coleccion.find(query, proyeccion, batch_size=LECTURA_BATCH_SIZE)
+
+async def leer_lotes(cursor):
+    # Entrega los documentos de a lotes: se procesa cada lote y se descarta, sin guardar toda la consulta
+    while True:
+        lote = await cursor.to_list(length=LECTURA_BATCH_SIZE)
+        if not lote:
+            return
+        yield lote
+
+def monto_de(boleta):
+    # charges_detail.final_price como lo suma $sum: si falta, es null o no es un número, suma 0
+    monto = (boleta.get("charges_detail") or {}).get("final_price")
+    return monto if isinstance(monto, (int, float)) and not isinstance(monto, bool) else 0
+
+class AcumuladorPorIndice:
+    # Totales y cantidades de montos en `cantidad` posiciones, sumados lote por lote. Cada boleta ya
+    # llega del driver como dict: pasarlas a listas para sumarlas con numpy cuesta lo mismo que
+    # sumarlas directamente (benchmarks/lectura_boletas.py), así que se usa un bucle simple.
+
+    def __init__(self, cantidad):
+        self.totales = [0] * cantidad
+        self.cantidades = [0] * cantidad
+
+    def sumar(self, lote, indice_de):
+        totales, cantidades = self.totales, self.cantidades
+        for boleta in lote:
+            indice = indice_de(boleta)
+            totales[indice] += monto_de(boleta)
+            cantidades[indice] += 1
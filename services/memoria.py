@@ -0,0 +1,246 @@
+import os
+from datetime import datetime
+
+from bson import json_util
+
+from services.catalogo import MetadatosNegocio, indexar_planes
+from services.lectura_boletas import monto_de
+from services.metricas import medir_funcion
+
+COLECCIONES = ["merchants", "planes", "clientes", "boletas"]
+
+def leer_fixture(directorio):
+    # Un archivo {colección}.json por colección, como los genera mongoexport: un documento en
+    # JSON extendido por línea (o un arreglo con --jsonArray). Las colecciones sin archivo quedan vacías.
+    documentos = {}
+    for coleccion in COLECCIONES:
+        ruta = os.path.join(directorio, f"{coleccion}.json")
+        if not os.path.exists(ruta):
+            documentos[coleccion] = []
+            continue
+
+        with open(ruta, encoding="utf-8") as archivo:
+            contenido = archivo.read()
+        if contenido.lstrip().startswith("["):
+            documentos[coleccion] = json_util.loads(contenido)
+        else:
+            documentos[coleccion] = [json_util.loads(linea) for linea in contenido.splitlines() if linea.strip()]
+
+    return documentos
+
+def documentos_snapshot(directorio):
+    # Reconstruye los documentos (con los campos que usan las rutas) a partir de un snapshot de services/snapshot.py
+    from services.columnar import leer_tabla, pa
+    if pa is None:
+        raise RuntimeError("Leer un snapshot necesita pyarrow (pip install pyarrow)")
+
+    merchants = [
+        {"_id": fila["merchant_id"], "name": fila["name"]}
+        for fila in leer_tabla(directorio, "merchants").to_pylist()
+    ]
+    planes = [
+        {
+            "_id": fila["plan_id"],
+            "merchant_id": fila["merchant_id"],
+            "cobro": fila["cobro"],
+            "nivel_de_acceso": fila["nivel_de_acceso"],
+            "sede_local": fila["sede_local"],
+        }
+        for fila in leer_tabla(directorio, "planes").to_pylist()
+    ]
+
+    historiales = {}
+    for fila in leer_tabla(directorio, "historial").to_pylist():
+        historiales.setdefault(fila["cliente"], []).append(
+            {"event": fila["event"], "date_created": fila["date_created"], "plan": fila["plan"]}
+        )
+    clientes = [{"history": historial} for historial in historiales.values()]
+
+    # El snapshot guarda los montos como float64: los enteros vuelven a ser int, como en MongoDB
+    boletas = [
+        {
+            "merchant_id": fila["merchant_id"],
+            "plan_id": fila["plan_id"],
+            "status": fila["status"],
+            "source": fila["source"],
+            "date_created": fila["date_created"],
+            "original_payment_date": fila["original_payment_date"],
+            "charges_detail": {
+                "final_price": int(fila["final_price"]) if fila["final_price"] is not None and fila["final_price"].is_integer()
+                else fila["final_price"]
+            },
+        }
+        for fila in leer_tabla(directorio, "boletas").to_pylist()
+    ]
+
+    return {"merchants": merchants, "planes": planes, "clientes": clientes, "boletas": boletas}
+
+def es_fecha(valor):
+    return isinstance(valor, datetime)
+
+def en_rango(fecha, desde, hasta):
+    return es_fecha(fecha) and desde <= fecha < hasta
+
+# Repositorio en memoria, sin dependencias: los documentos se indexan una vez al cargar (negocios
+# por nombre, clientes por plan y boletas aprobadas por negocio) y cada consulta recorre solo
+# los clientes o boletas del negocio. Responde lo mismo que RepositorioMongo.
+class RepositorioMemoria:
+
+    def __init__(self, merchants, planes, clientes, boletas):
+        from routes.cobros import FUENTES_ALTAS, FUENTES_RECURRENCIAS
+
+        self.fuentes_altas = set(FUENTES_ALTAS)
+        self.fuentes_recurrencias = set(FUENTES_RECURRENCIAS)
+
+        self.negocios = {}
+        for merchant in merchants:
+            self.negocios.setdefault(merchant.get("name"), merchant["_id"])  # Ante nombres repetidos se usa el primero
+
+        self.planes_por_negocio = {}
+        for plan in planes:
+            self.planes_por_negocio.setdefault(plan.get("merchant_id"), []).append({
+                "_id": plan["_id"],
+                "cobro": plan.get("cobro", ""),
+                "nivel_de_acceso": plan.get("nivel_de_acceso", ""),
+                "sede_local": plan.get("sede_local", ""),
+            })
+
+        # Historial de cada cliente como tuplas (evento, fecha), y los clientes de cada plan
+        self.historiales = []
+        self.clientes_por_plan = {}
+        for cliente in clientes:
+            historial = cliente.get("history") or []
+            numero = len(self.historiales)
+            self.historiales.append([(evento.get("event"), evento.get("date_created")) for evento in historial])
+            for plan in {evento.get("plan") for evento in historial}:
+                self.clientes_por_plan.setdefault(plan, []).append(numero)
+
+        # Boletas aprobadas de cada negocio como tuplas (source, date_created, original_payment_date, plan_id, monto)
+        self.boletas_por_negocio = {}
+        for boleta in boletas:
+            if boleta.get("status") != "approved":
+                continue
+            self.boletas_por_negocio.setdefault(boleta.get("merchant_id"), []).append((
+                boleta.get("source"),
+                boleta.get("date_created"),
+                boleta.get("original_payment_date"),
+                boleta.get("plan_id"),
+                monto_de(boleta),
+            ))
+
+    @classmethod
+    def desde_fixture(cls, directorio):
+        return cls(**leer_fixture(directorio))
+
+    @classmethod
+    def desde_snapshot(cls, directorio):
+        return cls(**documentos_snapshot(directorio))
+
+    def mongo(self):
+        return None
+
+    @medir_funcion
+    async def consultar_metadatos_negocios(self, negocios):
+        metadatos = {}
+        for negocio in negocios:
+            if negocio not in self.negocios:
+                continue
+            merchant_id = self.negocios[negocio]
+            planes = self.planes_por_negocio.get(merchant_id, [])
+            metadatos[negocio] = MetadatosNegocio(
+                merchant_id=merchant_id,
+                nombre=negocio,
+                planes_ids=tuple(plan["_id"] for plan in planes),
+                clasificacion_planes=indexar_planes(planes),
+            )
+        return metadatos
+
+    @medir_funcion
+    async def contar_movimientos(self, planes_ids, meses):
+        from services.meses import MesAnio
+
+        # Clientes con algún evento de los planes del negocio (como {"history.plan": {"$in": planes_ids}})
+        clientes = set()
+        for plan in planes_ids:
+            clientes.update(self.clientes_por_plan.get(plan, ()))
+
+        limites = [(MesAnio.de(mes).inicio, MesAnio.de(mes).fin_datos) for mes in meses]
+        conteos = {mes: {"activos": 0, "altas": 0, "bajas": 0, "inactivaciones": 0} for mes in meses}
+
+        for numero in clientes:
+            historial = self.historiales[numero]
+
+            def existe(eventos, desde=None, hasta=None):
+                # Las mismas condiciones que routes.resumen.existe_evento: solo cuentan las fechas válidas
+                return any(
+                    evento in eventos and es_fecha(fecha)
+                    and (desde is None or fecha >= desde) and (hasta is None or fecha < hasta)
+                    for evento, fecha in historial
+                )
+
+            for mes, (inicio, fin) in zip(meses, limites):
+                conteo = conteos[mes]
+                if (existe(["alta"], hasta=fin) or existe(["inactivacion"], inicio, fin)) and not existe(["baja", "inactivacion"], hasta=inicio):
+                    conteo["activos"] += 1
+                if existe(["alta"], inicio, fin) and not existe(["baja", "inactivacion"], hasta=inicio):
+                    conteo["altas"] += 1
+                if existe(["baja"], hasta=fin) and not existe(["inactivacion"], hasta=inicio):
+                    conteo["bajas"] += 1
+                if existe(["inactivacion"], hasta=fin) and not existe(["baja"], hasta=inicio):
+                    conteo["inactivaciones"] += 1
+
+        return conteos
+
+    def cobros_aprobados(self, merchant_id, fecha_desde, fecha_hasta):
+        # (tipo, fecha de cobro, monto) de las boletas de routes.cobros.query_cobros_aprobados
+        for source, date_created, original_payment_date, _, monto in self.boletas_por_negocio.get(merchant_id, ()):
+            if source in self.fuentes_altas and en_rango(date_created, fecha_desde, fecha_hasta):
+                yield "altas", date_created, monto
+            elif source in self.fuentes_recurrencias and en_rango(original_payment_date, fecha_desde, fecha_hasta):
+                yield "recurrencias", original_payment_date, monto
+
+    @medir_funcion
+    async def cobros_por_dia(self, merchant_id, fecha_inicio_mes, fecha_fin_mes):
+        dias = {}
+        for tipo, fecha, monto in self.cobros_aprobados(merchant_id, fecha_inicio_mes, fecha_fin_mes):
+            totales = dias.setdefault(fecha.strftime("%Y-%m-%d"), {"altas": 0, "recurrencias": 0})
+            totales[tipo] += monto
+
+        return [{"fecha": dia, **dias[dia]} for dia in sorted(dias)]
+
+    @medir_funcion
+    async def totales_cobros(self, merchant_id, meses):
+        from services.meses import limites_meses
+
+        fecha_inicio, fecha_fin = limites_meses(meses)
+        totales = {mes: {"altas": 0, "recurrencias": 0} for mes in meses}
+        for tipo, fecha, monto in self.cobros_aprobados(merchant_id, fecha_inicio, fecha_fin):
+            totales[fecha.strftime("%m-%Y")][tipo] += monto
+
+        return totales
+
+    @medir_funcion
+    async def totales_por_plan(self, merchant_id, plan_ids, fecha_inicio_mes, fecha_fin_mes):
+        # Lo cobrado por cada plan, como routes.graficos.pipeline_totales_por_plan
+        plan_ids = set(plan_ids)
+        totales = {}
+        for _, date_created, original_payment_date, plan_id, monto in self.boletas_por_negocio.get(merchant_id, ()):
+            if plan_id in plan_ids and (
+                en_rango(date_created, fecha_inicio_mes, fecha_fin_mes)
+                or en_rango(original_payment_date, fecha_inicio_mes, fecha_fin_mes)
+            ):
+                totales[plan_id] = totales.get(plan_id, 0) + monto
+
+        return totales
+
+    @medir_funcion
+    async def negocios_mas_activos(self, limite, fecha_desde, fecha_hasta):
+        # Los negocios con más cobros aprobados en el período (a igual cantidad, por merchant_id)
+        nombres = {merchant_id: negocio for negocio, merchant_id in self.negocios.items()}
+        ranking = []
+        for merchant_id in self.boletas_por_negocio:
+            cantidad = sum(1 for _ in self.cobros_aprobados(merchant_id, fecha_desde, fecha_hasta))
+            if cantidad:
+                ranking.append((-cantidad, str(merchant_id), merchant_id))
+
+        return [nombres[merchant_id] for _, _, merchant_id in sorted(ranking)[:limite] if merchant_id in nombres]
@@ -0,0 +1,99 @@
+import functools
+import os
+import re
+from datetime import datetime
+
+from pydantic_core import core_schema
+
+# La base es estática hasta esta fecha (AAAA-MM-DD): los meses que terminan antes no cambian más,
+# y las métricas de socios del mes que la contiene se cuentan solo hasta ella
+FECHA_CORTE_DATOS = datetime.fromisoformat(os.getenv('FECHA_CORTE_DATOS', '2023-06-11'))
+
+PATRON_MES_ANIO = r"^\d{1,2}-\d{4}$"
+
+def inicio_por_indice(indice):
+    # Primer día del mes número `indice` (año * 12 + mes - 1)
+    return datetime(indice // 12, indice % 12 + 1, 1)
+
+def texto_por_indice(indice):
+    # "MM-YYYY" del mes número `indice`. No usa strftime: "%Y" no completa con ceros los años < 1000
+    return f"{indice % 12 + 1:02d}-{indice // 12:04d}"
+
+# Mes "MM-YYYY" validado. Es un str (sirve tal cual de clave del caché, de los rollups y de los
+# resultados por mes) que trae sus límites ya calculados. MesAnio.de() memoiza cada mes: las rutas
+# y los repositorios piden los mismos meses una y otra vez y reciben siempre la misma instancia.
+# Como tipo de un parámetro de FastAPI, un mes inválido se responde con 422 antes de consultar nada.
+class MesAnio(str):
+
+    def __new__(cls, texto):
+        coincidencia = re.fullmatch(r"(\d{1,2})-(\d{4})", str(texto))
+        if coincidencia is None:
+            raise ValueError("El mes debe tener el formato MM-YYYY")
+        month, year = int(coincidencia.group(1)), int(coincidencia.group(2))
+        if not 1 <= month <= 12:
+            raise ValueError("El mes debe estar entre 01 y 12")
+
+        indice = year * 12 + month - 1
+        try:
+            # El mes anterior y el siguiente también tienen que poder representarse
+            inicio_anterior, inicio, fin = (inicio_por_indice(indice + desplazamiento) for desplazamiento in (-1, 0, 1))
+        except ValueError:
+            raise ValueError("El mes está fuera de rango")
+
+        mes = super().__new__(cls, texto_por_indice(indice))  # Siempre con dos dígitos: "5-2023" es "05-2023"
+        mes.month = month
+        mes.year = year
+        mes.indice = indice
+        mes.inicio_anterior = inicio_anterior
+        mes.inicio = inicio
+        mes.fin = fin
+        mes.fin_datos = min(fin, FECHA_CORTE_DATOS)  # Fin del mes recortado a la fecha de corte
+        mes.cerrado = fin <= FECHA_CORTE_DATOS
+        return mes
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def de(texto):
+        return MesAnio(texto)
+
+    @functools.cached_property
+    def anterior(self):
+        return MesAnio.de(texto_por_indice(self.indice - 1))
+
+    @functools.cached_property
+    def siguiente(self):
+        return MesAnio.de(texto_por_indice(self.indice + 1))
+
+    @staticmethod
+    def validar(texto):
+        # Las rutas comparan cada mes con el anterior: ese también tiene que ser un MesAnio válido
+        mes = MesAnio.de(texto)
+        try:
+            mes.anterior
+        except ValueError:
+            raise ValueError("El mes está fuera de rango")
+        return mes
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source, handler):
+        # Parámetro de ruta o de query: se valida el patrón y luego el mes (los ValueError son un 422)
+        return core_schema.no_info_after_validator_function(
+            MesAnio.validar,
+            core_schema.str_schema(pattern=PATRON_MES_ANIO),
+            serialization=core_schema.to_string_ser_schema(),
+        )
+
+def mes_cerrado(mes_anio):
+    return MesAnio.de(mes_anio).cerrado
+
+def meses_entre(desde, hasta):
+    # Lista de meses "MM-YYYY" entre desde y hasta (ambos incluidos)
+    indice_hasta = MesAnio.de(hasta).indice
+    return [
+        MesAnio.de(texto_por_indice(indice))
+        for indice in range(MesAnio.de(desde).indice, indice_hasta + 1)
+    ]
+
+def limites_meses(meses):
+    # Fecha de inicio del primer mes y de fin del último (los meses son consecutivos)
+    return MesAnio.de(meses[0]).inicio, MesAnio.de(meses[-1]).fin
@@ -0,0 +1,292 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+# Instrumentación por petición: cada comando enviado a MongoDB se atribuye a la colección y a la
+# función del repositorio que lo hizo, y cada petición se registra en un histograma por ruta.
+# Agrega trabajo en cada comando y en cada petición, así que se activa a pedido.
+METRICAS = os.getenv('METRICAS', '0') == '1'
+METRICAS_SERVER_TIMING = os.getenv('METRICAS_SERVER_TIMING', '1') == '1'
+LOG_PETICIONES = os.getenv('LOG_PETICIONES', '0') == '1'
+# Medir los bytes obliga a volver a codificar cada respuesta en BSON (el driver no expone su tamaño)
+METRICAS_BYTES = os.getenv('METRICAS_BYTES', '0') == '1'
+
+# Límites (en segundos) de los buckets del histograma de latencias
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Medición de la petición en curso y función instrumentada que se está ejecutando. Motor copia
+# el contexto al hilo que ejecuta cada comando, así que el listener ve los valores de quien consulta.
+medicion_actual = contextvars.ContextVar("medicion_actual", default=None)
+funcion_actual = contextvars.ContextVar("funcion_actual", default="ruta")
+
+logger = logging.getLogger("api.peticiones")
+if LOG_PETICIONES and not logger.handlers:
+    # Una línea JSON por petición en stderr, independiente de la configuración de logging de uvicorn
+    manejador = logging.StreamHandler()
+    manejador.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(manejador)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+class Consultas:
+    # Totales de los comandos por (colección, función) y del tiempo de cada función instrumentada.
+    # Los eventos llegan desde los hilos del driver, por eso se usa un lock.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.por_coleccion = {}  # (colección, función) -> [comandos, documentos, bytes, segundos]
+        self.funciones = {}  # función -> [llamadas, segundos]
+
+    def sumar_comando(self, coleccion, funcion, documentos, bytes_recibidos, segundos):
+        with self.lock:
+            totales = self.por_coleccion.setdefault((coleccion, funcion), [0, 0, 0, 0.0])
+            totales[0] += 1
+            totales[1] += documentos
+            totales[2] += bytes_recibidos
+            totales[3] += segundos
+
+    def sumar_funcion(self, funcion, segundos):
+        with self.lock:
+            totales = self.funciones.setdefault(funcion, [0, 0.0])
+            totales[0] += 1
+            totales[1] += segundos
+
+    def resumen(self):
+        with self.lock:
+            return {
+                "comandos": sum(totales[0] for totales in self.por_coleccion.values()),
+                "documentos": sum(totales[1] for totales in self.por_coleccion.values()),
+                "bytes": sum(totales[2] for totales in self.por_coleccion.values()),
+                "mongo_ms": round(sum(totales[3] for totales in self.por_coleccion.values()) * 1000, 3),
+                "consultas": [
+                    {
+                        "coleccion": coleccion,
+                        "funcion": funcion,
+                        "comandos": totales[0],
+                        "documentos": totales[1],
+                        "bytes": totales[2],
+                        "ms": round(totales[3] * 1000, 3),
+                    }
+                    for (coleccion, funcion), totales in self.por_coleccion.items()
+                ],
+                "funciones": {
+                    funcion: {"llamadas": totales[0], "ms": round(totales[1] * 1000, 3)}
+                    for funcion, totales in self.funciones.items()
+                },
+            }
+
+class MedicionPeticion(Consultas):
+
+    def __init__(self):
+        super().__init__()
+        self.inicio = time.perf_counter()
+
+def medir_funcion(funcion):
+    # Decorador de funciones async: los comandos que hagan se atribuyen a su nombre y se mide su duración
+    @functools.wraps(funcion)
+    async def envoltura(*args, **kwargs):
+        token = funcion_actual.set(funcion.__name__)
+        inicio = time.perf_counter()
+        try:
+            return await funcion(*args, **kwargs)
+        finally:
+            funcion_actual.reset(token)
+            medicion = medicion_actual.get()
+            if medicion is not None:
+                medicion.sumar_funcion(funcion.__name__, time.perf_counter() - inicio)
+    return envoltura
+
+def coleccion_del_comando(comando, nombre):
+    # find, aggregate, distinct, insert... llevan la colección como valor del nombre del comando;
+    # getMore la lleva en "collection"
+    coleccion = comando.get("collection") if nombre == "getMore" else comando.get(nombre)
+    return coleccion if isinstance(coleccion, str) else "-"
+
+def documentos_de_respuesta(respuesta):
+    cursor = respuesta.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if isinstance(respuesta.get("values"), list):
+        return len(respuesta["values"])  # distinct
+    return 0
+
+class MonitorComandos:
+    # Atribuye cada comando a la petición y a la función en curso (por contextvars) y lo suma
+    # también a los totales del worker que se exponen en /metrics. config.db.crear_cliente lo
+    # registra en el cliente envuelto en un monitoring.CommandListener.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pendientes = {}  # request_id del comando -> (colección, función, medición)
+
+    def started(self, event):
+        coleccion = coleccion_del_comando(event.command, event.command_name)
+        with self.lock:
+            self.pendientes[event.request_id] = (coleccion, funcion_actual.get(), medicion_actual.get())
+
+    def succeeded(self, event):
+        bytes_recibidos = 0
+        if METRICAS_BYTES:
+            import bson  # Ya importado por pymongo cuando llegan eventos
+
+            # El tamaño en BSON de la respuesta, que el driver ya decodificó
+            bytes_recibidos = len(bson.encode(event.reply))
+        self.registrar(event, documentos_de_respuesta(event.reply), bytes_recibidos)
+
+    def failed(self, event):
+        self.registrar(event, 0, 0)
+
+    def registrar(self, event, documentos, bytes_recibidos):
+        with self.lock:
+            pendiente = self.pendientes.pop(event.request_id, None)
+        if pendiente is None:
+            return
+
+        coleccion, funcion, medicion = pendiente
+        segundos = event.duration_micros / 1_000_000
+        metricas_worker.consultas.sumar_comando(coleccion, funcion, documentos, bytes_recibidos, segundos)
+        if medicion is not None:
+            medicion.sumar_comando(coleccion, funcion, documentos, bytes_recibidos, segundos)
+
+monitor_comandos = MonitorComandos()
+
+class MetricasWorker:
+    # Histograma de latencias por ruta y totales de comandos de este worker (cada worker de uvicorn tiene los suyos)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.consultas = Consultas()
+        self.latencias = {}  # (método, ruta) -> [conteo por bucket..., +Inf, suma]
+        self.peticiones = {}  # (método, ruta, estado) -> cantidad
+
+    def registrar_peticion(self, metodo, ruta, estado, segundos):
+        with self.lock:
+            histograma = self.latencias.setdefault((metodo, ruta), [0] * (len(BUCKETS_LATENCIA) + 1) + [0.0])
+            for indice, limite in enumerate(BUCKETS_LATENCIA):
+                if segundos <= limite:
+                    histograma[indice] += 1
+            histograma[len(BUCKETS_LATENCIA)] += 1
+            histograma[-1] += segundos
+
+            clave = (metodo, ruta, estado)
+            self.peticiones[clave] = self.peticiones.get(clave, 0) + 1
+
+metricas_worker = MetricasWorker()
+
+def escapar_etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def etiquetas(**valores):
+    return "{" + ",".join(f'{nombre}="{escapar_etiqueta(valor)}"' for nombre, valor in valores.items()) + "}"
+
+def exposicion_prometheus(pool=None):
+    # Métricas en el formato de texto de Prometheus
+    lineas = []
+    with metricas_worker.lock:
+        lineas += [
+            "# HELP http_request_duration_seconds Duración de las peticiones por ruta.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (metodo, ruta), histograma in sorted(metricas_worker.latencias.items()):
+            for limite, cantidad in zip(BUCKETS_LATENCIA, histograma):
+                lineas.append(f"http_request_duration_seconds_bucket{etiquetas(metodo=metodo, ruta=ruta, le=limite)} {cantidad}")
+            lineas.append(f"http_request_duration_seconds_bucket{etiquetas(metodo=metodo, ruta=ruta, le='+Inf')} {histograma[len(BUCKETS_LATENCIA)]}")
+            lineas.append(f"http_request_duration_seconds_sum{etiquetas(metodo=metodo, ruta=ruta)} {histograma[-1]}")
+            lineas.append(f"http_request_duration_seconds_count{etiquetas(metodo=metodo, ruta=ruta)} {histograma[len(BUCKETS_LATENCIA)]}")
+
+        lineas += ["# HELP http_requests_total Peticiones por ruta y estado.", "# TYPE http_requests_total counter"]
+        for (metodo, ruta, estado), cantidad in sorted(metricas_worker.peticiones.items()):
+            lineas.append(f"http_requests_total{etiquetas(metodo=metodo, ruta=ruta, estado=estado)} {cantidad}")
+
+    series = {
+        "mongo_comandos_total": ("Comandos enviados a MongoDB.", 0),
+        "mongo_documentos_total": ("Documentos recibidos de MongoDB.", 1),
+        "mongo_bytes_recibidos_total": ("Bytes (BSON) recibidos de MongoDB.", 2),
+        "mongo_segundos_total": ("Tiempo de los comandos según el driver.", 3),
+    }
+    with metricas_worker.consultas.lock:
+        por_coleccion = sorted(metricas_worker.consultas.por_coleccion.items())
+    for nombre, (ayuda, posicion) in series.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} counter"]
+        for (coleccion, funcion), totales in por_coleccion:
+            lineas.append(f"{nombre}{etiquetas(coleccion=coleccion, funcion=funcion)} {totales[posicion]}")
+
+    if pool is not None:
+        lineas += ["# HELP mongo_pool Uso del pool de conexiones.", "# TYPE mongo_pool gauge"]
+        for nombre, valor in pool.items():
+            lineas.append(f"mongo_pool{etiquetas(dato=nombre)} {valor}")
+
+    return "\n".join(lineas) + "\n"
+
+def server_timing(medicion):
+    # Server-Timing: tiempo total hasta enviar los encabezados, tiempo en MongoDB y el detalle
+    # por colección y función (el tiempo de MongoDB es la suma de los comandos, que pueden solaparse)
+    resumen = medicion.resumen()
+    entradas = [
+        f"app;dur={(time.perf_counter() - medicion.inicio) * 1000:.1f}",
+        f'mongo;dur={resumen["mongo_ms"]:.1f};desc="{resumen["comandos"]} comandos, {resumen["documentos"]} documentos, {resumen["bytes"]} bytes"',
+    ]
+    for consulta in resumen["consultas"]:
+        entradas.append(
+            f'mongo.{consulta["coleccion"]}.{consulta["funcion"]};dur={consulta["ms"]:.1f};'
+            f'desc="{consulta["comandos"]} comandos, {consulta["documentos"]} documentos"'
+        )
+    for funcion, totales in resumen["funciones"].items():
+        entradas.append(f"fn.{funcion};dur={totales['ms']:.1f}")
+    return ", ".join(entradas)
+
+def plantilla_ruta(scope):
+    # Ruta de la app que atendió la petición ("/cobros/{negocio}/{mes_anio}"), para no crear una serie por URL
+    endpoint = scope.get("endpoint")
+    for ruta in scope["app"].routes:
+        if getattr(ruta, "endpoint", None) is endpoint and endpoint is not None:
+            return ruta.path
+    return "sin_ruta"
+
+class MiddlewareMetricas:
+    # Middleware ASGI: abre la medición de la petición, agrega Server-Timing a la respuesta y al
+    # terminar (también en las respuestas que se transmiten) la registra en el histograma y en el log
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        medicion = MedicionPeticion()
+        token = medicion_actual.set(medicion)
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                if METRICAS_SERVER_TIMING:
+                    mensaje["headers"] = list(mensaje.get("headers", [])) + [
+                        (b"server-timing", server_timing(medicion).encode("latin-1"))
+                    ]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            medicion_actual.reset(token)
+            segundos = time.perf_counter() - medicion.inicio
+            ruta = plantilla_ruta(scope)
+            metricas_worker.registrar_peticion(scope["method"], ruta, estado, segundos)
+
+            if LOG_PETICIONES:
+                logger.info(json.dumps({
+                    "metodo": scope["method"],
+                    "ruta": ruta,
+                    "path": scope["path"],
+                    "estado": estado,
+                    "ms": round(segundos * 1000, 3),
+                    **medicion.resumen(),
+                }, ensure_ascii=False))
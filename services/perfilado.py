@@ -0,0 +1,195 @@
+import asyncio
+import cProfile
+import marshal
+import os
+import sys
+import threading
+from collections import Counter
+
+from starlette.routing import Match
+
+# Superficie de depuración: solo existe si DEPURACION_TOKEN está definido (sin él, ni las rutas
+# ni el middleware se registran y no hay ningún costo)
+DEPURACION_TOKEN = os.getenv('DEPURACION_TOKEN', '')
+MUESTREO_MAX_SEGUNDOS = float(os.getenv('MUESTREO_MAX_SEGUNDOS', 60))
+PERFIL_MAX_PETICIONES = int(os.getenv('PERFIL_MAX_PETICIONES', 100))
+
+# Directorio del proyecto: las funciones de routes/, services/ y config/ se muestran con su ruta relativa
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+def es_del_proyecto(archivo):
+    return archivo.startswith(RAIZ) and "site-packages" not in archivo
+
+def nombre_funcion(archivo, funcion):
+    if es_del_proyecto(archivo):
+        archivo = archivo[len(RAIZ):]
+    else:
+        archivo = os.path.basename(archivo)
+    return f"{archivo}:{funcion}"
+
+class Muestreador(threading.Thread):
+    # Cada intervalo toma la pila de todos los hilos (sys._current_frames) y cuenta cada pila.
+    # No instrumenta nada: el costo es solo el del hilo que muestrea mientras dura el perfil.
+
+    def __init__(self, intervalo):
+        super().__init__(name="muestreador", daemon=True)
+        self.intervalo = intervalo
+        self.detener = threading.Event()
+        self.pilas = Counter()  # "hilo;f1;f2;..." -> muestras
+        self.muestras = 0
+
+    def run(self):
+        while not self.detener.wait(self.intervalo):
+            nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+            for ident, marco in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                pila = []
+                while marco is not None:
+                    pila.append(nombre_funcion(marco.f_code.co_filename, marco.f_code.co_name))
+                    marco = marco.f_back
+                pila.append(nombres.get(ident, str(ident)))
+                self.pilas[";".join(reversed(pila))] += 1
+            self.muestras += 1
+
+def agregar_por_funcion(pilas, solo_proyecto=True):
+    # Muestras propias (la función estaba en el tope de la pila) y totales (estaba en algún lugar de la pila)
+    funciones = {}
+    for pila, muestras in pilas.items():
+        marcos = pila.split(";")[1:]  # El primer elemento es el hilo
+        for posicion, marco in enumerate(marcos):
+            if solo_proyecto and not marco.startswith(("routes/", "services/", "config/", "app.py")):
+                continue
+            datos = funciones.setdefault(marco, {"propias": 0, "totales": 0})
+            if posicion == len(marcos) - 1:
+                datos["propias"] += muestras
+        for marco in set(marcos):
+            if marco in funciones:
+                funciones[marco]["totales"] += muestras
+    return dict(sorted(funciones.items(), key=lambda item: -item[1]["totales"]))
+
+def colapsar(pilas):
+    # Formato de pilas colapsadas ("hilo;f1;f2 muestras"), el que leen flamegraph.pl y speedscope
+    return "".join(f"{pila} {muestras}\n" for pila, muestras in pilas.most_common())
+
+bloqueo_muestreo = asyncio.Lock()
+
+async def muestrear(segundos, intervalo):
+    muestreador = Muestreador(intervalo)
+    async with bloqueo_muestreo:
+        muestreador.start()
+        try:
+            await asyncio.sleep(segundos)  # Mientras tanto el worker sigue atendiendo peticiones
+        finally:
+            muestreador.detener.set()
+            await asyncio.to_thread(muestreador.join)
+    return muestreador
+
+def funciones_perfil(perfil, solo_proyecto=True, limite=100):
+    # Agregados por función de cProfile (llamadas, tiempo propio y acumulado), por tiempo acumulado
+    perfil.create_stats()
+    funciones = []
+    for (archivo, linea, funcion), (_, llamadas, propio, acumulado, _) in perfil.stats.items():
+        if solo_proyecto and not es_del_proyecto(archivo):
+            continue
+        funciones.append({
+            "funcion": nombre_funcion(archivo, funcion),
+            "linea": linea,
+            "llamadas": llamadas,
+            "propio_ms": round(propio * 1000, 3),
+            "acumulado_ms": round(acumulado * 1000, 3),
+        })
+    funciones.sort(key=lambda funcion: -funcion["acumulado_ms"])
+    return funciones[:limite]
+
+# cProfile de las próximas N peticiones a una ruta. El perfil está activo en el hilo del event loop
+# mientras haya alguna de esas peticiones en curso: si llegan otras peticiones a la vez, su trabajo
+# también queda registrado.
+class PerfilArmado:
+    # Un armado del perfil. Cada petición perfilada guarda el suyo, así que las que terminan
+    # después de cancelarlo (o de armar otro) no tocan los contadores ni el perfil del siguiente.
+
+    def __init__(self, ruta, peticiones):
+        self.ruta = ruta
+        self.peticiones = peticiones
+        self.restantes = peticiones
+        self.activas = 0
+        self.perfil = cProfile.Profile()
+        self.cancelado = False
+
+class PerfilRuta:
+
+    def __init__(self):
+        self.armado = None  # Perfil en curso (None: desactivado)
+        self.resultado = None  # (ruta, peticiones, perfil terminado)
+
+    @property
+    def ruta(self):
+        # Ruta de la app que se perfila (None: desactivado)
+        return self.armado.ruta if self.armado is not None else None
+
+    def armar(self, ruta, peticiones):
+        self.armado = PerfilArmado(ruta, peticiones)
+        self.resultado = None
+
+    def cancelar(self):
+        armado, self.armado = self.armado, None
+        if armado is None:
+            return
+        armado.cancelado = True
+        if armado.activas:
+            armado.perfil.disable()
+
+    def comenzar(self, scope):
+        # El armado en el que entra esta petición, o None si no se perfila
+        armado = self.armado
+        if armado is None or armado.restantes == 0 or armado.ruta.matches(scope)[0] != Match.FULL:
+            return None
+        armado.restantes -= 1
+        armado.activas += 1
+        if armado.activas == 1:
+            armado.perfil.enable()
+        return armado
+
+    def terminar(self, armado):
+        armado.activas -= 1
+        if armado.activas > 0 or armado.cancelado:
+            return  # Al cancelarlo ya se desactivó su perfil
+        armado.perfil.disable()
+        if armado.restantes == 0:
+            self.resultado = (armado.ruta.path, armado.peticiones, armado.perfil)
+            self.armado = None
+
+    def estado(self):
+        armado = self.armado
+        return {
+            "ruta": armado.ruta.path if armado else None,
+            "restantes": armado.restantes if armado else 0,
+            "en_curso": armado.activas if armado else 0,
+            "terminado": self.resultado is not None,
+        }
+
+    def pstats(self):
+        # El mismo contenido que escribe Profile.dump_stats, para abrirlo con pstats o snakeviz
+        perfil = self.resultado[2]
+        perfil.create_stats()
+        return marshal.dumps(perfil.stats)
+
+perfil_ruta = PerfilRuta()
+
+class MiddlewarePerfil:
+    # Middleware ASGI del perfil por ruta: sin un perfil armado solo hace una comparación por petición
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        armado = perfil_ruta.comenzar(scope) if perfil_ruta.armado is not None and scope["type"] == "http" else None
+        if armado is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            perfil_ruta.terminar(armado)
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import time
+
+from fastapi import HTTPException
+
+from config.db import MONGO_MIN_POOL_SIZE
+from services import repositorio
+from services.cache_respuestas import cache_respuestas
+from services.catalogo import catalogo
+from services.meses import FECHA_CORTE_DATOS, MesAnio
+from services.rollups import ROLLUPS_CONCURRENCIA
+
+# Precalentamiento al iniciar el worker: abre el pool de MongoDB (resolución SRV, handshakes),
+# carga en el catálogo los negocios con más cobros y opcionalmente deja en el caché de respuestas
+# las rutas del mes actual y el anterior. /estado/listo responde 503 hasta que termina.
+PRECALENTAR = os.getenv('PRECALENTAR', '1') == '1'
+PRECALENTAR_NEGOCIOS = int(os.getenv('PRECALENTAR_NEGOCIOS', 20))
+PRECALENTAR_KPIS = os.getenv('PRECALENTAR_KPIS', '0') == '1'
+PRECALENTAR_REINTENTO_SEGUNDOS = float(os.getenv('PRECALENTAR_REINTENTO_SEGUNDOS', 5))
+PRECALENTAR_MES = os.getenv('PRECALENTAR_MES', FECHA_CORTE_DATOS.strftime("%m-%Y"))  # mes "actual", el último con datos
+
+def meses_precalentados():
+    # El mes actual y el anterior
+    mes = MesAnio.de(PRECALENTAR_MES)
+    return [mes.anterior, mes]
+
+def rutas_precalentadas():
+    # (ruta del caché, función que arma la respuesta) de las rutas del mes
+    from routes.cobros import responder_cobros_por_dia, responder_resumen_cobros_mes
+    from routes.graficos import responder_porcentaje_cobro
+    from routes.resumen import responder_resumen_mes
+
+    return [
+        ("resumen_mes", responder_resumen_mes),
+        ("cobros", responder_cobros_por_dia),
+        ("cobros_resumen", responder_resumen_cobros_mes),
+        ("porcentaje_cobro", responder_porcentaje_cobro),
+    ]
+
+async def abrir_pool(db):
+    # Un ping por conexión mínima del pool: cada uno toma su propia conexión, así que al terminar
+    # ya están resueltos el SRV y la selección de servidor y abiertas MONGO_MIN_POOL_SIZE conexiones
+    await asyncio.gather(*(db.command("ping") for _ in range(max(1, MONGO_MIN_POOL_SIZE))))
+
+async def precalcular_kpis(negocios, meses):
+    semaforo = asyncio.Semaphore(ROLLUPS_CONCURRENCIA)
+    guardadas = 0
+
+    async def precalcular(ruta, responder, negocio, mes_anio):
+        nonlocal guardadas
+        async with semaforo:
+            try:
+                if await cache_respuestas.precalcular(ruta, negocio, mes_anio, lambda: responder(negocio, mes_anio)):
+                    guardadas += 1
+            except HTTPException:
+                pass  # Sin datos para ese mes: la ruta responde 404 y no se guarda
+
+    await asyncio.gather(*(
+        precalcular(ruta, responder, negocio, mes_anio)
+        for negocio in negocios
+        for mes_anio in meses
+        for ruta, responder in rutas_precalentadas()
+    ))
+    return guardadas
+
+class Precalentamiento:
+
+    def __init__(self):
+        self.listo = False
+        self.etapas = {}  # etapa -> {"ms", ...}
+        self.intentos = 0
+        self.error = None
+
+    async def etapa(self, nombre, tarea):
+        inicio = time.perf_counter()
+        resultado = await tarea
+        self.etapas[nombre] = {"ms": round((time.perf_counter() - inicio) * 1000, 1), **(resultado or {})}
+
+    async def ejecutar(self):
+        if not PRECALENTAR:
+            self.listo = True
+            return
+
+        # Sin MongoDB el worker no está listo: se reintenta hasta que el pool abra. El cliente se crea
+        # en un hilo porque crearlo importa el driver y resuelve el SRV de mongodb+srv, que bloquean
+        while True:
+            self.intentos += 1
+            try:
+                db = await asyncio.to_thread(repositorio.actual.mongo)
+                if db is not None:
+                    await self.etapa("pool", abrir_pool(db))
+                break
+            except Exception as error:
+                self.error = f"{type(error).__name__}: {error}"
+                await asyncio.sleep(PRECALENTAR_REINTENTO_SEGUNDOS)
+        self.error = None
+
+        # Lo que sigue es opcional: si falla, el worker queda listo igual y el error se informa
+        try:
+            negocios = []
+            if PRECALENTAR_NEGOCIOS > 0:
+                await self.etapa("negocios", self.cargar_negocios())
+                negocios = self.etapas["negocios"]["nombres"]
+            if PRECALENTAR_KPIS and negocios:
+                await self.etapa("kpis", self.precalcular_kpis(negocios))
+        except Exception as error:
+            self.error = f"{type(error).__name__}: {error}"
+
+        self.listo = True
+
+    async def cargar_negocios(self):
+        # Los negocios con más cobros en el mes actual y el anterior, cargados juntos en el catálogo
+        mes = MesAnio.de(PRECALENTAR_MES)
+        negocios = await repositorio.actual.negocios_mas_activos(PRECALENTAR_NEGOCIOS, mes.inicio_anterior, mes.fin)
+        await catalogo.obtener_varios(negocios)
+        return {"nombres": negocios, "meses": meses_precalentados()}
+
+    async def precalcular_kpis(self, negocios):
+        # Sin caché de respuestas (CACHE_RESPUESTAS=no) no hay dónde guardarlas
+        return {"respuestas": await precalcular_kpis(negocios, meses_precalentados()), "cache": bool(cache_respuestas.backend)}
+
+    def estado(self):
+        return {
+            "listo": self.listo,
+            "degradado": self.listo and self.error is not None,  # Listo, pero alguna etapa opcional falló
+            "intentos": self.intentos,
+            "etapas": self.etapas,
+            "error": self.error,
+        }
+
+precalentamiento = Precalentamiento()
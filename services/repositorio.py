@@ -0,0 +1,207 @@
+import os
+from datetime import timedelta
+
+from fastapi import HTTPException
+
+from config.db import obtener_db
+from services.catalogo import catalogo, consultar_metadatos_negocios
+from services.lectura_boletas import AcumuladorPorIndice, cursor_liviano, leer_lotes
+from services.metricas import medir_funcion
+
+# De dónde leen las rutas: "mongo" (el cluster), "columnar" (snapshot Arrow/Parquet de SNAPSHOT_RUTA),
+# "memoria" (fixture de FIXTURE_RUTA o snapshot, indexado en memoria) o "mongomock" (fixture en mongomock)
+MOTOR_DATOS = os.getenv('MOTOR_DATOS', 'mongo')
+SNAPSHOT_RUTA = os.getenv('SNAPSHOT_RUTA', 'snapshot')
+FIXTURE_RUTA = os.getenv('FIXTURE_RUTA', 'fixture')
+
+# Cómo se arman los cobros por día: "agregacion" agrupa en MongoDB ($dateTrunc, MongoDB 5.0+);
+# "cursor" trae solo los campos necesarios y agrupa en la API
+COBROS_POR_DIA = os.getenv('COBROS_POR_DIA', 'agregacion')
+
+# Todos los repositorios responden las mismas consultas con el mismo formato:
+#   consultar_metadatos_negocios(negocios) -> {negocio: MetadatosNegocio}
+#   contar_movimientos(planes_ids, meses) -> {mes: {"activos", "altas", "bajas", "inactivaciones"}}
+#   cobros_por_dia(merchant_id, fecha_inicio_mes, fecha_fin_mes) -> [{"fecha", "altas", "recurrencias"}]
+#   totales_cobros(merchant_id, meses) -> {mes: {"altas", "recurrencias"}}
+#   totales_por_plan(merchant_id, plan_ids, fecha_inicio_mes, fecha_fin_mes) -> {plan_id: total}
+#   negocios_mas_activos(limite, fecha_desde, fecha_hasta) -> [negocio] por cantidad de cobros aprobados
+#   mongo() -> base de MongoDB (o None si el repositorio no usa MongoDB)
+# Las agregaciones se arman con las funciones de routes/*, que también usan /cadena y services/indices.py.
+class RepositorioMongo:
+
+    def __init__(self, db=None, cobros_por_dia=COBROS_POR_DIA):
+        self.db = db  # None: la base del cliente de config.db
+        self.modo_cobros_por_dia = cobros_por_dia
+
+    def mongo(self):
+        return self.db if self.db is not None else obtener_db()
+
+    async def consultar_metadatos_negocios(self, negocios):
+        return await consultar_metadatos_negocios(negocios, self.mongo())  # Ya instrumentada en services.catalogo
+
+    @medir_funcion
+    async def contar_movimientos(self, planes_ids, meses):
+        from routes.resumen import leer_movimientos, pipeline_movimientos_meses
+
+        # Una sola agregación cuenta las cuatro métricas de todos los meses
+        pipeline = pipeline_movimientos_meses(planes_ids, meses)
+        resultado = await self.mongo().clientes.aggregate(pipeline).to_list(length=1)
+        return leer_movimientos(resultado[0] if resultado else {}, meses)
+
+    @medir_funcion
+    async def cobros_por_dia(self, merchant_id, fecha_inicio_mes, fecha_fin_mes):
+        if self.modo_cobros_por_dia == "cursor":
+            return await self.cobros_por_dia_con_cursor(merchant_id, fecha_inicio_mes, fecha_fin_mes)
+
+        from routes.cobros import etapas_cobros_aprobados
+
+        # Agrupamos los cobros por día dentro de Mongo: la respuesta tiene a lo sumo 31 filas
+        # sin importar cuántas boletas tenga el negocio en el mes
+        pipeline = etapas_cobros_aprobados(merchant_id, fecha_inicio_mes, fecha_fin_mes) + [
+            {
+                "$group": {
+                    "_id": {"$dateTrunc": {"date": "$fecha", "unit": "day"}},
+                    "altas": {"$sum": {"$cond": [{"$eq": ["$tipo", "altas"]}, "$monto", 0]}},
+                    "recurrencias": {"$sum": {"$cond": [{"$eq": ["$tipo", "recurrencias"]}, "$monto", 0]}}
+                }
+            },
+            {"$sort": {"_id": 1}}
+        ]
+
+        return [
+            {
+                "fecha": dia["_id"].strftime("%Y-%m-%d"),
+                "altas": dia["altas"],
+                "recurrencias": dia["recurrencias"]
+            }
+            async for dia in self.mongo().boletas.aggregate(pipeline)
+        ]
+
+    @medir_funcion
+    async def cobros_por_dia_con_cursor(self, merchant_id, fecha_inicio_mes, fecha_fin_mes):
+        from routes.cobros import FUENTES_ALTAS, query_cobros_aprobados
+
+        # Solo viajan la fuente, las dos fechas y el monto de cada boleta
+        campos = ["source", "date_created", "original_payment_date", "charges_detail.final_price"]
+        query = query_cobros_aprobados(merchant_id, fecha_inicio_mes, fecha_fin_mes)
+        cursor = cursor_liviano(self.mongo().boletas, query, campos)
+
+        # Posición de cada boleta: día del mes (0-30) para las altas y 31 + día para las recurrencias
+        fuentes_altas = set(FUENTES_ALTAS)
+
+        def indice_de(boleta):
+            if boleta.get("source") in fuentes_altas:
+                return boleta["date_created"].day - 1
+            return 31 + boleta["original_payment_date"].day - 1
+
+        acumulador = AcumuladorPorIndice(62)
+        async for lote in leer_lotes(cursor):
+            acumulador.sumar(lote, indice_de)
+
+        totales, cantidades = acumulador.totales, acumulador.cantidades
+
+        # Igual que el $group por día: solo aparecen los días con alguna boleta
+        return [
+            {
+                "fecha": (fecha_inicio_mes + timedelta(days=dia)).strftime("%Y-%m-%d"),
+                "altas": totales[dia],
+                "recurrencias": totales[31 + dia]
+            }
+            for dia in range(31)
+            if cantidades[dia] or cantidades[31 + dia]
+        ]
+
+    @medir_funcion
+    async def totales_cobros(self, merchant_id, meses):
+        from routes.cobros import etapas_cobros_aprobados
+        from services.meses import limites_meses
+
+        fecha_inicio, fecha_fin = limites_meses(meses)
+
+        # Una sola agregación recorre las boletas de todos los meses: cada boleta se clasifica
+        # en altas o recurrencias y se suma en el mes que le corresponde según su fecha
+        pipeline = etapas_cobros_aprobados(merchant_id, fecha_inicio, fecha_fin) + [
+            {
+                "$group": {
+                    "_id": {
+                        "tipo": "$tipo",
+                        "mes": {"$dateToString": {"format": "%m-%Y", "date": "$fecha"}}
+                    },
+                    "total": {"$sum": "$monto"}
+                }
+            }
+        ]
+
+        # La agregación devuelve a lo sumo dos filas por mes: altas y recurrencias
+        totales = {mes: {"altas": 0, "recurrencias": 0} for mes in meses}
+        async for fila in self.mongo().boletas.aggregate(pipeline):
+            totales[fila["_id"]["mes"]][fila["_id"]["tipo"]] = fila["total"]
+
+        return totales
+
+    @medir_funcion
+    async def totales_por_plan(self, merchant_id, plan_ids, fecha_inicio_mes, fecha_fin_mes):
+        from routes.graficos import pipeline_totales_por_plan
+
+        pipeline = pipeline_totales_por_plan(merchant_id, plan_ids, fecha_inicio_mes, fecha_fin_mes)
+        return {plan["_id"]: plan["total"] async for plan in self.mongo().boletas.aggregate(pipeline)}
+
+    @medir_funcion
+    async def negocios_mas_activos(self, limite, fecha_desde, fecha_hasta):
+        from routes.cobros import query_cobros_aprobados
+
+        # Los negocios con más cobros aprobados en el período, con su nombre
+        pipeline = [
+            {"$match": query_cobros_aprobados({"$exists": True}, fecha_desde, fecha_hasta)},
+            {"$group": {"_id": "$merchant_id", "cobros": {"$sum": 1}}},
+            {"$sort": {"cobros": -1, "_id": 1}},
+            {"$limit": limite},
+            {"$lookup": {"from": "merchants", "localField": "_id", "foreignField": "_id", "as": "merchant"}},
+            {"$project": {"cobros": 1, "name": {"$first": "$merchant.name"}}},
+            {"$sort": {"cobros": -1, "_id": 1}},
+        ]
+        return [negocio["name"] async for negocio in self.mongo().boletas.aggregate(pipeline) if negocio.get("name")]
+
+async def crear_mongomock(directorio=FIXTURE_RUTA):
+    # RepositorioMongo sobre mongomock con los datos del fixture: sirve para pruebas sin cluster.
+    # mongomock no implementa $dateTrunc, así que los cobros por día se agrupan con el cursor.
+    from mongomock_motor import AsyncMongoMockClient
+    from services.memoria import leer_fixture
+
+    db = AsyncMongoMockClient().challenge_set
+    for coleccion, documentos in leer_fixture(directorio).items():
+        if documentos:
+            await db[coleccion].insert_many(documentos)
+
+    return RepositorioMongo(db=db, cobros_por_dia="cursor")
+
+async def crear_repositorio(motor=MOTOR_DATOS):
+    if motor == "columnar":
+        from services.columnar import MotorColumnar
+        return MotorColumnar(SNAPSHOT_RUTA)
+    if motor == "memoria":
+        from services.memoria import RepositorioMemoria
+        if os.path.isdir(FIXTURE_RUTA):
+            return RepositorioMemoria.desde_fixture(FIXTURE_RUTA)
+        return RepositorioMemoria.desde_snapshot(SNAPSHOT_RUTA)
+    if motor == "mongomock":
+        return await crear_mongomock()
+    return RepositorioMongo()
+
+# Repositorio activo: las rutas consultan siempre a través de él
+actual = RepositorioMongo()
+
+def activar(repositorio):
+    # Cambia el repositorio de las rutas y del catálogo de negocios
+    global actual
+    actual = repositorio
+    catalogo.consultar = repositorio.consultar_metadatos_negocios
+    catalogo.invalidar()
+    return repositorio
+
+def db_mongo():
+    # Base de MongoDB del repositorio activo, para lo que solo existe sobre MongoDB (/cadena, /exportar)
+    db = actual.mongo()
+    if db is None:
+        raise HTTPException(status_code=503, detail="Esta ruta necesita MongoDB y el repositorio de datos activo no lo usa")
+    return db
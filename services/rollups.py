@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import os
+from datetime import datetime
+
+from config.db import cerrar_cliente, obtener_db
+from services import repositorio
+from services.catalogo import catalogo
+from services.meses import FECHA_CORTE_DATOS, mes_cerrado, meses_entre
+from services.metricas import medir_funcion
+
+# Colección con un documento precalculado por (negocio, mes)
+COLECCION_ROLLUPS = "resumen_mensual"
+
+# Se incrementa cuando cambia la forma de calcular alguna métrica: los rollups viejos dejan de usarse
+VERSION_ROLLUP = 1
+
+ROLLUPS_AL_INICIAR = os.getenv('ROLLUPS_AL_INICIAR', '0') == '1'
+# Leer rollups cuesta una búsqueda en el catálogo y un find_one por petición, que solo valen la pena
+# si la colección está construida: por defecto se leen solo si la API misma los completa al iniciar
+ROLLUPS_LECTURA = os.getenv('ROLLUPS_LECTURA', '1' if ROLLUPS_AL_INICIAR else '0') == '1'
+ROLLUPS_TTL_SEGUNDOS = float(os.getenv('ROLLUPS_TTL_SEGUNDOS', 3600))  # vigencia de los meses abiertos
+ROLLUPS_CONCURRENCIA = int(os.getenv('ROLLUPS_CONCURRENCIA', 4))
+
+# Secciones del documento, una por endpoint
+SECCIONES = ("resumen", "cobros", "cobros_resumen", "graficos")
+
+def clave_rollup(merchant_id, mes_anio):
+    return {"merchant_id": merchant_id, "mes": mes_anio}
+
+def rollup_vigente(documento, mes_anio):
+    if documento.get("version") != VERSION_ROLLUP:
+        return False
+
+    # Un mes cerrado no cambia; un mes abierto solo vale mientras no venza su TTL
+    if mes_cerrado(mes_anio):
+        return True
+
+    antiguedad = (datetime.utcnow() - documento["actualizado"]).total_seconds()
+    return antiguedad < ROLLUPS_TTL_SEGUNDOS
+
+@medir_funcion
+async def leer_rollup(negocio, mes_anio, seccion):
+    # Devuelve la sección precalculada del mes, o None si no existe o no está vigente
+    if not ROLLUPS_LECTURA:
+        return None
+
+    db = repositorio.actual.mongo()
+    if db is None:
+        return None  # El repositorio activo no usa MongoDB: no hay rollups de los que leer
+
+    metadatos = await catalogo.obtener(negocio)
+    if not metadatos:
+        return None  # El negocio no fue encontrado
+
+    documento = await db[COLECCION_ROLLUPS].find_one(
+        {"_id": clave_rollup(metadatos.merchant_id, mes_anio)},
+        {seccion: 1, "version": 1, "actualizado": 1}
+    )
+
+    if documento is None or seccion not in documento or not rollup_vigente(documento, mes_anio):
+        return None
+
+    return documento[seccion]
+
+async def calcular_rollup(negocio, mes_anio):
+    # Reutilizamos los mismos cálculos de las rutas para que el rollup coincida con ellas
+    from routes.cobros import calcular_cobros_resumen, obtener_datos_cobros_mes_negocio
+    from routes.graficos import calcular_porcentaje_cobro
+    from routes.resumen import calcular_resumen_mes
+
+    resumen, cobros, cobros_resumen, graficos = await asyncio.gather(
+        calcular_resumen_mes(negocio, mes_anio),
+        obtener_datos_cobros_mes_negocio(mes_anio, negocio),
+        calcular_cobros_resumen(negocio, mes_anio),
+        calcular_porcentaje_cobro(negocio, mes_anio),
+    )
+
+    return {
+        "resumen": resumen,
+        "cobros": cobros,
+        "cobros_resumen": cobros_resumen,
+        "graficos": graficos,
+    }
+
+async def guardar_rollup(metadatos, mes_anio, secciones, db=None):
+    db = db if db is not None else obtener_db()
+
+    documento = {
+        "negocio": metadatos.nombre,
+        "version": VERSION_ROLLUP,
+        "actualizado": datetime.utcnow(),
+        **secciones,
+    }
+
+    await db[COLECCION_ROLLUPS].replace_one(
+        {"_id": clave_rollup(metadatos.merchant_id, mes_anio)},
+        documento,
+        upsert=True
+    )
+
+async def actualizar_rollup(negocio, mes_anio, db=None):
+    # Recalcula y guarda el rollup de un (negocio, mes)
+    metadatos = await catalogo.obtener(negocio)
+    if not metadatos:
+        return False  # El negocio no fue encontrado
+
+    secciones = await calcular_rollup(negocio, mes_anio)
+    await guardar_rollup(metadatos, mes_anio, secciones, db)
+    return True
+
+async def primer_mes_con_cobros(merchant_id, db=None):
+    db = db if db is not None else obtener_db()
+
+    # Las recurrencias cuentan en el mes de original_payment_date, que puede ser anterior a date_created
+    resultado = await db.boletas.aggregate([
+        {"$match": {"merchant_id": merchant_id}},
+        {"$group": {"_id": None, "primera_fecha": {"$min": {"$min": ["$date_created", "$original_payment_date"]}}}}
+    ]).to_list(length=1)
+
+    if not resultado or resultado[0]["primera_fecha"] is None:
+        return None
+
+    return resultado[0]["primera_fecha"].strftime("%m-%Y")
+
+async def construir_rollups(negocios=None, desde=None, hasta=None, solo_faltantes=False, db=None):
+    # Materializa los rollups de los negocios indicados (por defecto, todos) y devuelve cuántos se guardaron
+    db = db if db is not None else obtener_db()
+
+    if not negocios:
+        negocios = await db.merchants.distinct("name")
+
+    hasta = hasta or FECHA_CORTE_DATOS.strftime("%m-%Y")
+    semaforo = asyncio.Semaphore(ROLLUPS_CONCURRENCIA)
+
+    async def construir(negocio, mes_anio, merchant_id):
+        async with semaforo:
+            if solo_faltantes:
+                documento = await db[COLECCION_ROLLUPS].find_one(
+                    {"_id": clave_rollup(merchant_id, mes_anio)}, {"version": 1, "actualizado": 1}
+                )
+                if documento is not None and rollup_vigente(documento, mes_anio):
+                    return False
+
+            return await actualizar_rollup(negocio, mes_anio, db)
+
+    tareas = []
+    for negocio in negocios:
+        metadatos = await catalogo.obtener(negocio)
+        if not metadatos:
+            continue  # El negocio no fue encontrado
+
+        desde_negocio = desde or await primer_mes_con_cobros(metadatos.merchant_id, db)
+        if desde_negocio is None:
+            continue  # El negocio no tiene boletas
+
+        for mes_anio in meses_entre(desde_negocio, hasta):
+            tareas.append(construir(negocio, mes_anio, metadatos.merchant_id))
+
+    resultados = await asyncio.gather(*tareas)
+    return sum(resultados)
+
+def main():
+    parser = argparse.ArgumentParser(description="Construye la colección de rollups mensuales por negocio.")
+    parser.add_argument("--negocio", action="append", help="Nombre del negocio (se puede repetir). Por defecto, todos.")
+    parser.add_argument("--desde", help="Primer mes a construir (MM-YYYY). Por defecto, el primer mes con boletas.")
+    parser.add_argument("--hasta", help="Último mes a construir (MM-YYYY). Por defecto, el mes de corte de los datos.")
+    parser.add_argument("--solo-faltantes", action="store_true", help="Solo construye los meses sin rollup vigente.")
+    args = parser.parse_args()
+
+    async def ejecutar():
+        try:
+            return await construir_rollups(args.negocio, args.desde, args.hasta, args.solo_faltantes)
+        finally:
+            cerrar_cliente()
+
+    cantidad = asyncio.run(ejecutar())
+    print(f"Rollups guardados: {cantidad}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: solo lo necesitan el snapshot y el motor columnar
+    pa = None
+    pq = None
+
+from config.db import cerrar_cliente, obtener_db
+from services.lectura_boletas import LECTURA_BATCH_SIZE, leer_lotes, monto_de
+
+# Un archivo por tabla. Los _id y plan_id se guardan como texto: así coinciden los ObjectId
+# con los alias sede_local, que también aparecen como plan_id en boletas e historiales.
+def esquemas():
+    return {
+        "merchants": pa.schema([
+            ("merchant_id", pa.string()),
+            ("name", pa.string()),
+        ]),
+        "planes": pa.schema([
+            ("plan_id", pa.string()),
+            ("merchant_id", pa.string()),
+            ("cobro", pa.string()),
+            ("nivel_de_acceso", pa.string()),
+            ("sede_local", pa.string()),
+        ]),
+        # Una fila por evento del historial; "cliente" numera a los clientes para agrupar por posición
+        "historial": pa.schema([
+            ("cliente", pa.int32()),
+            ("cliente_id", pa.string()),
+            ("event", pa.string()),
+            ("date_created", pa.timestamp("ms")),
+            ("plan", pa.string()),
+        ]),
+        "boletas": pa.schema([
+            ("boleta_id", pa.string()),
+            ("merchant_id", pa.string()),
+            ("plan_id", pa.string()),
+            ("status", pa.string()),
+            ("source", pa.string()),
+            ("date_created", pa.timestamp("ms")),
+            ("original_payment_date", pa.timestamp("ms")),
+            ("final_price", pa.float64()),
+        ]),
+    }
+
+def texto(valor):
+    return None if valor is None else str(valor)
+
+def filas_merchants(lote, estado):
+    return {
+        "merchant_id": [texto(merchant["_id"]) for merchant in lote],
+        "name": [merchant.get("name") for merchant in lote],
+    }
+
+def filas_planes(lote, estado):
+    return {
+        "plan_id": [texto(plan["_id"]) for plan in lote],
+        "merchant_id": [texto(plan.get("merchant_id")) for plan in lote],
+        "cobro": [plan.get("cobro", "") for plan in lote],
+        "nivel_de_acceso": [plan.get("nivel_de_acceso", "") for plan in lote],
+        "sede_local": [texto(plan.get("sede_local", "")) for plan in lote],
+    }
+
+def filas_historial(lote, estado):
+    filas = {"cliente": [], "cliente_id": [], "event": [], "date_created": [], "plan": []}
+    for cliente in lote:
+        numero = estado["clientes"]
+        estado["clientes"] += 1
+        for evento in cliente.get("history") or []:
+            filas["cliente"].append(numero)
+            filas["cliente_id"].append(texto(cliente["_id"]))
+            filas["event"].append(evento.get("event"))
+            filas["date_created"].append(evento.get("date_created"))
+            filas["plan"].append(texto(evento.get("plan")))
+    return filas
+
+def filas_boletas(lote, estado):
+    return {
+        "boleta_id": [texto(boleta["_id"]) for boleta in lote],
+        "merchant_id": [texto(boleta.get("merchant_id")) for boleta in lote],
+        "plan_id": [texto(boleta.get("plan_id")) for boleta in lote],
+        "status": [boleta.get("status") for boleta in lote],
+        "source": [boleta.get("source") for boleta in lote],
+        "date_created": [boleta.get("date_created") for boleta in lote],
+        "original_payment_date": [boleta.get("original_payment_date") for boleta in lote],
+        "final_price": [monto_de(boleta) for boleta in lote],
+    }
+
+# Tabla del snapshot -> (colección, proyección, función que arma las columnas de un lote)
+TABLAS = {
+    "merchants": ("merchants", {"name": 1}, filas_merchants),
+    "planes": ("planes", {"merchant_id": 1, "cobro": 1, "nivel_de_acceso": 1, "sede_local": 1}, filas_planes),
+    "historial": ("clientes", {"history": 1}, filas_historial),
+    "boletas": (
+        "boletas",
+        {
+            "merchant_id": 1, "plan_id": 1, "status": 1, "source": 1,
+            "date_created": 1, "original_payment_date": 1, "charges_detail.final_price": 1,
+        },
+        filas_boletas,
+    ),
+}
+
+def ruta_tabla(directorio, tabla, formato):
+    return os.path.join(directorio, f"{tabla}.{formato}")
+
+async def exportar_tabla(directorio, tabla, formato, db):
+    coleccion, proyeccion, armar_filas = TABLAS[tabla]
+    esquema = esquemas()[tabla]
+    ruta = ruta_tabla(directorio, tabla, formato)
+
+    # Se escribe lote por lote: la memoria no depende del tamaño de la colección
+    if formato == "parquet":
+        escritor = pq.ParquetWriter(ruta, esquema)
+    else:
+        escritor = pa.ipc.new_file(ruta, esquema)  # Arrow IPC sin comprimir: se puede abrir con mmap
+
+    estado = {"clientes": 0}
+    filas = 0
+    try:
+        cursor = db[coleccion].find({}, proyeccion, batch_size=LECTURA_BATCH_SIZE)
+        async for lote in leer_lotes(cursor):
+            columnas = armar_filas(lote, estado)
+            escritor.write_table(pa.table(columnas, schema=esquema))
+            filas += len(next(iter(columnas.values())))
+    finally:
+        escritor.close()
+
+    return filas
+
+async def crear_snapshot(directorio, formato="arrow", db=None):
+    if pa is None:
+        raise RuntimeError("El snapshot necesita pyarrow (pip install pyarrow)")
+
+    db = db if db is not None else obtener_db()
+    os.makedirs(directorio, exist_ok=True)
+    filas = {}
+    for tabla in TABLAS:
+        filas[tabla] = await exportar_tabla(directorio, tabla, formato, db)
+    return filas
+
+def main():
+    parser = argparse.ArgumentParser(description="Guarda las colecciones en archivos Arrow/Parquet para el motor columnar.")
+    parser.add_argument("--directorio", default=os.getenv('SNAPSHOT_RUTA', 'snapshot'), help="Directorio de salida.")
+    parser.add_argument("--formato", choices=["arrow", "parquet"], default="arrow", help="arrow (mmap, por defecto) o parquet.")
+    args = parser.parse_args()
+
+    async def ejecutar():
+        try:
+            return await crear_snapshot(args.directorio, args.formato)
+        finally:
+            cerrar_cliente()
+
+    for tabla, filas in asyncio.run(ejecutar()).items():
+        print(f"{tabla:<10} {filas} filas")
+
+if __name__ == "__main__":
+    main()
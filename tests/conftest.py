@@ -0,0 +1,37 @@
+import asyncio
+import os
+
+import pytest
+
+from tests.utiles import escribir_fixture, generar_documentos
+
+# Se define antes de que las pruebas importen la app: sin cluster, sin caché de respuestas (cada repositorio tiene que calcular su respuesta) y sin logs
+os.environ.update({
+    "MOTOR_DATOS": "memoria",
+    "CACHE_RESPUESTAS": "no",
+    "LOG_PETICIONES": "0",
+    "PRECALENTAR": "0",
+})
+
+@pytest.fixture(scope="session")
+def directorio_fixture(tmp_path_factory):
+    directorio = str(tmp_path_factory.mktemp("fixture"))
+    escribir_fixture(directorio, generar_documentos())
+    return directorio
+
+@pytest.fixture(scope="session")
+def directorio_snapshot(directorio_fixture, tmp_path_factory):
+    pytest.importorskip("pyarrow")
+    pytest.importorskip("mongomock_motor")
+    from services.repositorio import crear_mongomock
+    from services.snapshot import crear_snapshot
+
+    directorio = str(tmp_path_factory.mktemp("snapshot"))
+
+    async def crear():
+        repositorio = await crear_mongomock(directorio_fixture)
+        await crear_snapshot(directorio, "arrow", db=repositorio.mongo())
+
+    asyncio.run(crear())
+    return directorio
+
@@ -0,0 +1,185 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from tests.utiles import NEGOCIO, OTRO_NEGOCIO
+
+pytest.importorskip("mongomock_motor")
+
+from services import actualizador_rollups  # noqa: E402
+from services.actualizador_rollups import (  # noqa: E402
+    RECONSTRUIR_TODO,
+    actualizar_por_marcas,
+    buckets_por_cambio,
+    procesar_cambios,
+)
+from services.cache_respuestas import CacheMemoria, CacheRespuestas, RespuestaCacheada, clave_respuesta  # noqa: E402
+from services.repositorio import activar, crear_mongomock  # noqa: E402
+from services.rollups import COLECCION_ROLLUPS, construir_rollups  # noqa: E402
+
+def ejecutar(prueba, directorio_fixture):
+    # Corre la prueba sobre un mongomock nuevo con los rollups construidos desde cero
+    async def correr():
+        repositorio = activar(await crear_mongomock(directorio_fixture))
+        db = repositorio.mongo()
+        await construir_rollups(db=db)
+        await prueba(db)
+    asyncio.run(correr())
+
+async def leer_rollups(db):
+    return {
+        (documento["_id"]["merchant_id"], documento["_id"]["mes"]): {
+            campo: valor for campo, valor in documento.items() if campo not in ("_id", "actualizado")
+        }
+        async for documento in db[COLECCION_ROLLUPS].find()
+    }
+
+async def reconstruir(db):
+    await db[COLECCION_ROLLUPS].delete_many({})
+    await construir_rollups(db=db)
+    return await leer_rollups(db)
+
+async def assert_igual_a_reconstruir(db):
+    actualizados = await leer_rollups(db)
+    assert actualizados == await reconstruir(db)
+
+async def merchant_id(db, nombre):
+    return (await db.merchants.find_one({"name": nombre}))["_id"]
+
+async def plan_de(db, nombre):
+    return (await db.planes.find_one({"merchant_id": await merchant_id(db, nombre)}))["_id"]
+
+def boleta(merchant, plan, fecha, monto=500, source="checkout"):
+    return {"merchant_id": merchant, "status": "approved", "source": source, "date_created": fecha,
+            "original_payment_date": fecha, "plan_id": plan, "charges_detail": {"final_price": monto}}
+
+def cambio(coleccion, operacion, documento_id, antes=None, despues=None, campos=()):
+    evento = {"ns": {"coll": coleccion}, "operationType": operacion, "documentKey": {"_id": documento_id}}
+    if antes is not None:
+        evento["fullDocumentBeforeChange"] = antes
+    if despues is not None:
+        evento["fullDocument"] = despues
+    if operacion == "update":
+        evento["updateDescription"] = {"updatedFields": {campo: None for campo in campos}, "removedFields": []}
+    return evento
+
+def test_sondeo_igual_a_reconstruir(directorio_fixture):
+    async def prueba(db):
+        assert await actualizar_por_marcas(db) == 0  # La primera pasada solo fija las marcas
+
+        negocio, otro = await merchant_id(db, NEGOCIO), await merchant_id(db, OTRO_NEGOCIO)
+        plan, otro_plan = await plan_de(db, NEGOCIO), await plan_de(db, OTRO_NEGOCIO)
+
+        # Una boleta que llega tarde (su fecha es anterior a la marca) y otra posterior a todas
+        await db.boletas.insert_one(boleta(negocio, plan, datetime(2022, 10, 5)))
+        await db.boletas.insert_one(boleta(otro, otro_plan, datetime(2023, 2, 15), source="recurring_charges"))
+        # Un evento nuevo en un cliente existente y un cliente que llega tarde con eventos viejos
+        cliente = await db.clientes.find_one({"history.plan": plan})
+        await db.clientes.update_one({"_id": cliente["_id"]}, {"$push": {"history": {"event": "baja", "date_created": datetime(2023, 6, 5), "plan": plan}}})
+        await db.clientes.insert_one({"history": [{"event": "alta", "date_created": datetime(2022, 8, 3), "plan": otro_plan}]})
+
+        assert await actualizar_por_marcas(db) > 0
+        await assert_igual_a_reconstruir(db)
+
+        # Sin cambios nuevos, la pasada siguiente no recalcula nada
+        assert await actualizar_por_marcas(db) == 0
+
+    ejecutar(prueba, directorio_fixture)
+
+def test_cambios_con_pre_imagen_igual_a_reconstruir(directorio_fixture):
+    async def prueba(db):
+        negocio, otro = await merchant_id(db, NEGOCIO), await merchant_id(db, OTRO_NEGOCIO)
+        cambios = []
+
+        def del_mes(merchant, mes):
+            rango = {"$gte": datetime(2022, mes, 5), "$lt": datetime(2022, mes, 25)}
+            return {"merchant_id": merchant, "status": "approved", "date_created": rango, "original_payment_date": rango}
+
+        # Cada boleta cubre su mes y el siguiente; los cambios de `negocio` no se pisan, así que cada
+        # mes anterior al cambio solo se recalcula si se usa la pre-imagen. Una boleta de noviembre
+        # que pasa a diciembre y cambia de monto
+        antes = await db.boletas.find_one(del_mes(negocio, 11))
+        nuevos = {"date_created": datetime(2022, 12, 20), "original_payment_date": datetime(2022, 12, 20), "charges_detail": {"final_price": 1}}
+        await db.boletas.update_one({"_id": antes["_id"]}, {"$set": nuevos})
+        cambios.append(cambio("boletas", "update", antes["_id"], antes, {**antes, **nuevos}, list(nuevos)))
+
+        # Un monto corregido sin pre-imagen: no mueve la boleta de mes, alcanza con el documento nuevo
+        otra = await db.boletas.find_one(del_mes(otro, 10))
+        await db.boletas.update_one({"_id": otra["_id"]}, {"$set": {"charges_detail.final_price": 5}})
+        cambios.append(cambio("boletas", "update", otra["_id"], despues=await db.boletas.find_one({"_id": otra["_id"]}), campos=["charges_detail.final_price"]))
+
+        # Una boleta borrada
+        borrada = await db.boletas.find_one(del_mes(negocio, 9))
+        await db.boletas.delete_one({"_id": borrada["_id"]})
+        cambios.append(cambio("boletas", "delete", borrada["_id"], borrada))
+
+        # Un evento viejo que pasa a ser una baja y un cliente borrado, del otro negocio
+        planes_otro = [plan["_id"] async for plan in db.planes.find({"merchant_id": otro})]
+        cliente = await db.clientes.find_one({"history.1": {"$exists": True}, "history.plan": {"$in": planes_otro}})
+        await db.clientes.update_one({"_id": cliente["_id"]}, {"$set": {"history.1.event": "baja"}})
+        cambios.append(cambio("clientes", "update", cliente["_id"], cliente, await db.clientes.find_one({"_id": cliente["_id"]}), ["history.1.event"]))
+        eliminado = await db.clientes.find_one({"_id": {"$ne": cliente["_id"]}, "history.plan": {"$in": planes_otro}})
+        await db.clientes.delete_one({"_id": eliminado["_id"]})
+        cambios.append(cambio("clientes", "delete", eliminado["_id"], eliminado))
+
+        assert await procesar_cambios(cambios, db) > 0
+        await assert_igual_a_reconstruir(db)
+
+    ejecutar(prueba, directorio_fixture)
+
+def test_plan_modificado_recalcula_su_negocio(directorio_fixture):
+    async def prueba(db):
+        plan = await db.planes.find_one({"merchant_id": await merchant_id(db, OTRO_NEGOCIO)})
+        await db.planes.update_one({"_id": plan["_id"]}, {"$set": {"nivel_de_acceso": "Total"}})
+        await procesar_cambios([cambio("planes", "update", plan["_id"], plan, {**plan, "nivel_de_acceso": "Total"}, ["nivel_de_acceso"])], db)
+        await assert_igual_a_reconstruir(db)
+
+    ejecutar(prueba, directorio_fixture)
+
+def test_borrados_sin_pre_imagen_reconstruyen_todo(directorio_fixture):
+    async def prueba(db):
+        negocio = await merchant_id(db, NEGOCIO)
+
+        # Sin las boletas con alguna fecha anterior a octubre el primer mes del negocio pasa a ser octubre: sus
+        # rollups de agosto y septiembre tienen que desaparecer, como en una reconstrucción
+        antes_de_octubre = {"$lt": datetime(2022, 10, 1)}
+        anteriores = {"merchant_id": negocio, "$or": [{"date_created": antes_de_octubre}, {"original_payment_date": antes_de_octubre}]}
+        cambios = [cambio("boletas", "delete", documento["_id"]) async for documento in db.boletas.find(anteriores)]
+        await db.boletas.delete_many(anteriores)
+
+        assert await buckets_por_cambio(cambios[0], "06-2023", db) == {RECONSTRUIR_TODO}
+        await procesar_cambios(cambios, db)
+        assert (negocio, "09-2022") not in await leer_rollups(db)
+        await assert_igual_a_reconstruir(db)
+
+    ejecutar(prueba, directorio_fixture)
+
+def test_negocio_borrado_pierde_sus_rollups(directorio_fixture):
+    async def prueba(db):
+        negocio = await merchant_id(db, OTRO_NEGOCIO)
+        await db.merchants.delete_one({"_id": negocio})
+        await procesar_cambios([cambio("merchants", "delete", negocio)], db)
+        assert not any(merchant == negocio for merchant, _ in await leer_rollups(db))
+        await assert_igual_a_reconstruir(db)
+
+    ejecutar(prueba, directorio_fixture)
+
+def test_descarta_las_respuestas_recalculadas(directorio_fixture, monkeypatch):
+    cache = CacheRespuestas(CacheMemoria())
+    monkeypatch.setattr(actualizador_rollups, "cache_respuestas", cache)
+    respuesta = RespuestaCacheada(contenido=b"{}", etag='"x"')
+
+    async def prueba(db):
+        for mes in ("10-2022", "11-2022", "03-2023"):
+            await cache.backend.guardar(clave_respuesta("resumen_mes", NEGOCIO, mes), respuesta, 60)
+
+        await db.boletas.insert_one(boleta(await merchant_id(db, NEGOCIO), ObjectId(), datetime(2022, 10, 5)))
+        await procesar_cambios([cambio("boletas", "insert", None, despues=await db.boletas.find_one(sort=[("_id", -1)]))], db)
+
+        assert await cache.backend.obtener(clave_respuesta("resumen_mes", NEGOCIO, "10-2022")) is None
+        assert await cache.backend.obtener(clave_respuesta("resumen_mes", NEGOCIO, "11-2022")) is None
+        assert await cache.backend.obtener(clave_respuesta("resumen_mes", NEGOCIO, "03-2023")) is not None
+
+    ejecutar(prueba, directorio_fixture)
@@ -0,0 +1,163 @@
+from types import SimpleNamespace
+import asyncio
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+import httpx
+import pytest
+
+from services.cache_respuestas import (
+    CACHE_MAX_AGE_ABIERTO, CACHE_MAX_AGE_CERRADO, CacheMemoria, CacheRespuestas, CacheSQLite,
+    RespuestaCacheada, calcular_etag, clave_respuesta,
+)
+
+MES_CERRADO = "10-2022"
+MES_ABIERTO = "06-2023"  # Contiene la fecha de corte de los datos
+
+def peticion(if_none_match=None):
+    return SimpleNamespace(headers={"if-none-match": if_none_match} if if_none_match else {})
+
+class Calculo:
+    # calcular() de prueba: cuenta cuántas veces se ejecuta y devuelve siempre la misma respuesta
+
+    def __init__(self, respuesta=None, error=None):
+        self.respuesta = respuesta
+        self.error = error
+        self.veces = 0
+
+    async def __call__(self):
+        self.veces += 1
+        if self.error is not None:
+            raise self.error
+        return self.respuesta
+
+def test_estado_cache_con_sqlite(tmp_path, monkeypatch):
+    from app import app
+    from routes import estado
+
+    cache = CacheRespuestas(CacheSQLite(str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(estado, "cache_respuestas", cache)
+    respuesta = RespuestaCacheada(contenido=b"{}", etag='"x"')
+
+    async def ejecutar():
+        for mes in ("10-2022", "11-2022"):
+            await cache.backend.guardar(clave_respuesta("resumen_mes", "Rokit Body", mes), respuesta, 60)
+        await cache.invalidar_meses([("Rokit Body", "10-2022")])
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://prueba") as cliente:
+            return (await cliente.get("/estado/cache")).json()
+
+    assert asyncio.run(ejecutar())["entradas"] == 1
+
+def test_etag_fuerte_y_304():
+    cache = CacheRespuestas(CacheMemoria())
+    calculo = Calculo(JSONResponse(content={"total": 1}))
+
+    async def ejecutar():
+        primera = await cache.responder(peticion(), "resumen_mes", "Rokit Body", MES_CERRADO, calculo)
+        etag = primera.headers["etag"]
+        revalidada = await cache.responder(peticion(etag), "resumen_mes", "Rokit Body", MES_CERRADO, calculo)
+        lista = await cache.responder(peticion(f'"otro", W/{etag}'), "resumen_mes", "Rokit Body", MES_CERRADO, calculo)
+        distinta = await cache.responder(peticion('"otro"'), "resumen_mes", "Rokit Body", MES_CERRADO, calculo)
+        return primera, revalidada, lista, distinta
+
+    primera, revalidada, lista, distinta = asyncio.run(ejecutar())
+    assert primera.status_code == 200 and primera.body == b'{"total":1}'
+    # Fuerte (sin W/) y calculado sobre los bytes de la respuesta
+    assert primera.headers["etag"] == calcular_etag(primera.body)
+    assert not primera.headers["etag"].startswith("W/")
+    assert revalidada.status_code == 304 and revalidada.body == b""
+    assert revalidada.headers["etag"] == primera.headers["etag"]
+    assert lista.status_code == 304
+    assert distinta.status_code == 200 and distinta.body == primera.body
+    assert calculo.veces == 1
+    assert cache.no_modificadas == 2 and cache.aciertos == 3 and cache.fallos == 1
+
+@pytest.mark.parametrize("mes_anio, cache_control", [
+    (MES_CERRADO, f"public, max-age={CACHE_MAX_AGE_CERRADO}, immutable"),
+    (MES_ABIERTO, f"public, max-age={CACHE_MAX_AGE_ABIERTO}"),
+])
+def test_cache_control_segun_el_mes(monkeypatch, mes_anio, cache_control):
+    monkeypatch.setattr("services.cache_respuestas.CACHE_CERRADO_INMUTABLE", True)
+    cache = CacheRespuestas(CacheMemoria())
+    respuesta = asyncio.run(cache.responder(peticion(), "cobros", "Rokit Body", mes_anio, Calculo(JSONResponse(content=[]))))
+    assert respuesta.headers["cache-control"] == cache_control
+
+def test_cerrado_sin_immutable(monkeypatch):
+    monkeypatch.setattr("services.cache_respuestas.CACHE_CERRADO_INMUTABLE", False)
+    cache = CacheRespuestas(CacheMemoria())
+    respuesta = asyncio.run(cache.responder(peticion(), "cobros", "Rokit Body", MES_CERRADO, Calculo(JSONResponse(content=[]))))
+    assert respuesta.headers["cache-control"] == f"public, max-age={CACHE_MAX_AGE_CERRADO}"
+
+@pytest.mark.parametrize("crear_calculo", [
+    lambda: Calculo(error=HTTPException(status_code=404, detail="No se encontraron datos")),
+    lambda: Calculo(JSONResponse(content={"detail": "error"}, status_code=500)),
+    lambda: Calculo(JSONResponse(content={"detail": "no disponible"}, status_code=503)),
+], ids=["404", "500", "503"])
+def test_errores_no_se_guardan(crear_calculo):
+    cache = CacheRespuestas(CacheMemoria())
+    calculo = crear_calculo()
+
+    async def ejecutar():
+        estados = []
+        for _ in range(2):
+            try:
+                estados.append((await cache.responder(peticion(), "cobros_resumen", "Rokit Body", MES_CERRADO, calculo)).status_code)
+            except HTTPException as error:
+                estados.append(error.status_code)
+        return estados, await cache.backend.tamanio(), len(cache.pendientes)
+
+    estados, entradas, pendientes = asyncio.run(ejecutar())
+    assert estados[0] == estados[1] >= 400
+    assert calculo.veces == 2  # El segundo pedido vuelve a calcular
+    assert entradas == 0 and pendientes == 0
+
+class CalculoBloqueado(Calculo):
+    # Como Calculo, pero espera a `liberar` para responder: mientras tanto llegan las consultas idénticas
+
+    def __init__(self, respuesta):
+        super().__init__(respuesta)
+        self.liberar = asyncio.Event()
+
+    async def __call__(self):
+        self.veces += 1
+        await self.liberar.wait()
+        return self.respuesta
+
+def test_consultas_identicas_calculan_una_vez():
+    cache = CacheRespuestas(CacheMemoria())
+    calculo = CalculoBloqueado(JSONResponse(content={"total": 1}))
+    clave = clave_respuesta("resumen_mes", "Rokit Body", MES_CERRADO)
+
+    async def ejecutar():
+        esperas = asyncio.gather(*(cache.calcular_una_vez(clave, MES_CERRADO, calculo) for _ in range(5)))
+        await asyncio.sleep(0)
+        en_curso = len(cache.pendientes)
+        calculo.liberar.set()
+        return await esperas, en_curso
+
+    respuestas, en_curso = asyncio.run(ejecutar())
+    assert calculo.veces == 1 and en_curso == 1
+    assert all(respuesta is respuestas[0] for respuesta in respuestas)
+    assert cache.fallos == 1 and cache.coalescidas == 4
+    assert cache.pendientes == {}
+
+def test_cancelar_una_espera_no_cancela_el_calculo():
+    cache = CacheRespuestas(CacheMemoria())
+    calculo = CalculoBloqueado(JSONResponse(content={"total": 1}))
+    clave = clave_respuesta("resumen_mes", "Rokit Body", MES_CERRADO)
+
+    async def ejecutar():
+        cancelada, *otras = [asyncio.ensure_future(cache.calcular_una_vez(clave, MES_CERRADO, calculo)) for _ in range(3)]
+        await asyncio.sleep(0)
+        cancelada.cancel()  # Por ejemplo, el cliente cerró la conexión
+        await asyncio.sleep(0)
+        calculo.liberar.set()
+        respuestas = await asyncio.gather(*otras)
+        return cancelada.cancelled(), respuestas, await cache.backend.obtener(clave)
+
+    cancelada, respuestas, guardada = asyncio.run(ejecutar())
+    assert cancelada
+    assert [respuesta.contenido for respuesta in respuestas] == [b'{"total":1}'] * 2
+    assert guardada == respuestas[0]  # El cálculo terminó y quedó en el caché
+    assert calculo.veces == 1 and cache.coalescidas == 2
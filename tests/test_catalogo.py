@@ -0,0 +1,113 @@
+import asyncio
+
+from services.catalogo import CatalogoNegocios
+
+class Consultas:
+    # consultar_metadatos_negocios de prueba: registra cada consulta y puede quedar bloqueada hasta `liberar`
+
+    def __init__(self, datos, bloquear=False):
+        self.datos = dict(datos)
+        self.llamadas = []
+        self.liberar = asyncio.Event()
+        if not bloquear:
+            self.liberar.set()
+
+    async def __call__(self, negocios):
+        self.llamadas.append(sorted(negocios))
+        leidos = {negocio: self.datos[negocio] for negocio in negocios if negocio in self.datos}
+        await self.liberar.wait()
+        return leidos
+
+def test_aciertos_fallos_y_negocios_inexistentes():
+    async def prueba():
+        consultas = Consultas({"A": "meta A"})
+        catalogo = CatalogoNegocios(consultas)
+        assert await catalogo.obtener("A") == "meta A"
+        assert await catalogo.obtener("A") == "meta A"
+        # Un negocio inexistente también se guarda: la segunda búsqueda no consulta
+        assert await catalogo.obtener("X") is None
+        assert await catalogo.obtener("X") is None
+        return consultas.llamadas, catalogo.estadisticas()
+
+    llamadas, estadisticas = asyncio.run(prueba())
+    assert llamadas == [["A"], ["X"]]
+    assert estadisticas == {"negocios": 2, "aciertos": 2, "fallos": 2, "desalojos": 0}
+
+def test_desalojo_lru():
+    async def prueba():
+        catalogo = CatalogoNegocios(Consultas({"A": 1, "B": 2, "C": 3}), max_negocios=2)
+        await catalogo.obtener("A")
+        await catalogo.obtener("B")
+        await catalogo.obtener("A")  # A pasa a ser el más reciente: se desaloja B
+        await catalogo.obtener("C")
+        return list(catalogo.entradas), catalogo.desalojos
+
+    assert asyncio.run(prueba()) == (["A", "C"], 1)
+
+def test_vencimiento_por_ttl():
+    async def prueba():
+        consultas = Consultas({"A": 1})
+        vencido = CatalogoNegocios(consultas, ttl_segundos=0)
+        await vencido.obtener("A")
+        await vencido.obtener("A")
+        return len(consultas.llamadas), vencido.fallos
+
+    assert asyncio.run(prueba()) == (2, 2)
+
+def test_consultas_concurrentes_esperan_la_misma_carga():
+    async def prueba():
+        consultas = Consultas({"A": 1}, bloquear=True)
+        catalogo = CatalogoNegocios(consultas)
+        esperas = asyncio.gather(*(catalogo.obtener("A") for _ in range(3)))
+        await asyncio.sleep(0)
+        consultas.liberar.set()
+        return await esperas, consultas.llamadas, catalogo.aciertos, catalogo.fallos
+
+    assert asyncio.run(prueba()) == ([1, 1, 1], [["A"]], 2, 1)
+
+def test_obtener_varios_consulta_solo_los_faltantes():
+    async def prueba():
+        consultas = Consultas({"A": 1, "B": 2})
+        catalogo = CatalogoNegocios(consultas)
+        await catalogo.obtener("A")
+        metadatos = await catalogo.obtener_varios(["A", "B", "X"])
+        return metadatos, consultas.llamadas
+
+    assert asyncio.run(prueba()) == ({"A": 1, "B": 2, "X": None}, [["A"], ["B", "X"]])
+
+def test_invalidar_descarta_las_cargas_en_curso():
+    async def prueba():
+        consultas = Consultas({"A": "viejo"}, bloquear=True)
+        catalogo = CatalogoNegocios(consultas)
+        vieja = asyncio.ensure_future(catalogo.obtener("A"))
+        while not consultas.llamadas:
+            await asyncio.sleep(0)
+
+        # Los planes cambian mientras la carga está en curso
+        catalogo.invalidar()
+        consultas.datos["A"] = "nuevo"
+        nueva = asyncio.ensure_future(catalogo.obtener("A"))  # No espera la carga vieja: empieza otra
+        await asyncio.sleep(0)
+        consultas.liberar.set()
+
+        resultados = await vieja, await nueva
+        return resultados, len(consultas.llamadas), await catalogo.obtener("A"), len(consultas.llamadas)
+
+    resultados, cargas, guardado, cargas_despues = asyncio.run(prueba())
+    # La carga vieja le responde a quien la esperaba, pero lo que queda en el catálogo es lo nuevo
+    assert resultados == ("viejo", "nuevo")
+    assert cargas == 2 and cargas_despues == 2
+    assert guardado == "nuevo"
+
+def test_invalidar_durante_obtener_varios():
+    async def prueba():
+        consultas = Consultas({"A": "viejo"}, bloquear=True)
+        catalogo = CatalogoNegocios(consultas)
+        carga = asyncio.ensure_future(catalogo.obtener_varios(["A"]))
+        await asyncio.sleep(0)
+        catalogo.invalidar("A")
+        consultas.liberar.set()
+        await carga
+        return dict(catalogo.entradas)
+
+    assert asyncio.run(prueba()) == {}
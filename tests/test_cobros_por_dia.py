@@ -0,0 +1,88 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+
+from routes.cobros import etapas_cobros_aprobados
+from services.repositorio import RepositorioMongo
+from tests.utiles import NEGOCIO, generar_documentos
+
+# mongod real para comparar la agregación con $dateTrunc (mongomock no la implementa); sin él se omite
+MONGO_URI_PRUEBAS = os.getenv('MONGO_URI_PRUEBAS')
+
+INICIO = datetime(2022, 10, 1)
+FIN = datetime(2022, 11, 1)
+
+class Agregacion:
+    # Resultado de aggregate() de prueba: guarda el pipeline y devuelve las filas dadas
+
+    def __init__(self, filas):
+        self.filas = filas
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return self.recorrer()
+
+    async def recorrer(self):
+        for fila in self.filas:
+            yield fila
+
+class BaseFalsa:
+
+    def __init__(self, boletas):
+        self.boletas = boletas
+
+def test_pipeline_de_cobros_por_dia():
+    filas = [
+        {"_id": datetime(2022, 10, 3), "altas": 300, "recurrencias": 0},
+        {"_id": datetime(2022, 10, 17), "altas": 0, "recurrencias": 450.5},
+    ]
+    boletas = Agregacion(filas)
+    repositorio = RepositorioMongo(db=BaseFalsa(boletas), cobros_por_dia="agregacion")
+
+    dias = asyncio.run(repositorio.cobros_por_dia("negocio", INICIO, FIN))
+
+    assert dias == [
+        {"fecha": "2022-10-03", "altas": 300, "recurrencias": 0},
+        {"fecha": "2022-10-17", "altas": 0, "recurrencias": 450.5},
+    ]
+
+    [pipeline] = boletas.pipelines
+    etapas = etapas_cobros_aprobados("negocio", INICIO, FIN)
+    assert pipeline[:len(etapas)] == etapas
+    agrupar, ordenar = pipeline[len(etapas):]
+    assert agrupar["$group"]["_id"] == {"$dateTrunc": {"date": "$fecha", "unit": "day"}}
+    assert agrupar["$group"]["altas"] == {"$sum": {"$cond": [{"$eq": ["$tipo", "altas"]}, "$monto", 0]}}
+    assert agrupar["$group"]["recurrencias"] == {"$sum": {"$cond": [{"$eq": ["$tipo", "recurrencias"]}, "$monto", 0]}}
+    assert ordenar == {"$sort": {"_id": 1}}
+
+@pytest.mark.skipif(not MONGO_URI_PRUEBAS, reason="sin MONGO_URI_PRUEBAS")
+def test_agregacion_igual_que_cursor_en_mongod():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def ejecutar():
+        cliente = AsyncIOMotorClient(MONGO_URI_PRUEBAS, serverSelectionTimeoutMS=2000)
+        db = cliente[f"prueba_{uuid.uuid4().hex[:12]}"]
+        try:
+            for coleccion, documentos in generar_documentos().items():
+                await db[coleccion].insert_many(documentos)
+            merchant_id = (await db.merchants.find_one({"name": NEGOCIO}))["_id"]
+
+            resultados = []
+            for modo in ("agregacion", "cursor"):
+                repositorio = RepositorioMongo(db=db, cobros_por_dia=modo)
+                resultados.append([
+                    await repositorio.cobros_por_dia(merchant_id, inicio, fin)
+                    for inicio, fin in [(datetime(2022, 9, 1), INICIO), (INICIO, FIN), (FIN, datetime(2022, 12, 1))]
+                ])
+            return resultados
+        finally:
+            await cliente.drop_database(db.name)
+            cliente.close()
+
+    agregacion, cursor = asyncio.run(ejecutar())
+    assert all(agregacion)
+    assert agregacion == cursor
@@ -0,0 +1,50 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from tests.utiles import NEGOCIO
+
+pytest.importorskip("mongomock_motor")
+
+def exportar(directorio_fixture, formato):
+    import httpx
+
+    from app import app
+    from routes.cobros import query_cobros_aprobados
+    from services.repositorio import activar, crear_mongomock
+
+    async def ejecutar():
+        repositorio = activar(await crear_mongomock(directorio_fixture))
+        db = repositorio.mongo()
+        merchant_id = (await db.merchants.find_one({"name": NEGOCIO}))["_id"]
+        # Una alta sin plan ni charges_detail
+        await db.boletas.insert_one({"merchant_id": merchant_id, "status": "approved", "source": "checkout", "date_created": datetime(2022, 10, 20)})
+        esperadas = await db.boletas.count_documents(query_cobros_aprobados(merchant_id, datetime(2022, 10, 1), datetime(2022, 11, 1)))
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://prueba") as cliente:
+            respuesta = await cliente.get(f"/exportar/boletas/{NEGOCIO}", params={"desde": "10-2022", "hasta": "10-2022", "formato": formato})
+        return respuesta, esperadas
+
+    return asyncio.run(ejecutar())
+
+def test_boletas_mal_formadas_no_cortan_la_exportacion(directorio_fixture):
+    respuesta, esperadas = exportar(directorio_fixture, "ndjson")
+    assert respuesta.status_code == 200
+    filas = [json.loads(linea) for linea in respuesta.text.splitlines()]
+    assert len(filas) == esperadas
+
+    montos = [fila["monto"] for fila in filas]
+    assert None in montos and "350" in montos
+    sin_plan = [fila for fila in filas if fila["plan_id"] is None]
+    assert len(sin_plan) == 1 and sin_plan[0]["monto"] is None and sin_plan[0]["fecha"] == "2022-10-20"
+
+def test_csv_deja_vacios_los_nulos(directorio_fixture):
+    respuesta, esperadas = exportar(directorio_fixture, "csv")
+    filas = list(csv.DictReader(io.StringIO(respuesta.text)))
+    assert len(filas) == esperadas
+    assert "None" not in respuesta.text
+    assert any(fila["plan_id"] == "" and fila["monto"] == "" for fila in filas)
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import pytest
+from pydantic import TypeAdapter, ValidationError
+
+from services.meses import FECHA_CORTE_DATOS, MesAnio, limites_meses, meses_entre
+
+def test_canonicaliza_con_dos_digitos():
+    mes = MesAnio.de("5-2023")
+    assert mes == "05-2023"
+    assert (mes.month, mes.year) == (5, 2023)
+    assert MesAnio.de("05-2023") == mes
+
+def test_limites_del_mes():
+    mes = MesAnio.de("02-2024")
+    assert mes.inicio == datetime(2024, 2, 1)
+    assert mes.fin == datetime(2024, 3, 1)
+    assert mes.inicio_anterior == datetime(2024, 1, 1)
+
+def test_fin_recortado_a_la_fecha_de_corte():
+    mes = MesAnio.de(FECHA_CORTE_DATOS.strftime("%m-%Y"))
+    assert mes.fin_datos == FECHA_CORTE_DATOS
+    assert not mes.cerrado
+    assert mes.anterior.cerrado
+    assert mes.anterior.fin_datos == mes.inicio
+
+def test_anterior_y_siguiente_cruzan_el_anio():
+    assert MesAnio.de("01-2023").anterior == "12-2022"
+    assert MesAnio.de("12-2022").siguiente == "01-2023"
+    assert MesAnio.de("01-2023").anterior.siguiente == "01-2023"
+
+def test_anios_de_menos_de_cuatro_cifras():
+    mes = MesAnio.de("01-1000")
+    assert mes.anterior == "12-0999"
+    assert mes.anterior.inicio == datetime(999, 12, 1)
+    assert MesAnio.de("12-0999").siguiente == "01-1000"
+    assert meses_entre("11-0999", "02-1000") == ["11-0999", "12-0999", "01-1000", "02-1000"]
+
+@pytest.mark.parametrize("texto, mensaje", [
+    ("13-2023", "entre 01 y 12"),
+    ("00-2023", "entre 01 y 12"),
+    ("abc", "formato"),
+    ("1-20", "formato"),
+    ("2023-05", "formato"),
+    ("01-0001", "fuera de rango"),
+    ("12-9999", "fuera de rango"),
+])
+def test_meses_invalidos(texto, mensaje):
+    with pytest.raises(ValueError, match=mensaje):
+        MesAnio(texto)
+
+def test_limites_del_rango_de_anios():
+    assert MesAnio.de("02-0001").inicio_anterior == datetime(1, 1, 1)
+    assert MesAnio.de("11-9999").fin == datetime(9999, 12, 1)
+
+def test_validacion_como_parametro():
+    validador = TypeAdapter(MesAnio)
+    assert validador.validate_python("5-2023") == "05-2023"
+    assert isinstance(validador.validate_python("5-2023"), MesAnio)
+    for texto in ("13-2023", "abc", "02-0001", "12-9999"):
+        with pytest.raises(ValidationError):
+            validador.validate_python(texto)
+
+def test_memoiza_cada_mes():
+    assert MesAnio.de("03-2023") is MesAnio.de("03-2023")
+    assert MesAnio.de("03-2023").anterior is MesAnio.de("02-2023")
+
+def test_meses_entre_y_limites():
+    meses = meses_entre("11-2022", "02-2023")
+    assert meses == ["11-2022", "12-2022", "01-2023", "02-2023"]
+    assert all(isinstance(mes, MesAnio) for mes in meses)
+    assert meses_entre("03-2023", "02-2023") == []
+    assert limites_meses(meses) == (datetime(2022, 11, 1), datetime(2023, 3, 1))
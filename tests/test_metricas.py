@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+import asyncio
+import itertools
+
+from fastapi import FastAPI
+import httpx
+
+from services.metricas import MiddlewareMetricas, exposicion_prometheus, medir_funcion, monitor_comandos
+from tests.utiles import NEGOCIO, crear_repositorio_prueba
+
+RUTA = "/resumen_mes/{negocio}/{mes_anio}"
+
+def contador_peticiones(exposicion, ruta, estado=200):
+    serie = f'http_requests_total{{metodo="GET",ruta="{ruta}",estado="{estado}"}} '
+    return next((int(linea.removeprefix(serie)) for linea in exposicion.splitlines() if linea.startswith(serie)), 0)
+
+def test_server_timing_y_contadores_por_ruta(directorio_fixture):
+    from app import app
+    from services.repositorio import activar
+
+    async def ejecutar():
+        activar(await crear_repositorio_prueba("memoria", directorio_fixture))
+        transporte = httpx.ASGITransport(app=MiddlewareMetricas(app))
+        async with httpx.AsyncClient(transport=transporte, base_url="http://prueba") as cliente:
+            antes = contador_peticiones((await cliente.get("/metrics")).text, RUTA)
+            respuestas = [await cliente.get(f"/resumen_mes/{NEGOCIO}/10-2022") for _ in range(2)]
+            despues = (await cliente.get("/metrics")).text
+        return antes, respuestas, despues
+
+    antes, respuestas, despues = asyncio.run(ejecutar())
+    for respuesta in respuestas:
+        assert respuesta.status_code == 200
+        assert respuesta.headers["server-timing"].startswith("app;dur=")
+        assert "mongo;dur=" in respuesta.headers["server-timing"]
+    assert contador_peticiones(despues, RUTA) == antes + 2
+    assert f'http_request_duration_seconds_count{{metodo="GET",ruta="{RUTA}"}}' in despues
+
+def test_comandos_concurrentes_se_atribuyen_a_su_peticion():
+    # Dos peticiones simultáneas con comandos intercalados: cada uno tiene que quedar en la
+    # medición de la petición que lo hizo, aunque los eventos lleguen desde otros hilos
+    app = FastAPI()
+    ids = itertools.count()
+    primera_enviada = asyncio.Event()
+    segunda_enviada = asyncio.Event()
+
+    def comando(coleccion, documentos):
+        return SimpleNamespace(
+            command={"find": coleccion}, command_name="find", request_id=next(ids),
+            reply={"cursor": {"firstBatch": [{}] * documentos}}, duration_micros=1000,
+        )
+
+    @medir_funcion
+    async def consultar(coleccion, documentos, enviado, esperar):
+        evento = comando(coleccion, documentos)
+        # Como Motor, el driver corre en otro hilo con una copia del contexto de quien consulta
+        await asyncio.to_thread(monitor_comandos.started, evento)
+        enviado.set()
+        await esperar.wait()
+        await asyncio.to_thread(monitor_comandos.succeeded, evento)
+
+    @app.get("/primera")
+    async def primera():
+        await consultar("boletas", 3, primera_enviada, segunda_enviada)
+        return {}
+
+    @app.get("/segunda")
+    async def segunda():
+        await primera_enviada.wait()
+        await consultar("clientes", 5, segunda_enviada, segunda_enviada)
+        return {}
+
+    async def ejecutar():
+        transporte = httpx.ASGITransport(app=MiddlewareMetricas(app))
+        async with httpx.AsyncClient(transport=transporte, base_url="http://prueba") as cliente:
+            return await asyncio.gather(cliente.get("/primera"), cliente.get("/segunda"))
+
+    respuesta_primera, respuesta_segunda = asyncio.run(ejecutar())
+    timing_primera = respuesta_primera.headers["server-timing"]
+    timing_segunda = respuesta_segunda.headers["server-timing"]
+    assert 'desc="1 comandos, 3 documentos' in timing_primera and "mongo.boletas.consultar" in timing_primera
+    assert "clientes" not in timing_primera
+    assert 'desc="1 comandos, 5 documentos' in timing_segunda and "mongo.clientes.consultar" in timing_segunda
+    assert "boletas" not in timing_segunda
+
+    exposicion = exposicion_prometheus()
+    assert 'mongo_comandos_total{coleccion="boletas",funcion="consultar"}' in exposicion
+    assert 'mongo_comandos_total{coleccion="clientes",funcion="consultar"}' in exposicion
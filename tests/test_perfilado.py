@@ -0,0 +1,41 @@
+from starlette.routing import Route
+
+from services.perfilado import PerfilRuta
+
+RUTA = Route("/resumen_mes/{negocio}/{mes_anio}", lambda request: None)
+
+def scope(path="/resumen_mes/Rokit Body/10-2022"):
+    return {"type": "http", "method": "GET", "path": path}
+
+def test_perfila_las_peticiones_pedidas():
+    perfil = PerfilRuta()
+    perfil.armar(RUTA, 2)
+    assert perfil.comenzar(scope("/cobros/Rokit Body/10-2022")) is None
+
+    primera, segunda = perfil.comenzar(scope()), perfil.comenzar(scope())
+    assert primera is segunda is perfil.armado
+    assert perfil.comenzar(scope()) is None
+    assert perfil.estado() == {"ruta": RUTA.path, "restantes": 0, "en_curso": 2, "terminado": False}
+
+    perfil.terminar(primera)
+    assert perfil.resultado is None
+    perfil.terminar(segunda)
+    assert perfil.resultado[:2] == (RUTA.path, 2)
+    assert perfil.estado() == {"ruta": None, "restantes": 0, "en_curso": 0, "terminado": True}
+
+def test_peticiones_de_un_perfil_cancelado_no_afectan_al_siguiente():
+    perfil = PerfilRuta()
+    perfil.armar(RUTA, 1)
+    cancelada = perfil.comenzar(scope())
+    perfil.cancelar()
+    assert perfil.estado()["ruta"] is None
+
+    perfil.armar(RUTA, 2)
+    nueva = perfil.comenzar(scope())
+    perfil.terminar(cancelada)  # Termina después de cancelar y de volver a armar
+    assert perfil.estado() == {"ruta": RUTA.path, "restantes": 1, "en_curso": 1, "terminado": False}
+
+    perfil.terminar(nueva)
+    perfil.terminar(perfil.comenzar(scope()))
+    assert perfil.resultado[:2] == (RUTA.path, 2)
+    assert cancelada.activas == 0
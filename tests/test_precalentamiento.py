@@ -0,0 +1,97 @@
+import asyncio
+
+import httpx
+
+from services import precalentamiento as modulo_precalentamiento
+from services import repositorio
+from services.catalogo import catalogo
+from services.precalentamiento import Precalentamiento
+
+class RepositorioLento:
+    # Repositorio de prueba para el precalentamiento: sin pool que abrir y con la búsqueda de los
+    # negocios más activos bloqueada hasta `liberar`; después responde `negocios` o falla con `error`
+
+    def __init__(self, negocios=(), error=None, fallas_mongo=0):
+        self.negocios = list(negocios)
+        self.error = error
+        self.fallas_mongo = fallas_mongo
+        self.liberar = asyncio.Event()
+
+    def mongo(self):
+        if self.fallas_mongo:
+            self.fallas_mongo -= 1
+            raise ConnectionError("sin MongoDB")
+        return None
+
+    async def negocios_mas_activos(self, limite, fecha_desde, fecha_hasta):
+        await self.liberar.wait()
+        if self.error is not None:
+            raise self.error
+        return self.negocios
+
+    async def consultar_metadatos_negocios(self, negocios):
+        return {}
+
+def preparar(monkeypatch, repositorio_prueba):
+    from routes import estado
+
+    monkeypatch.setattr(modulo_precalentamiento, "PRECALENTAR", True)
+    monkeypatch.setattr(modulo_precalentamiento, "PRECALENTAR_NEGOCIOS", 5)
+    monkeypatch.setattr(modulo_precalentamiento, "PRECALENTAR_KPIS", False)
+    monkeypatch.setattr(modulo_precalentamiento, "PRECALENTAR_REINTENTO_SEGUNDOS", 0)
+    monkeypatch.setattr(repositorio, "actual", repositorio_prueba)
+    monkeypatch.setattr(catalogo, "consultar", repositorio_prueba.consultar_metadatos_negocios)
+    precalentamiento = Precalentamiento()
+    monkeypatch.setattr(estado, "precalentamiento", precalentamiento)
+    return precalentamiento
+
+async def pedir_listo(cliente):
+    respuesta = await cliente.get("/estado/listo")
+    return respuesta.status_code, respuesta.json()
+
+def calentar(precalentamiento, repositorio_prueba):
+    # Estado de /estado/listo mientras la etapa de negocios está bloqueada y cuando termina
+    from app import app
+
+    async def ejecutar():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://prueba") as cliente:
+            tarea = asyncio.ensure_future(precalentamiento.ejecutar())
+            await asyncio.sleep(0.01)
+            durante = await pedir_listo(cliente)
+            repositorio_prueba.liberar.set()
+            await tarea
+            return durante, await pedir_listo(cliente)
+
+    return asyncio.run(ejecutar())
+
+def test_listo_al_terminar(monkeypatch):
+    repositorio_prueba = RepositorioLento(negocios=["Rokit Body"])
+    precalentamiento = preparar(monkeypatch, repositorio_prueba)
+
+    (estado_durante, durante), (estado_despues, despues) = calentar(precalentamiento, repositorio_prueba)
+
+    assert estado_durante == 503 and durante["listo"] is False and durante["degradado"] is False
+    assert estado_despues == 200 and despues["listo"] is True and despues["degradado"] is False
+    assert despues["error"] is None
+    assert despues["etapas"]["negocios"]["nombres"] == ["Rokit Body"]
+
+def test_degradado_si_falla_una_etapa(monkeypatch):
+    repositorio_prueba = RepositorioLento(error=RuntimeError("consulta cancelada"))
+    precalentamiento = preparar(monkeypatch, repositorio_prueba)
+
+    (estado_durante, durante), (estado_despues, despues) = calentar(precalentamiento, repositorio_prueba)
+
+    assert estado_durante == 503 and durante["listo"] is False
+    # La etapa de negocios es opcional: el worker queda listo, pero degradado y con el error
+    assert estado_despues == 200 and despues["listo"] is True and despues["degradado"] is True
+    assert despues["error"] == "RuntimeError: consulta cancelada"
+    assert "negocios" not in despues["etapas"]
+
+def test_reintenta_hasta_que_abre_mongo(monkeypatch):
+    repositorio_prueba = RepositorioLento(fallas_mongo=2)
+    precalentamiento = preparar(monkeypatch, repositorio_prueba)
+
+    (estado_durante, durante), (estado_despues, despues) = calentar(precalentamiento, repositorio_prueba)
+
+    assert estado_durante == 503 and durante["intentos"] == 3
+    assert estado_despues == 200 and despues["error"] is None and despues["degradado"] is False
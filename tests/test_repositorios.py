@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from tests.utiles import MESES, NEGOCIO, OTRO_NEGOCIO, crear_repositorio_prueba, pedir
+
+pytest.importorskip("mongomock_motor")
+
+RUTAS = [
+    f"/{ruta}/{negocio}/{mes}"
+    for negocio in (NEGOCIO, OTRO_NEGOCIO)
+    for mes in MESES
+    for ruta in ("resumen_mes", "cobros", "cobros_resumen", "porcentaje_cobro")
+] + [
+    f"/resumen_rango/{NEGOCIO}?desde=08-2022&hasta=01-2023",
+    "/resumen_mes/No existe/10-2022",
+    f"/resumen_mes/{NEGOCIO}/13-2022",
+]
+
+def respuestas(motor, directorio_fixture, directorio_snapshot=None, rutas=RUTAS):
+    async def ejecutar():
+        repositorio = await crear_repositorio_prueba(motor, directorio_fixture, directorio_snapshot)
+        return await pedir(repositorio, rutas)
+    return asyncio.run(ejecutar())
+
+@pytest.fixture(scope="module")
+def respuestas_mongomock(directorio_fixture):
+    # Referencia: las agregaciones de RepositorioMongo sobre mongomock
+    return respuestas("mongomock", directorio_fixture)
+
+def test_referencia_con_datos(respuestas_mongomock):
+    estado, cuerpo = respuestas_mongomock[f"/resumen_mes/{NEGOCIO}/10-2022"]
+    assert estado == 200
+    assert cuerpo["Cantidad de socios activos del mes"] > 0
+    estado, cuerpo = respuestas_mongomock[f"/cobros/{NEGOCIO}/10-2022"]
+    assert estado == 200 and cuerpo and all(dia["fecha"].startswith("2022-10") for dia in cuerpo)
+    assert respuestas_mongomock["/resumen_mes/No existe/10-2022"][0] == 404
+    assert respuestas_mongomock[f"/resumen_mes/{NEGOCIO}/13-2022"][0] == 422
+
+def test_memoria_responde_igual_que_mongo(directorio_fixture, respuestas_mongomock):
+    assert respuestas("memoria", directorio_fixture) == respuestas_mongomock
+
+@pytest.mark.parametrize("motor", ["columnar", "memoria-snapshot"])
+def test_snapshot_responde_igual_que_mongo(motor, directorio_fixture, directorio_snapshot, respuestas_mongomock):
+    pytest.importorskip("numpy")
+    assert respuestas(motor, directorio_fixture, directorio_snapshot) == respuestas_mongomock
+
+@pytest.mark.parametrize("ruta", ["resumen_mes", "cobros_resumen", "porcentaje_cobro"])
+@pytest.mark.parametrize("max_negocios", [256, 1])
+def test_cadena_solo_con_mongo(directorio_fixture, monkeypatch, max_negocios, ruta):
+    from services.catalogo import catalogo
+
+    # Con más negocios que entradas en el catálogo, los metadatos se cargan sin pasar por él
+    monkeypatch.setattr(catalogo, "max_negocios", max_negocios)
+    meses = ["09-2022", "10-2022", "11-2022"]
+    rutas_cadena = [f"/cadena/{ruta}/{mes}" for mes in meses]
+    cadena = respuestas("mongomock", directorio_fixture, rutas=rutas_cadena)
+
+    for mes, ruta_cadena in zip(meses, rutas_cadena):
+        estado, cuerpo = cadena[ruta_cadena]
+        assert estado == 200
+        assert set(cuerpo) == {NEGOCIO, OTRO_NEGOCIO}
+
+        # Cada negocio tiene lo mismo que responde la ruta del negocio
+        rutas_negocio = {negocio: f"/{ruta}/{negocio}/{mes}" for negocio in cuerpo}
+        por_negocio = respuestas("mongomock", directorio_fixture, rutas=list(rutas_negocio.values()))
+        assert all(por_negocio[ruta_negocio][0] == 200 for ruta_negocio in rutas_negocio.values())
+        assert cuerpo == {negocio: por_negocio[ruta_negocio][1] for negocio, ruta_negocio in rutas_negocio.items()}
+
+    assert respuestas("memoria", directorio_fixture, rutas=rutas_cadena[:1])[rutas_cadena[0]][0] == 503
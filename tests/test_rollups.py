@@ -0,0 +1,23 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("mongomock_motor")
+
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+from services.rollups import primer_mes_con_cobros  # noqa: E402
+
+def test_primer_mes_incluye_pagos_anteriores_a_la_boleta():
+    async def prueba():
+        db = AsyncMongoMockClient()["challenge_set"]
+        await db.boletas.insert_many([
+            # Recurrencia de agosto cobrada en septiembre
+            {"merchant_id": 1, "date_created": datetime(2022, 9, 2), "original_payment_date": datetime(2022, 8, 30)},
+            {"merchant_id": 1, "date_created": datetime(2022, 10, 1)},
+            {"merchant_id": 2, "date_created": datetime(2022, 7, 1)},
+        ])
+        return await primer_mes_con_cobros(1, db), await primer_mes_con_cobros(3, db)
+
+    assert asyncio.run(prueba()) == ("08-2022", None)
@@ -0,0 +1,121 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+from bson import ObjectId, json_util
+
+NEGOCIO = "Rokit Body"
+OTRO_NEGOCIO = "Gym Sur"
+FIN_DATOS = datetime(2023, 6, 1)  # Como la base real, no hay eventos posteriores a la fecha de corte
+MESES = ["06-2022", "08-2022", "09-2022", "10-2022", "11-2022", "12-2022", "01-2023", "06-2023"]
+
+def generar_documentos(semilla=1):
+    # Datos ficticios con la forma de challenge_set: dos negocios, planes (uno referido por alias de
+    # sede), boletas de septiembre a noviembre de 2022 y clientes con altas, bajas e inactivaciones
+    azar = random.Random(semilla)
+    documentos = {"merchants": [], "planes": [], "boletas": [], "clientes": []}
+
+    for numero, nombre in enumerate([NEGOCIO, OTRO_NEGOCIO]):
+        merchant_id = ObjectId()
+        documentos["merchants"].append({"_id": merchant_id, "name": nombre})
+
+        planes = []
+        for indice, (cobro, nivel) in enumerate([("Mensual", "Local"), ("Anual", "Plus"), ("Mensual", "Total"), ("Anual", "Local")]):
+            plan = {"_id": ObjectId(), "merchant_id": merchant_id, "cobro": cobro, "nivel_de_acceso": nivel,
+                    "sede_local": f"sede{numero}-{indice}" if indice % 2 else ""}
+            documentos["planes"].append(plan)
+            planes.append(plan["_id"])
+        referencias = planes + [f"sede{numero}-1"]
+
+        for _ in range(400):
+            fecha = datetime(2022, 9, 1) + timedelta(hours=azar.randint(0, 24 * 90))
+            documentos["boletas"].append({
+                "_id": ObjectId(),
+                "merchant_id": merchant_id,
+                "status": azar.choice(["approved", "approved", "rejected"]),
+                "source": azar.choice(["checkout", "checkout3", "recurring_charges", "recurring_miclub", "otro"]),
+                "date_created": fecha,
+                "original_payment_date": fecha + timedelta(days=azar.randint(-3, 3)),
+                "plan_id": azar.choice(referencias),
+                "charges_detail": {"final_price": azar.randint(100, 900)},
+            })
+
+        # Boletas mal formadas: sin monto, con monto null o no numérico, sin charges_detail
+        for dia, detalle in enumerate([{}, {"final_price": None}, {"final_price": "350"}, None]):
+            documentos["boletas"].append({
+                "_id": ObjectId(),
+                "merchant_id": merchant_id,
+                "status": "approved",
+                "source": "checkout" if dia % 2 else "recurring_charges",
+                "date_created": datetime(2022, 10, 10 + dia),
+                "original_payment_date": datetime(2022, 10, 10 + dia),
+                "plan_id": planes[0],
+                "charges_detail": detalle,
+            })
+
+        for _ in range(150):
+            alta = datetime(2022, 6, 1) + timedelta(days=azar.randint(0, 200))
+            plan = azar.choice(planes)
+            historial = [{"event": "alta", "date_created": alta, "plan": plan}]
+            sorteo = azar.random()
+            fin = min(alta + timedelta(days=azar.randint(1, 200)), FIN_DATOS)
+            if sorteo < 0.3:
+                historial.append({"event": "baja", "date_created": fin, "plan": plan})
+            elif sorteo < 0.6:
+                historial.append({"event": "inactivacion", "date_created": fin, "plan": plan})
+            documentos["clientes"].append({"_id": ObjectId(), "history": historial})
+
+    # Clientes que pasan de un negocio al otro, y uno con dos planes del mismo negocio
+    planes_por_negocio = [
+        [plan["_id"] for plan in documentos["planes"] if plan["merchant_id"] == merchant["_id"]]
+        for merchant in documentos["merchants"]
+    ]
+    for dia in range(5):
+        origen, destino = planes_por_negocio[dia % 2][0], planes_por_negocio[1 - dia % 2][1]
+        documentos["clientes"].append({"_id": ObjectId(), "history": [
+            {"event": "alta", "date_created": datetime(2022, 9, 1 + dia), "plan": origen},
+            {"event": "baja", "date_created": datetime(2022, 10, 1 + dia), "plan": origen},
+            {"event": "alta", "date_created": datetime(2022, 10, 2 + dia), "plan": destino},
+        ]})
+    documentos["clientes"].append({"_id": ObjectId(), "history": [
+        {"event": "alta", "date_created": datetime(2022, 8, 1), "plan": planes_por_negocio[0][0]},
+        {"event": "alta", "date_created": datetime(2022, 10, 1), "plan": planes_por_negocio[0][2]},
+    ]})
+
+    return documentos
+
+def escribir_fixture(directorio, documentos):
+    # Un documento en JSON extendido por línea, como mongoexport (services.memoria.leer_fixture)
+    os.makedirs(directorio, exist_ok=True)
+    for coleccion, lista in documentos.items():
+        with open(os.path.join(directorio, f"{coleccion}.json"), "w", encoding="utf-8") as archivo:
+            archivo.writelines(json_util.dumps(documento) + "\n" for documento in lista)
+
+async def crear_repositorio_prueba(motor, directorio_fixture, directorio_snapshot=None):
+    from services.repositorio import crear_mongomock
+
+    if motor == "mongomock":
+        return await crear_mongomock(directorio_fixture)
+    if motor == "memoria":
+        from services.memoria import RepositorioMemoria
+        return RepositorioMemoria.desde_fixture(directorio_fixture)
+    if motor == "memoria-snapshot":
+        from services.memoria import RepositorioMemoria
+        return RepositorioMemoria.desde_snapshot(directorio_snapshot)
+    from services.columnar import MotorColumnar
+    return MotorColumnar(directorio_snapshot)
+
+async def pedir(repositorio, rutas):
+    # Activa el repositorio y devuelve {ruta: (estado, cuerpo)} de cada ruta
+    import httpx
+
+    from app import app
+    from services import repositorio as modulo_repositorio
+
+    modulo_repositorio.activar(repositorio)
+    respuestas = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://prueba") as cliente:
+        for ruta in rutas:
+            respuesta = await cliente.get(ruta)
+            respuestas[ruta] = (respuesta.status_code, respuesta.json())
+    return respuestas